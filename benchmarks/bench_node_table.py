@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Compare the memory usage and load time of NodeTable and ColumnarNodeTable
+
+Usage: python benchmarks/bench_node_table.py GFAFILE [EXCLUDE_SAMPLE]
+
+For each representation, this reports the load time, the approximate size of
+the table (from get_memory_usage()), and the peak memory allocated while
+loading (from tracemalloc).
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from panct.graph_utils import NodeTable, ColumnarNodeTable
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 2:
+        print(__doc__, file=sys.stderr)
+        return 1
+    gfa_file = Path(argv[1])
+    exclude = [argv[2]] if len(argv) > 2 else []
+    print("table\tseconds\ttable_MB\tpeak_MB")
+    for table_class in (NodeTable, ColumnarNodeTable):
+        tracemalloc.start()
+        start = time.perf_counter()
+        table = table_class(gfa_file, exclude)
+        # make sure any lazily-built arrays are included
+        table.get_total_node_length()
+        if isinstance(table, ColumnarNodeTable):
+            table.get_haplotype_csr()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            f"{table_class.__name__}\t{seconds:.3f}\t"
+            f"{table.get_memory_usage() / 1e6:.1f}\t{peak / 1e6:.1f}"
+        )
+        del table
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Measure how each stage of panct scales with the size of the graph
+
+Usage: python benchmarks/bench_scaling.py [options]
+
+For every combination of walk length, haplotype count, and bubble density, this
+generates a synthetic graph with benchmarks/synthetic.py and times each stage:
+loading the GFA into a NodeTable, computing the complexity metrics, extracting
+the .walk file, and reading it back with Walks and ColumnarWalks. Each stage is
+run REPEATS times and the best wall time is reported. The peak memory allocated
+by each stage is measured with tracemalloc in one extra run, so that tracing
+doesn't slow down the timed runs.
+
+The results are printed as a table and, with --output, written to a JSON file
+along with the versions of panct, Python, and numpy. Pass the JSON file from a
+previous run to --compare to print the ratio of the new times to the old ones.
+Run it with 'nox -s benchmarks'.
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+from datetime import datetime, timezone
+from importlib.metadata import version, PackageNotFoundError
+
+import numpy as np
+
+from synthetic import REFERENCE, generate_gfa
+from panct.walks import extract_walks
+from panct.graph_utils import NodeTable
+from panct.data import Walks, ColumnarWalks
+from panct.complexity import AVAILABLE_METRICS, compute_complexities
+
+# the parameters that identify a result, in the order in which they are printed
+PARAMS = ["stage", "length", "haplotypes", "density", "seed"]
+
+
+def measure(func: Callable, repeats: int) -> tuple[float, float]:
+    """
+    Time a function and measure the peak memory it allocates
+
+    Parameters
+    ----------
+    func : Callable
+        The function to run, without arguments
+    repeats : int
+        How many times to time the function
+
+    Returns
+    -------
+    tuple[float, float]
+        The best wall time in seconds, and the peak memory in MB
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def bench_graph(
+    tmpdir: Path,
+    length: int,
+    haplotypes: int,
+    density: float,
+    seed: int,
+    repeats: int,
+) -> list[dict]:
+    """
+    Benchmark every stage on a single synthetic graph
+
+    Returns
+    -------
+    list[dict]
+        A result for each stage
+    """
+    gfa_file = tmpdir / f"synthetic_{length}_{haplotypes}_{density}_{seed}.gfa"
+    walk_file = gfa_file.with_suffix(".walk.gz")
+    generate_gfa(gfa_file, length, haplotypes, density, seed)
+    table = NodeTable(gfa_file, [REFERENCE])
+    stages = {
+        "load_gfa": lambda: NodeTable(gfa_file, [REFERENCE]),
+        "compute_complexity": lambda: compute_complexities(table, AVAILABLE_METRICS),
+        "extract_walks": lambda: extract_walks(gfa_file, walk_file),
+        "read_walks": lambda: Walks.read(walk_file),
+        "read_columnar_walks": lambda: ColumnarWalks.read(walk_file),
+    }
+    results = []
+    for stage, func in stages.items():
+        seconds, peak = measure(func, repeats)
+        results.append(
+            {
+                "stage": stage,
+                "length": length,
+                "haplotypes": haplotypes,
+                "density": density,
+                "seed": seed,
+                "nodes": len(table.nodes),
+                "gfa_MB": gfa_file.stat().st_size / 1e6,
+                "seconds": seconds,
+                "peak_MB": peak,
+            }
+        )
+    return results
+
+
+def get_metadata() -> dict:
+    """
+    Describe the environment in which the benchmarks were run
+    """
+    try:
+        panct_version = version("panCT")
+    except PackageNotFoundError:
+        panct_version = None
+    return {
+        "panct": panct_version,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def format_value(value) -> str:
+    """
+    Format a value in a result for printing
+    """
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def compare(results: list[dict], baseline_file: Path):
+    """
+    Print the ratio of the times in results to those in a previous run
+    """
+    with open(baseline_file) as f:
+        baseline = {
+            tuple(result[param] for param in PARAMS): result
+            for result in json.load(f)["results"]
+        }
+    print("\t".join(PARAMS + ["old_seconds", "new_seconds", "ratio"]))
+    for result in results:
+        old = baseline.get(tuple(result[param] for param in PARAMS))
+        if old is None:
+            continue
+        items = [result[param] for param in PARAMS]
+        items += [old["seconds"], result["seconds"]]
+        items.append(result["seconds"] / old["seconds"])
+        print("\t".join(format_value(item) for item in items))
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--lengths", default="1000,10000,50000", help="Comma-separated walk lengths"
+    )
+    parser.add_argument(
+        "--haplotypes", default="10,50", help="Comma-separated haplotype counts"
+    )
+    parser.add_argument(
+        "--densities", default="0.3", help="Comma-separated bubble densities"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per stage")
+    parser.add_argument("-o", "--output", type=Path, help="Write results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON results of an older run")
+    return parser
+
+
+def main(argv: list[str]) -> int:
+    args = get_parser().parse_args(argv[1:])
+    sweep = itertools.product(
+        [int(length) for length in args.lengths.split(",")],
+        [int(haplotypes) for haplotypes in args.haplotypes.split(",")],
+        [float(density) for density in args.densities.split(",")],
+    )
+    columns = PARAMS + ["nodes", "gfa_MB", "seconds", "peak_MB"]
+    print("\t".join(columns))
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for length, haplotypes, density in sweep:
+            for result in bench_graph(
+                Path(tmpdir), length, haplotypes, density, args.seed, args.repeats
+            ):
+                results.append(result)
+                print("\t".join(format_value(result[col]) for col in columns))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+    if args.compare is not None:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
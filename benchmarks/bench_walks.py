@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Compare the memory usage and speed of Walks and ColumnarWalks
+
+Usage: python benchmarks/bench_walks.py WALKFILE [REGION]
+
+For each representation, this reads the .walk file (or just the nodes in REGION,
+ex: 1000-20000) and reports the time to read it, the memory retained by the
+object and the peak memory allocated while reading (both from tracemalloc), and
+the time to find the nodes visited by each haplotype.
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from panct.data import Walks, ColumnarWalks
+
+
+def get_haplotypes(walks: Walks | ColumnarWalks) -> int:
+    """
+    Find the nodes visited by each haplotype
+
+    Returns
+    -------
+    int
+        The total number of nodes visited by all of the haplotypes
+    """
+    if isinstance(walks, ColumnarWalks):
+        return sum(len(walks.get_haplotype(h)[0]) for h in range(len(walks.labels)))
+    hap_nodes = {}
+    for node, samples in walks.data.items():
+        for label in samples:
+            hap_nodes.setdefault(label, []).append(node)
+    return sum(len(nodes) for nodes in hap_nodes.values())
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 2:
+        print(__doc__, file=sys.stderr)
+        return 1
+    walk_file = Path(argv[1])
+    region = argv[2] if len(argv) > 2 else None
+    print("walks\tseconds\twalks_MB\tpeak_MB\thaplotype_seconds")
+    for walks_class in (Walks, ColumnarWalks):
+        tracemalloc.start()
+        start = time.perf_counter()
+        walks = walks_class.read(walk_file, region=region)
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        get_haplotypes(walks)
+        hap_seconds = time.perf_counter() - start
+        print(
+            f"{walks_class.__name__}\t{seconds:.3f}\t{current / 1e6:.1f}\t"
+            f"{peak / 1e6:.1f}\t{hap_seconds:.3f}"
+        )
+        del walks
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Generate a synthetic pangenome graph for benchmarking
+
+Usage: python benchmarks/synthetic.py GFAFILE [LENGTH] [HAPLOTYPES] [DENSITY] [SEED]
+
+The graph is a chain of LENGTH (default: 10000) sites on a single contig, chr1.
+A fraction DENSITY (default: 0.3) of the sites are bubbles with two alleles, and
+the rest are single nodes. Every haplotype visits one node at each site, so each
+walk has LENGTH steps. The alternate allele of each bubble has a random frequency
+among the HAPLOTYPES (default: 10) haploid samples. A reference sample, GRCh38,
+always takes the first allele. Node IDs are assigned in topological order, like
+in graphs from minigraph-cactus.
+
+The graph only depends on the parameters and SEED (default: 0). If GFAFILE ends
+with .gfa, a .walk.gz file and its indices are also created next to it with
+panct.walks.extract_walks().
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+REFERENCE = "GRCh38"
+CONTIG = "chr1"
+# the maximum length of a node
+MAX_NODE_LENGTH = 32
+
+
+def generate_gfa(
+    gfa_file: Path,
+    length: int = 10000,
+    haplotypes: int = 10,
+    density: float = 0.3,
+    seed: int = 0,
+):
+    """
+    Write a synthetic GFA file
+
+    Parameters
+    ----------
+    gfa_file : Path
+        The path to the GFA file
+    length : int, optional
+        The number of sites, and therefore the number of steps in each walk
+    haplotypes : int, optional
+        The number of haplotypes, excluding the reference
+    density : float, optional
+        The fraction of sites that are bubbles
+    seed : int, optional
+        The seed for the random number generator
+    """
+    rng = np.random.default_rng(seed)
+    is_bubble = rng.random(length) < density
+    # the ID of the first node at each site; bubbles have a second node after it
+    first = np.cumsum(np.r_[1, 1 + is_bubble[:-1]])
+    num_nodes = int(first[-1] + is_bubble[-1]) if length else 0
+    node_lengths = rng.integers(1, MAX_NODE_LENGTH + 1, size=num_nodes)
+    freqs = rng.random(length)
+    with open(gfa_file, "w") as gfa:
+        gfa.write("H\tVN:Z:1.1\n")
+        bases = "ACGT" * MAX_NODE_LENGTH
+        for node, node_length in enumerate(node_lengths.tolist(), 1):
+            offset = node % 4
+            gfa.write(f"S\t{node}\t{bases[offset:offset + node_length]}\n")
+        # the reference takes the first allele and each haplotype picks the
+        # alternate allele of a bubble with its frequency
+        alleles = [np.zeros(length, dtype=bool)]
+        alleles += [is_bubble & (rng.random(length) < freqs) for _ in range(haplotypes)]
+        samples = [REFERENCE] + [f"samp{i}" for i in range(haplotypes)]
+        for sample, alt in zip(samples, alleles):
+            nodes = first + alt
+            end = int(node_lengths[nodes - 1].sum())
+            walk = ">" + ">".join(nodes.astype(str).tolist())
+            gfa.write(f"W\t{sample}\t{1 if sample != REFERENCE else 0}\t")
+            gfa.write(f"{CONTIG}\t0\t{end}\t{walk}\n")
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 2:
+        print(__doc__, file=sys.stderr)
+        return 1
+    gfa_file = Path(argv[1])
+    params = [int(arg) for arg in argv[2:4]]
+    if len(argv) > 4:
+        params.append(float(argv[4]))
+    if len(argv) > 5:
+        params.append(int(argv[5]))
+    generate_gfa(gfa_file, *params)
+    if gfa_file.suffix == ".gfa":
+        from panct.walks import extract_walks
+
+        extract_walks(gfa_file, reference=REFERENCE)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
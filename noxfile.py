@@ -81,6 +81,14 @@ else:
                 session.notify("coverage", posargs=[])
 
 
+@session(python=locked_python_version)
+def benchmarks(session: Session) -> None:
+    """Measure how each stage scales with the size of a synthetic graph."""
+    session.install(".")
+    args = session.posargs or ["-o", "benchmarks/results.json"]
+    session.run("python", "benchmarks/bench_scaling.py", *args)
+
+
 @session(python=locked_python_version)
 def coverage(session: Session) -> None:
     """Produce the coverage report."""
@@ -7,6 +7,8 @@ from typing_extensions import Annotated
 import typer
 
 from . import __version__
+from .gbz_utils import GBZ_BACKENDS
+from .progress import DEFAULT_INTERVAL
 from .complexity import AVAILABLE_METRICS
 
 app = typer.Typer()
@@ -65,7 +67,7 @@ def complexity(
             exists=True,
             readable=True,
             show_default=False,
-            help="Path to the .gfa or .gbz file of a pangenome graph",
+            help="Path to the .gfa, .gfa.gz, or .gbz file of a pangenome graph",
         ),
     ],
     region: Annotated[
@@ -91,8 +93,130 @@ def complexity(
         ),
     ] = "GRCh38",
     output_file: Annotated[
-        Path, typer.Option("-o", "--out", help="Name of output file")
+        Path,
+        typer.Option(
+            "-o",
+            "--out",
+            help="Name of output file. Use a .gz suffix for BGZF-compressed, "
+            "tabix-indexed output or .npz for numpy arrays",
+        ),
     ] = Path("/dev/stdout"),
+    columnar: Annotated[
+        bool,
+        typer.Option(
+            "--columnar",
+            help="Store nodes in arrays instead of Python objects to reduce memory",
+        ),
+    ] = False,
+    threads: Annotated[
+        int,
+        typer.Option(
+            "-t",
+            "--threads",
+            min=1,
+            help="Number of threads to use. Regions of a GBZ file are processed "
+            "in parallel, while a BGZF-compressed GFA is decompressed and a .gz "
+            "output is compressed in parallel",
+        ),
+    ] = 1,
+    gbz_backend: Annotated[
+        str,
+        typer.Option(
+            "--gbz-backend",
+            help="How to extract regions from a GBZ file: run gbz-base's query "
+            "command (the default) or, with sqlite, read its GBZ-base database "
+            "directly in-process. Options: " + ",".join(GBZ_BACKENDS),
+        ),
+    ] = "query",
+    by_contig: Annotated[
+        bool,
+        typer.Option(
+            "--by-contig",
+            help="Index each contig of a GBZ file once and slice it into the "
+            "regions, instead of extracting every region separately. Requires "
+            "--gbz-backend sqlite",
+        ),
+    ] = False,
+    cache_file: Annotated[
+        Path,
+        typer.Option(
+            "--cache",
+            show_default=False,
+            help="A database in which to cache the results of each region, so "
+            "that they are not computed again on later runs",
+        ),
+    ] = None,
+    cache_size: Annotated[
+        int,
+        typer.Option(
+            "--cache-size",
+            min=1,
+            help="The maximum size of the cached results, in MB",
+        ),
+    ] = 1024,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume",
+            help="Append to a partially written output file, skipping the regions "
+            "that are already in it",
+        ),
+    ] = False,
+    window: Annotated[
+        int,
+        typer.Option(
+            "--window",
+            min=1,
+            show_default=False,
+            help="Compute complexity in windows of this size that slide along "
+            "the reference in each region",
+        ),
+    ] = None,
+    step: Annotated[
+        int,
+        typer.Option(
+            "--step",
+            min=1,
+            show_default=False,
+            help="The distance between the starts of consecutive windows. "
+            "Defaults to the window size",
+        ),
+    ] = None,
+    partial_sums: Annotated[
+        bool,
+        typer.Option(
+            "--partial-sums",
+            help="Output the additive sums from which the metrics are computed, "
+            "for use with 'panct complexity-aggregate'",
+        ),
+    ] = False,
+    profile_file: Annotated[
+        Path,
+        typer.Option(
+            "--profile",
+            show_default=False,
+            help="Write the time and memory used by each stage of processing each "
+            "region to this file: a TSV summary or, if it ends with .json, the "
+            "summary and every measurement",
+        ),
+    ] = None,
+    cprofile_file: Annotated[
+        Path,
+        typer.Option(
+            "--cprofile",
+            show_default=False,
+            help="Write statistics from cProfile to this file, for use with pstats. "
+            "Only the main process is profiled",
+        ),
+    ] = None,
+    progress_interval: Annotated[
+        float,
+        typer.Option(
+            "--progress-interval",
+            min=0,
+            help="How often to report progress, in seconds. Use 0 to disable",
+        ),
+    ] = DEFAULT_INTERVAL,
     verbosity: verbose = Verbosity.info,
 ):
     """
@@ -107,9 +231,80 @@ def complexity(
         region_str = None
     elif Path(region).exists():
         region_str = Path(region)
-    retcode = complexity_main(graph, output_file, region_str, metrics, reference, log)
+    retcode = complexity_main(
+        graph,
+        output_file=output_file,
+        region_str=region_str,
+        metrics=metrics,
+        reference=reference,
+        log=log,
+        columnar=columnar,
+        threads=threads,
+        gbz_backend=gbz_backend,
+        by_contig=by_contig,
+        cache_file=cache_file,
+        cache_size=cache_size << 20,
+        resume=resume,
+        window=window,
+        step=step,
+        partial_sums=partial_sums,
+        profile_file=profile_file,
+        cprofile_file=cprofile_file,
+        progress_interval=progress_interval or None,
+    )
     if retcode != 0:
-        typer.Exit(code=retcode)
+        raise typer.Exit(code=retcode)
+
+
+@app.command()
+def complexity_aggregate(
+    partial_sums: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            readable=True,
+            show_default=False,
+            help="The output of 'panct complexity --partial-sums'",
+        ),
+    ],
+    sizes: Annotated[
+        str,
+        typer.Option(
+            "-s",
+            "--sizes",
+            help="Comma-separated list of the sizes of the windows to create",
+        ),
+    ] = "100000",
+    metrics: Annotated[
+        str,
+        typer.Option(
+            "--metrics",
+            help="Comma-separated list of which "
+            "complexity metrics to compute. "
+            "Options: " + ",".join(AVAILABLE_METRICS),
+        ),
+    ] = "sequniq-normwalk",
+    output_file: Annotated[
+        str,
+        typer.Option(
+            "-o",
+            "--out",
+            help="Name of output file. With several sizes, it must contain "
+            "'{size}', which is replaced by each size",
+        ),
+    ] = "/dev/stdout",
+    verbosity: verbose = Verbosity.info,
+):
+    """
+    Combine partial sums of windows into complexity scores for larger windows
+    """
+    from .aggregate import main as aggregate_main
+    from .logging import getLogger
+
+    log = getLogger(name="complexity-aggregate", level=verbosity.value)
+    retcode = aggregate_main(partial_sums, output_file, sizes, metrics, log)
+    if retcode != 0:
+        raise typer.Exit(code=retcode)
 
 
 # Adding dummy command for now
@@ -128,6 +323,53 @@ def walks(
     output_file: Annotated[
         Path, typer.Option("-o", "--out", help="Name of output file")
     ] = None,
+    threads: Annotated[
+        int,
+        typer.Option(
+            "-t",
+            "--threads",
+            min=1,
+            help="Number of threads to use for decompressing the GFA and "
+            "compressing the output",
+        ),
+    ] = 1,
+    memory: Annotated[
+        int,
+        typer.Option(
+            "-m",
+            "--memory",
+            min=1,
+            help="Approximate memory (in MB) to use for sorting before spilling "
+            "to temporary files",
+        ),
+    ] = 1024,
+    walk_version: Annotated[
+        int,
+        typer.Option(
+            "--walk-version",
+            min=1,
+            max=2,
+            help="Version of the .walk format to write. Version 2 stores integer "
+            "IDs for each haplotype and is much smaller",
+        ),
+    ] = 2,
+    reference: Annotated[
+        str,
+        typer.Option(
+            "-r",
+            "--reference",
+            help="The ID of the reference sample, from whose walks to create a "
+            "reference index. Use an empty string to skip the index",
+        ),
+    ] = "GRCh38",
+    progress_interval: Annotated[
+        float,
+        typer.Option(
+            "--progress-interval",
+            min=0,
+            help="How often to report progress, in seconds. Use 0 to disable",
+        ),
+    ] = DEFAULT_INTERVAL,
     verbosity: verbose = Verbosity.info,
 ):
     """
@@ -137,7 +379,53 @@ def walks(
     from .logging import getLogger
 
     log = getLogger(name="walks", level=verbosity.value)
-    extract_walks(graph, output_file, log)
+    extract_walks(
+        graph,
+        output_file,
+        log,
+        threads,
+        memory,
+        walk_version,
+        reference,
+        progress_interval or None,
+    )
+
+
+@app.command()
+def index(
+    graph: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            readable=True,
+            show_default=False,
+            help="Path to the .gfa or .gfa.gz file of a pangenome graph",
+        ),
+    ],
+    output_file: Annotated[
+        Path, typer.Option("-o", "--out", help="Name of output file")
+    ] = None,
+    threads: Annotated[
+        int,
+        typer.Option(
+            "-t",
+            "--threads",
+            min=1,
+            help="Number of threads to use for decompressing a BGZF-compressed GFA",
+        ),
+    ] = 1,
+    verbosity: verbose = Verbosity.info,
+):
+    """
+    Create a binary index of a graph for faster loading
+    """
+    from .index import index_graph
+    from .logging import getLogger
+
+    log = getLogger(name="index", level=verbosity.value)
+    retcode = index_graph(graph, output_file, threads, log)
+    if retcode != 0:
+        raise typer.Exit(code=retcode)
 
 
 typer_click_object = typer.main.get_command(app)
@@ -0,0 +1,223 @@
+"""
+Combine the partial sums of small windows into complexity scores for larger
+windows, without loading the graph again
+"""
+
+from __future__ import annotations
+import logging
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .data import Data, Region
+from .logging import getLogger
+from .window import WindowSums
+from .complexity import AVAILABLE_METRICS
+from .output import REGION_COLUMNS, open_writer
+
+
+def read_partial_sums(partial_file: Path) -> Iterator[tuple[Region, WindowSums]]:
+    """
+    Read the output of 'panct complexity --partial-sums'
+
+    Parameters
+    ----------
+    partial_file : Path
+        Path to the output. It may be BGZF-compressed
+
+    Yields
+    ------
+    tuple[Region, WindowSums]
+        Each window and its sums
+
+    Raises
+    ------
+    ValueError
+        If the file does not have the expected columns
+    """
+    with Data.hook_compressed(partial_file, "r") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        if header != REGION_COLUMNS + list(WindowSums._fields):
+            raise ValueError(f"{partial_file} does not contain partial sums")
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            region = Region(fields[0], int(fields[1]), int(fields[2]))
+            yield region, WindowSums(*(int(field) for field in fields[3:]))
+
+
+class WindowAggregator:
+    """
+    Combine consecutive windows into larger windows of a fixed size
+
+    Each window is added to the larger window that contains its start. The
+    larger windows start at multiples of the size and end at the end of the last
+    window added to them.
+
+    Attributes
+    ----------
+    size : int
+        The size of the larger windows
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._current = None
+        self._sums = None
+        self._end = 0
+        self._done = set()
+
+    def add(
+        self, region: Region, sums: WindowSums
+    ) -> Optional[tuple[Region, WindowSums]]:
+        """
+        Add a window
+
+        Parameters
+        ----------
+        region : Region
+            The window. Windows must be added in order of their starts within
+            each contig, and all windows on a contig must be added together
+        sums : WindowSums
+            The sums of the window
+
+        Returns
+        -------
+        Optional[tuple[Region, WindowSums]]
+            The previous larger window and its sums, if this window starts a new
+            one
+
+        Raises
+        ------
+        ValueError
+            If the windows are not sorted
+        """
+        key = (region.chrom, region.start // self.size)
+        if key == self._current:
+            self._sums = self._sums.combine(sums)
+            self._end = region.end
+            return None
+        if self._current is not None and key[0] == self._current[0]:
+            if key < self._current:
+                raise ValueError(f"Windows on {region.chrom} are not sorted")
+        elif key[0] in self._done:
+            raise ValueError(f"Windows on {region.chrom} are not together")
+        finished = self.flush()
+        self._current, self._sums, self._end = key, sums, region.end
+        return finished
+
+    def flush(self) -> Optional[tuple[Region, WindowSums]]:
+        """
+        Finish the current larger window
+
+        Returns
+        -------
+        Optional[tuple[Region, WindowSums]]
+            The current larger window and its sums, if any windows were added
+        """
+        if self._current is None:
+            return None
+        chrom, index = self._current
+        self._done.add(chrom)
+        self._current = None
+        return Region(chrom, index * self.size, self._end), self._sums
+
+
+def main(
+    partial_file: Path,
+    output_file: Path | str = Path("/dev/stdout"),
+    sizes: str = "100000",
+    metrics: str = "sequniq-normwalk",
+    log: logging.Logger = None,
+) -> int:
+    """
+    Compute complexity scores for larger windows from the partial sums of
+    smaller ones
+
+    The partial sums must come from 'panct complexity --partial-sums'. Ideally,
+    they were computed for windows whose size divides all of the new sizes. The
+    partial sums are read once, no matter how many sizes are requested.
+
+    Parameters
+    ----------
+    partial_file : Path
+        Path to the partial sums
+    output_file : Path | str, optional
+        Path to the output file. If more than one size is requested, it must
+        contain the placeholder '{size}', which is replaced by each size. See
+        panct.output for the formats it may be written in
+    sizes : str, optional
+        Comma-separated list of window sizes
+    metrics : str, optional
+        Comma-separated list of metrics to compute
+    log : logging.Logger, optional
+        Logger object
+
+    Returns
+    -------
+    retcode : int
+        Return code of the program
+    """
+    if log is None:
+        log = getLogger(name="complexity-aggregate", level="ERROR")
+
+    metrics_list = metrics.split(",")
+    for m in metrics_list:
+        if m not in AVAILABLE_METRICS:
+            log.critical(f"Encountered invalid metric {m}")
+            return 1
+    try:
+        sizes_list = [int(size) for size in sizes.split(",")]
+    except ValueError:
+        log.critical(f"Encountered invalid window sizes {sizes}")
+        return 1
+    if any(size < 1 for size in sizes_list):
+        log.critical("Window sizes must be positive")
+        return 1
+    if len(sizes_list) > 1 and "{size}" not in str(output_file):
+        log.critical("The output file must contain '{size}' to write several sizes")
+        return 1
+
+    header = REGION_COLUMNS + ["numnodes", "total_length", "numwalks"] + metrics_list
+    outfs = {}
+    for size in sizes_list:
+        outfs[size] = open_writer(
+            Path(str(output_file).replace("{size}", str(size))), header, log
+        )
+    aggregators = [WindowAggregator(size) for size in sizes_list]
+
+    num_crossing = 0
+    try:
+        for region, sums in read_partial_sums(partial_file):
+            for aggregator in aggregators:
+                size = aggregator.size
+                if region.start // size != (region.end - 1) // size:
+                    num_crossing += 1
+                _write_window(outfs[size], aggregator.add(region, sums), metrics_list)
+        for aggregator in aggregators:
+            _write_window(outfs[aggregator.size], aggregator.flush(), metrics_list)
+    except ValueError as e:
+        log.critical(str(e))
+        return 1
+    finally:
+        for outf in outfs.values():
+            outf.close()
+    if num_crossing:
+        log.warning(
+            f"{num_crossing} windows crossed the boundaries of the larger windows. "
+            "Use sizes that are multiples of the size of the partial windows"
+        )
+    return 0
+
+
+def _write_window(
+    outf, window: Optional[tuple[Region, WindowSums]], metrics: list[str]
+):
+    """
+    Write the complexity of a larger window, if there is one
+    """
+    if window is None:
+        return
+    region, sums = window
+    items = [region.chrom, region.start, region.end]
+    items += [sums.numnodes, sums.total_length, sums.numwalks]
+    items += sums.get_complexities(metrics)
+    outf.write(items)
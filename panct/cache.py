@@ -0,0 +1,191 @@
+"""
+Cache the results of computing complexity, so that long runs can be resumed
+
+Results are stored in a SQLite database keyed by a hash of everything that
+determines them: the identity of the graph (its path, size, and modification
+time), the reference, the excluded samples, the metrics, and the region. When
+the cache grows beyond its maximum size, the results that were used least
+recently are evicted.
+"""
+
+from __future__ import annotations
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .data import Region
+
+# the default maximum size of the cached results, in bytes
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+class ResultCache:
+    """
+    A size-bounded, on-disk cache of the output columns for each region
+
+    Attributes
+    ----------
+    cache_file : Path
+        Path to the SQLite database. It is created if it doesn't exist
+    max_size : int
+        The maximum total size of the cached results, in bytes
+    context : str
+        A serialization of the settings that determine the results, other than
+        the region
+    """
+
+    def __init__(
+        self,
+        cache_file: Path,
+        graph_file: Path,
+        reference: str,
+        metrics: list[str],
+        exclude: Iterable[str] = (),
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        self.cache_file = Path(cache_file)
+        self.max_size = max_size
+        graph_file = Path(graph_file)
+        stat = graph_file.stat()
+        self.context = json.dumps(
+            [
+                str(graph_file.resolve()),
+                stat.st_size,
+                stat.st_mtime_ns,
+                reference,
+                sorted(exclude),
+                list(metrics),
+            ]
+        )
+        self.connection = sqlite3.connect(self.cache_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+        self.connection.commit()
+        size, clock = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM results"
+        ).fetchone()
+        self._size = size
+        self._clock = clock
+
+    def __enter__(self) -> ResultCache:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Commit any pending changes and close the database
+        """
+        self.connection.commit()
+        self.connection.close()
+
+    def get_key(self, region: Optional[Region]) -> str:
+        """
+        Compute the key of a region
+
+        Parameters
+        ----------
+        region : Optional[Region]
+            The region, or None for a whole graph
+
+        Returns
+        -------
+        str
+            A hex digest identifying the results for the region
+        """
+        region = None if region is None else [region.chrom, region.start, region.end]
+        return hashlib.sha256(json.dumps([self.context, region]).encode()).hexdigest()
+
+    def get(self, region: Optional[Region]) -> Optional[list]:
+        """
+        Retrieve the cached results for a region
+
+        Parameters
+        ----------
+        region : Optional[Region]
+            The region, or None for a whole graph
+
+        Returns
+        -------
+        Optional[list]
+            The output columns for the region, or None if they are not cached
+        """
+        key = self.get_key(region)
+        row = self.connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._clock += 1
+        self.connection.execute(
+            "UPDATE results SET last_used = ? WHERE key = ?", (self._clock, key)
+        )
+        return json.loads(row[0])
+
+    def put(self, region: Optional[Region], items: list):
+        """
+        Store the results for a region, evicting old results if necessary
+
+        The change is committed immediately, so that it survives if the program
+        is killed.
+
+        Parameters
+        ----------
+        region : Optional[Region]
+            The region, or None for a whole graph
+        items : list
+            The output columns for the region. They must be JSON-serializable or
+            numpy scalars
+        """
+        key = self.get_key(region)
+        value = json.dumps(items, default=_to_builtin)
+        self._clock += 1
+        old = self.connection.execute(
+            "SELECT size FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if old is not None:
+            self._size -= old[0]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (key, value, len(value), self._clock),
+        )
+        self._size += len(value)
+        if self._size > self.max_size:
+            self._evict()
+        self.connection.commit()
+
+    def _evict(self):
+        """
+        Delete the least recently used results until the cache fits in max_size
+        """
+        rows = self.connection.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        )
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_size:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+
+def _to_builtin(obj):
+    """
+    Convert a numpy scalar to the equivalent Python object for JSON
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
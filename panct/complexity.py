@@ -3,19 +3,155 @@ Compute complexity scores for regions
 of a pangenome graph
 """
 
+from __future__ import annotations
 import time
 import logging
 from pathlib import Path
-from typing import Optional
+from functools import partial
+from itertools import groupby, islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sized,
+)
 
+import numpy as np
+
+from . import profiler
 from .logging import getLogger
+from .progress import Progress
+from .output import open_writer
+from .cache import ResultCache, DEFAULT_MAX_SIZE
+from .window import SlidingWindow, WindowSums
 from . import gbz_utils as gbz
-from .data import Region, Regions
+from .index import get_index_path
+from .data import Region, Regions, ColumnarWalks
+from .ref_index import ReferenceIndex, get_reference_index_path
 from . import graph_utils as gutils
 
 AVAILABLE_METRICS = ["sequniq-normwalk", "sequniq-normnode"]
 
 
+class ComplexityResult(NamedTuple):
+    """
+    The complexity of a region of a graph, as yielded by iter_complexity()
+
+    Attributes
+    ----------
+    region : Optional[Region]
+        The region or window, or None for a whole graph
+    numnodes : Optional[int]
+        The number of nodes in the region
+    total_length : Optional[int]
+        The total length of the nodes in the region
+    numwalks : Optional[int]
+        The number of walks in the region
+    metrics : dict[str, Optional[float]]
+        The value of each requested metric, or None where it is undefined. Empty
+        if partial sums were computed instead
+    sums : Optional[WindowSums]
+        The sums from which the metrics are computed, if they were requested
+    error : Optional[Exception]
+        The exception raised while processing the region, if it failed. The
+        other values are then None
+    """
+
+    region: Optional[Region]
+    numnodes: Optional[int]
+    total_length: Optional[int]
+    numwalks: Optional[int]
+    metrics: dict[str, Optional[float]]
+    sums: Optional[WindowSums] = None
+    error: Optional[Exception] = None
+
+    @classmethod
+    def from_items(
+        cls,
+        region: Optional[Region],
+        items: Optional[list],
+        metrics: list[str],
+        partial_sums: bool = False,
+        error: Optional[Exception] = None,
+    ) -> ComplexityResult:
+        """
+        Create a result from the columns of an output line
+
+        Parameters
+        ----------
+        region : Optional[Region]
+            The region, or None for a whole graph
+        items : Optional[list]
+            The columns of the output line, as in get_columns(). None if the
+            region failed
+        metrics : list[str]
+            The metrics that were computed
+        partial_sums : bool, optional
+            Whether the partial sums were computed instead of the metrics
+        error : Optional[Exception], optional
+            The exception raised while processing the region
+
+        Returns
+        -------
+        ComplexityResult
+            The result
+        """
+        if items is None:
+            return cls(region, None, None, None, {}, None, error)
+        if region is not None:
+            items = items[3:]
+        if partial_sums:
+            sums = WindowSums(*items)
+            return cls(region, *sums[:3], {}, sums)
+        return cls(region, *items[:3], dict(zip(metrics, items[3:])))
+
+    def to_items(self) -> list:
+        """
+        Get the columns of the output line for this result
+
+        Returns
+        -------
+        list
+            The value of each column, as in get_columns()
+        """
+        items = []
+        if self.region is not None:
+            items = [self.region.chrom, self.region.start, self.region.end]
+        if self.sums is not None:
+            return items + list(self.sums)
+        items += [self.numnodes, self.total_length, self.numwalks]
+        return items + list(self.metrics.values())
+
+
+class ComplexityResults:
+    """
+    The results of iter_complexity(), which are computed as they are iterated
+
+    Attributes
+    ----------
+    results : Iterator[ComplexityResult]
+        The results for each region or window, or a single result for a whole graph
+    columns : list[str]
+        The columns of the output line of each result. See get_columns()
+    """
+
+    def __init__(self, results: Iterator[ComplexityResult], columns: list[str]):
+        self.results = results
+        self.columns = columns
+
+    def __iter__(self) -> ComplexityResults:
+        return self
+
+    def __next__(self) -> ComplexityResult:
+        return next(self.results)
+
+
 def main(
     graph_file: Path,
     output_file: Path = Path("/dev/stdout"),
@@ -23,23 +159,47 @@ def main(
     metrics: str = "sequniq-normwalk",
     reference: str = "GRCh38",
     log: logging.Logger = None,
+    columnar: bool = False,
+    threads: int = 1,
+    gbz_backend: str = "query",
+    by_contig: bool = False,
+    cache_file: Path = None,
+    cache_size: int = DEFAULT_MAX_SIZE,
+    resume: bool = False,
+    window: int = None,
+    step: int = None,
+    partial_sums: bool = False,
+    profile_file: Path = None,
+    cprofile_file: Path = None,
+    progress_interval: float = None,
 ):
     """
     Compute complexity scores for regions
     of a pangenome graph
 
     If a GFA file is given, compute complexity
-    on the entire file.
+    on the entire file. The GFA may be gzip or
+    BGZF-compressed. If an up-to-date index created
+    by 'panct index' exists, it is used instead.
+    If regions are given and the .walk file of the
+    GFA has a reference index, complexity is
+    computed for each region from the .walk file.
 
     If a GBZ file is given, must specify a region
     (or file with list of regions)
 
+    The results are computed by iter_complexity(),
+    which can be used to get them without writing
+    them to a file
+
     Parameters
     ----------
     graph_file : Path
-        Path to GFA or GBZ file
+        Path to GFA (optionally ending in .gz) or GBZ file
     output_file : str, optional
-        Path to output file
+        Path to output file. If it ends in .gz, it is BGZF-compressed and indexed
+        with tabix. If it ends in .npz, each column is stored as a numpy array.
+        See panct.output
     region_str : str|Path, optional
         chrom:start-end of region to process or a BED file of regions
     metrics : str, optional
@@ -48,6 +208,50 @@ def main(
         Sample ID of reference
     log : logging.Logger, optional
         Logger object
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    threads : int, optional
+        Number of threads to use. For GBZ files, this is the number of regions
+        processed in parallel. For GFA files, it is used to decompress a
+        BGZF-compressed GFA. It is also used to compress a .gz output file
+    gbz_backend : str, optional
+        How to extract regions from a GBZ file. Options: see gbz_utils.GBZ_BACKENDS
+    by_contig : bool, optional
+        Whether to index the reference path of each contig once and slice it into
+        the regions locally, instead of extracting each region separately. This
+        is much faster when the regions tile a contig. Requires the sqlite
+        backend
+    cache_file : Path, optional
+        A database in which to cache the results for each region. Regions whose
+        results are already in the cache are not processed again
+    cache_size : int, optional
+        The maximum size of the results in the cache, in bytes. The least
+        recently used results are evicted when it is exceeded
+    resume : bool, optional
+        Whether to append to a partially written output file, skipping the regions
+        that are already in it. Only uncompressed text output can be resumed
+    window : int, optional
+        If given, compute complexity in windows of this size that slide along the
+        reference within each region (or each contig of a GFA, if no regions are
+        given), updating the metrics incrementally. See panct.window
+    step : int, optional
+        The distance between the starts of consecutive windows. Defaults to the
+        window size
+    partial_sums : bool, optional
+        Whether to output the additive sums from which the metrics are computed,
+        instead of the metrics. See panct.window.WindowSums. With a window,
+        each node is only assigned to the window containing its start, so that
+        the output can be combined into larger windows by 'panct
+        complexity-aggregate'
+    profile_file : Path, optional
+        A file to which to write a summary of the time and memory used by each
+        stage of processing each region. See panct.profiler
+    cprofile_file : Path, optional
+        A file to which to write statistics from cProfile
+    progress_interval : float, optional
+        If given, report the rate at which regions (or windows, or the bytes of
+        a GFA) are processed and the time remaining at most this often, in
+        seconds. See panct.progress
 
     Returns
     -------
@@ -56,108 +260,1165 @@ def main(
     """
     if log is None:
         log = getLogger(name="complexity", level="ERROR")
+    with profiler.profiling(profile_file, cprofile_file, log):
+        return _main(
+            graph_file=graph_file,
+            output_file=output_file,
+            region_str=region_str,
+            metrics=metrics,
+            reference=reference,
+            log=log,
+            columnar=columnar,
+            threads=threads,
+            gbz_backend=gbz_backend,
+            by_contig=by_contig,
+            cache_file=cache_file,
+            cache_size=cache_size,
+            resume=resume,
+            window=window,
+            step=step,
+            partial_sums=partial_sums,
+            progress_interval=progress_interval,
+        )
+
+
+def _main(
+    *,
+    graph_file: Path,
+    output_file: Path,
+    region_str: str | Path,
+    metrics: str,
+    reference: str,
+    log: logging.Logger,
+    columnar: bool,
+    threads: int,
+    gbz_backend: str,
+    by_contig: bool,
+    cache_file: Path,
+    cache_size: int,
+    resume: bool,
+    window: int,
+    step: int,
+    partial_sums: bool,
+    progress_interval: float,
+):
+    """
+    Compute complexity scores for regions of a pangenome graph and write them to
+    a file. See main()
+
+    The files and options are checked by iter_complexity(). This function only
+    handles the output file and the cache
+    """
     start_time = time.time()
 
-    #### Check files and indices #####
-    file_type = None
-    if graph_file.suffix == ".gfa":
-        # TODO: also handle .gfa.gz
+    ##### Set up list of regions to process #####
+    metrics_list = metrics.split(",")
+    regions = None
+    if region_str:
+        with profiler.stage("parse"):
+            if isinstance(region_str, Path):
+                regions = Regions.read(region_str, log=log)
+            else:
+                region = Region.read(region_str)
+                regions = Regions((region,), log=log)
+    num_regions = len(regions) if regions else 1
+
+    cache = None
+    if cache_file is not None:
+        try:
+            cache = ResultCache(
+                cache_file,
+                graph_file,
+                reference,
+                list(WindowSums._fields) if partial_sums else metrics_list,
+                [reference] if reference != "" else [],
+                cache_size,
+            )
+        except OSError as e:
+            log.critical(f"Cannot open cache {cache_file}: {e}")
+            return 1
+
+    ##### Check files, indices, and options #####
+    # the regions and windows in this set are skipped once the results are
+    # iterated, so it can still be filled after the output file is checked below
+    completed = set()
+    try:
+        results = iter_complexity(
+            graph_file,
+            regions=regions,
+            metrics=metrics_list,
+            reference=reference,
+            log=log,
+            columnar=columnar,
+            threads=threads,
+            gbz_backend=gbz_backend,
+            by_contig=by_contig,
+            cache=cache,
+            window=window,
+            step=step,
+            partial_sums=partial_sums,
+            progress_interval=progress_interval,
+            skip=completed,
+        )
+    except ValueError as e:
+        log.critical(str(e))
+        if cache is not None:
+            cache.close()
+        return 1
+
+    ##### Set up output file #####
+    append = False
+    if resume and Path(output_file).is_file() and Path(output_file).stat().st_size:
+        if Path(output_file).suffix in (".gz", ".npz"):
+            log.critical(f"Cannot resume {output_file}: it is not uncompressed text")
+            if cache is not None:
+                cache.close()
+            return 1
+        done = read_completed(output_file, results.columns)
+        if done is None:
+            log.critical(f"Cannot resume {output_file}: its header does not match")
+            if cache is not None:
+                cache.close()
+            return 1
+        log.info(f"Resuming {output_file} after {len(done)} completed lines")
+        completed.update(done)
+        append = True
+    outf = open_writer(output_file, results.columns, log, append, threads)
+
+    ##### Process each region #####
+    num_failed = 0
+    for result in results:
+        region = result.region
+        if result.error is not None:
+            region_name = f"{region.chrom}:{region.start}-{region.end}"
+            log.error(f"Failed to process region {region_name}: {result.error}")
+            num_failed += 1
+            continue
+        if region is not None and window is None:
+            log.debug(f"Processed region {region.chrom}:{region.start}-{region.end}")
+        with profiler.stage("write", region):
+            outf.write(result.to_items())
+
+    ##### Cleanup #####
+    total_time = time.time() - start_time
+    log.debug(f"Total time: \t{total_time}\n")
+    if results.columns[:1] == ["chrom"] and window is None:
+        log.debug(f"Time per region\t{total_time / num_regions}\n")
+    outf.close()
+    if cache is not None:
+        cache.close()
+    if num_failed:
+        log.error(f"Failed to process {num_failed} of {num_regions} regions")
+        return 1
+    return 0
+
+
+def _check_options(
+    graph_file: Path,
+    metrics: list[str],
+    log: logging.Logger,
+    gbz_backend: str = "query",
+    by_contig: bool = False,
+    use_cache: bool = False,
+    window: int = None,
+    step: int = None,
+    partial_sums: bool = False,
+) -> str:
+    """
+    Check the graph file and the options for computing complexity
+
+    Returns
+    -------
+    str
+        The type of the graph file: either 'gfa' or 'gbz'
+
+    Raises
+    ------
+    ValueError
+        If the graph file or any of the options are invalid
+    """
+    if graph_file.suffix == ".gfa" or graph_file.suffixes[-2:] == [".gfa", ".gz"]:
         file_type = "gfa"
     elif graph_file.suffix == ".gbz":
         file_type = "gbz"
-        if not gbz.check_gbzbase_installed(log):
-            return 1
+        if gbz_backend not in gbz.GBZ_BACKENDS:
+            raise ValueError(f"Encountered invalid GBZ backend {gbz_backend}")
+        # windows are always read from the GBZ-base database directly
+        if (
+            gbz_backend == "query"
+            and window is None
+            and not gbz.check_gbzbase_installed(log)
+        ):
+            raise ValueError("The query GBZ backend requires gbz-base")
+        if by_contig and window is None and gbz_backend != "sqlite":
+            raise ValueError("Processing by contig requires the sqlite GBZ backend")
         if not gbz.check_gbzfile(graph_file, log):
-            return 1
+            raise ValueError(f"Cannot read GBZ file {graph_file}")
     else:
-        log.critical("Invalid graph type. Must be .gbz or .gfa")
-        return 1
+        raise ValueError("Invalid graph type. Must be .gbz, .gfa, or .gfa.gz")
 
-    #### Check requested metrics #####
-    metrics_list = metrics.split(",")
-    for m in metrics_list:
+    for m in metrics:
         if m not in AVAILABLE_METRICS:
-            log.critical(f"Encountered invalid metric {m}")
-            return 1
+            raise ValueError(f"Encountered invalid metric {m}")
 
-    ##### Set up output file #####
-    outf = open(output_file, "w")
-    header = []
-    if file_type == "gbz":
-        header = ["chrom", "start", "end"]
-    header.extend(["numnodes", "total_length", "numwalks"] + metrics_list)
-    outf.write("\t".join(header) + "\n")
-
-    ##### If GFA, just process the whole graph #####
-    if file_type == "gfa":
-        if region_str is not None:
-            log.warning("Regions are ignored when processing GFA")
-        exclude = []
-        if reference != "":
-            exclude = [reference]
-        node_table = gutils.NodeTable(graph_file, exclude)
-        metric_results = []
-        for m in metrics_list:
-            metric_results.append(compute_complexity(node_table, m))
-        items = [
-            len(node_table.nodes.keys()),
-            node_table.get_total_node_length(),
-            node_table.numwalks,
-        ] + metric_results
-        outf.write("\t".join([str(item) for item in items]) + "\n")
-        outf.flush()
-        end_time = time.time()
-        total_time = end_time - start_time
-        log.debug(f"Total time: \t{total_time}\n")
-        outf.close()
-        return 0
-
-    #### If GBZ: Set up list of regions to process #####
-    regions = []
-    if region_str is not None:
-        if isinstance(region_str, Path):
-            regions = Regions.read(region_str, log=log)
-        else:
-            region = Region.read(region_str)
-            regions = Regions((region,), log=log)
-    if len(regions) == 0:
-        log.critical("Did not detect any regions")
-        return 1
+    if window is not None:
+        if window < 1 or (step is not None and step < 1):
+            raise ValueError("The window size and step must be positive")
+        if by_contig or use_cache:
+            log.warning("Sliding windows are always processed by contig, uncached")
+    elif step is not None:
+        log.warning("The step is ignored without a window size")
+    if partial_sums and window is not None and step not in (None, window):
+        raise ValueError(
+            "Partial sums can only be computed for non-overlapping windows"
+        )
+    return file_type
 
-    ##### Process each region #####
-    for region in regions:
-        log.info(
-            "Processing region {chrom}:{start}-{end}".format(
-                chrom=region.chrom, start=region.start, end=region.end
+
+def get_columns(
+    metrics: list[str], has_regions: bool = True, partial_sums: bool = False
+) -> list[str]:
+    """
+    Get the names of the columns of the output of 'panct complexity'
+
+    Parameters
+    ----------
+    metrics : list[str]
+        Which metrics are computed
+    has_regions : bool, optional
+        Whether the output has a line per region, rather than one for the graph
+    partial_sums : bool, optional
+        Whether the sums from which the metrics are computed are output instead
+
+    Returns
+    -------
+    list[str]
+        The name of each column
+    """
+    columns = ["chrom", "start", "end"] if has_regions else []
+    if partial_sums:
+        return columns + list(WindowSums._fields)
+    return columns + ["numnodes", "total_length", "numwalks"] + metrics
+
+
+def iter_complexity(
+    graph_file: Path,
+    regions: Optional[Iterable[Region]] = None,
+    metrics: list[str] = ["sequniq-normwalk"],
+    reference: str = "GRCh38",
+    log: logging.Logger = None,
+    columnar: bool = False,
+    threads: int = 1,
+    gbz_backend: str = "query",
+    by_contig: bool = False,
+    cache: ResultCache = None,
+    window: int = None,
+    step: int = None,
+    partial_sums: bool = False,
+    progress_interval: float = None,
+    skip: Container[tuple] = (),
+) -> ComplexityResults:
+    """
+    Compute complexity scores for regions of a pangenome graph
+
+    This is the API behind 'panct complexity'. Results are yielded as soon as
+    they are computed, in the order of the regions, so that they can be used
+    without writing them to a file. See main() for how each kind of graph file
+    is processed.
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to GFA (optionally ending in .gz) or GBZ file
+    regions : Optional[Iterable[Region]], optional
+        The regions to process. Required for a GBZ file. For a GFA file, regions
+        are only processed if the GFA has a reference index or a window is
+        given. Otherwise, the whole graph is processed
+    metrics : list[str], optional
+        Which metrics to compute. Options: see AVAILABLE_METRICS
+    reference : str, optional
+        Sample ID of reference
+    log : logging.Logger, optional
+        Logger object
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    threads : int, optional
+        Number of threads to use. See main()
+    gbz_backend : str, optional
+        How to extract regions from a GBZ file. Options: see gbz_utils.GBZ_BACKENDS
+    by_contig : bool, optional
+        Whether to process the regions of each contig of a GBZ file together.
+        See main()
+    cache : ResultCache, optional
+        A cache from which to take the results of regions processed before and
+        in which to store new results. It is not used with a window
+    window : int, optional
+        If given, compute complexity in windows of this size that slide along
+        each region (or each contig of a GFA, if no regions are given)
+    step : int, optional
+        The distance between the starts of consecutive windows. Defaults to the
+        window size
+    partial_sums : bool, optional
+        Whether to compute the additive sums from which the metrics are computed,
+        instead of the metrics. See panct.window.WindowSums
+    progress_interval : float, optional
+        If given, report the rate at which regions are processed at most this
+        often, in seconds. See panct.progress
+    skip : Container[tuple], optional
+        The (chrom, start, end) of regions or windows that should not be output,
+        or an empty tuple if a whole graph should not be output, as returned by
+        read_completed(). It is only checked once the results are iterated
+
+    Returns
+    -------
+    ComplexityResults
+        The results for each region or window, or a single result for a whole
+        GFA file. A region that could not be processed has a result with an
+        error instead of values
+
+    Raises
+    ------
+    ValueError
+        If the graph file or any of the options are invalid. This is raised
+        immediately, rather than when the results are first iterated
+    """
+    if log is None:
+        log = getLogger(name="complexity", level="ERROR")
+    file_type = _check_options(
+        graph_file,
+        metrics,
+        log,
+        gbz_backend=gbz_backend,
+        by_contig=by_contig,
+        use_cache=cache is not None,
+        window=window,
+        step=step,
+        partial_sums=partial_sums,
+    )
+    if file_type == "gbz" and regions is None:
+        raise ValueError("Regions are required for a GBZ file")
+    walk_file, ref_index = None, None
+    if file_type == "gfa" and regions is not None and window is None:
+        walk_file, ref_index = find_reference_index(graph_file, reference, log)
+        if ref_index is None:
+            log.warning(
+                "Regions are ignored when processing GFA without a reference index. "
+                "Run 'panct walks' on the GFA to create one"
             )
+            regions = None
+    has_regions = file_type == "gbz" or window is not None or ref_index is not None
+    if (
+        has_regions
+        and window is None
+        and isinstance(regions, Sized)
+        and not len(regions)
+    ):
+        raise ValueError("Did not detect any regions")
+    results = _iter_complexity(
+        graph_file,
+        regions=regions,
+        metrics=metrics,
+        reference=reference,
+        log=log,
+        columnar=columnar,
+        threads=threads,
+        gbz_backend=gbz_backend,
+        by_contig=by_contig,
+        cache=cache if window is None else None,
+        window=window,
+        step=step,
+        partial_sums=partial_sums,
+        progress_interval=progress_interval,
+        walk_file=walk_file,
+        ref_index=ref_index,
+        skip=skip,
+    )
+    return ComplexityResults(results, get_columns(metrics, has_regions, partial_sums))
+
+
+def _iter_complexity(
+    graph_file: Path,
+    *,
+    regions: Optional[Iterable[Region]],
+    metrics: list[str],
+    reference: str,
+    log: logging.Logger,
+    columnar: bool,
+    threads: int,
+    gbz_backend: str,
+    by_contig: bool,
+    cache: Optional[ResultCache],
+    window: Optional[int],
+    step: Optional[int],
+    partial_sums: bool,
+    progress_interval: Optional[float],
+    walk_file: Optional[Path],
+    ref_index: Optional[ReferenceIndex],
+    skip: Container[tuple],
+) -> Iterator[ComplexityResult]:
+    """
+    Compute complexity scores for regions of a pangenome graph whose options
+    have already been checked. See iter_complexity()
+    """
+    exclude = []
+    if reference != "":
+        exclude = [reference]
+    to_result = partial(
+        ComplexityResult.from_items, metrics=metrics, partial_sums=partial_sums
+    )
+
+    ##### If requested, slide windows along the regions #####
+    if window is not None:
+        regions = list(regions) if regions is not None else []
+        step = step or window
+        num_windows = sum(-(-(r.end - r.start) // step) for r in regions) or None
+        progress = Progress(
+            "complexity", num_windows, "windows", interval=progress_interval, log=log
         )
-        # Load node table for the region
-        node_table = gbz.load_node_table_from_gbz(graph_file, region, reference)
-
-        # Compute each requested complexity metric
-        metric_results = []
-        for m in metrics_list:
-            metric_results.append(compute_complexity(node_table, m))
-
-        # Output
-        items = (
-            [region.chrom, region.start, region.end]
-            + [
-                len(node_table.nodes.keys()),
-                node_table.get_total_node_length(),
-                node_table.numwalks,
+        try:
+            for region, items, error in iter_window_results(
+                graph_file,
+                regions,
+                window,
+                step,
+                reference,
+                metrics,
+                threads,
+                log,
+                partial_sums,
+            ):
+                progress.update()
+                if (region.chrom, region.start, region.end) not in skip:
+                    yield to_result(region, items, error=error)
+        finally:
+            progress.close()
+        return
+
+    ##### If GFA without a reference index, just process the whole graph #####
+    if graph_file.suffix != ".gbz" and ref_index is None:
+        if () in skip:
+            log.info("Skipping the whole graph, which is already in output")
+            return
+        items = None if cache is None else cache.get(None)
+        if items is None:
+            progress = Progress.for_file(
+                "complexity", graph_file, progress_interval, log
+            )
+            try:
+                items = process_gfa(
+                    graph_file,
+                    exclude,
+                    metrics,
+                    columnar,
+                    threads,
+                    log,
+                    partial_sums,
+                    progress if progress.enabled else None,
+                )
+            finally:
+                progress.close()
+            if cache is not None:
+                cache.put(None, items)
+        yield to_result(None, items)
+        return
+
+    #### If GBZ or indexed GFA: Process each region #####
+    regions = list(regions)
+    if skip:
+        num_regions = len(regions)
+        regions = [r for r in regions if (r.chrom, r.start, r.end) not in skip]
+        log.info(f"Skipping {num_regions - len(regions)} regions already in output")
+    cached_items = [None] * len(regions)
+    if cache is not None:
+        cached_items = [cache.get(region) for region in regions]
+        num_cached = sum(items is not None for items in cached_items)
+        log.info(f"Found {num_cached} of {len(regions)} regions in the cache")
+    todo = [r for r, items in zip(regions, cached_items) if items is None]
+    worker = partial(
+        process_contig if by_contig else process_region,
+        graph_file,
+        reference=reference,
+        metrics=metrics,
+        columnar=columnar,
+        log=log,
+        backend=gbz_backend,
+        partial_sums=partial_sums,
+    )
+    if ref_index is not None:
+        results = iter_walk_results(
+            walk_file,
+            ref_index,
+            todo,
+            exclude,
+            metrics,
+            columnar,
+            log,
+            partial_sums,
+        )
+    elif by_contig:
+        # consecutive regions on the same contig are processed together
+        batches = (tuple(batch) for _, batch in groupby(todo, lambda r: r.chrom))
+        results = _iter_batch_results(batches, worker, threads)
+    else:
+        results = iter_region_results(todo, worker, threads)
+    results = _merge_cached_results(regions, cached_items, results)
+    progress = Progress(
+        "complexity", len(regions), "regions", interval=progress_interval, log=log
+    )
+    try:
+        for region, items, error, from_cache in results:
+            progress.update()
+            if cache is not None and error is None and not from_cache:
+                cache.put(region, items)
+            yield to_result(region, items, error=error)
+    finally:
+        progress.close()
+
+
+def iter_result_arrays(
+    results: Iterable[ComplexityResult], batch_size: int = 1000
+) -> Iterator[np.ndarray]:
+    """
+    Collect results into numpy structured arrays
+
+    Each field of the arrays is named after a column of the output of 'panct
+    complexity' (see get_columns()). The chrom field holds strings, the metrics
+    are floats (NaN where they are undefined), and the other fields are
+    integers. Results with an error are skipped.
+
+    Parameters
+    ----------
+    results : Iterable[ComplexityResult]
+        The results, as yielded by iter_complexity()
+    batch_size : int, optional
+        The maximum number of results in each array
+
+    Yields
+    ------
+    np.ndarray
+        Structured arrays of up to batch_size results
+    """
+    batch = []
+    for result in results:
+        if result.error is not None:
+            continue
+        batch.append(result)
+        if len(batch) >= batch_size:
+            yield _to_array(batch)
+            batch = []
+    if batch:
+        yield _to_array(batch)
+
+
+def _to_array(results: list[ComplexityResult]) -> np.ndarray:
+    """
+    Convert results into a structured array. See iter_result_arrays()
+    """
+    first = results[0]
+    columns = get_columns(
+        list(first.metrics), first.region is not None, first.sums is not None
+    )
+    dtype = []
+    for column in columns:
+        if column == "chrom":
+            width = max(len(result.region.chrom) for result in results)
+            dtype.append((column, f"U{max(width, 1)}"))
+        elif column in first.metrics:
+            dtype.append((column, np.float64))
+        else:
+            dtype.append((column, np.int64))
+    rows = [
+        tuple(np.nan if item is None else item for item in result.to_items())
+        for result in results
+    ]
+    return np.array(rows, dtype=dtype)
+
+
+def process_gfa(
+    graph_file: Path,
+    exclude: list[str],
+    metrics: list[str],
+    columnar: bool = False,
+    threads: int = 1,
+    log: logging.Logger = None,
+    partial_sums: bool = False,
+    progress: Progress = None,
+) -> list:
+    """
+    Compute complexity scores for a whole GFA file
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to the GFA file (optionally ending in .gz)
+    exclude : list[str]
+        Samples to exclude from the walks
+    metrics : list[str]
+        Which metrics to compute
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    threads : int, optional
+        Number of threads to use to decompress a BGZF-compressed GFA
+    log : logging.Logger, optional
+        Logger object
+    partial_sums : bool, optional
+        Whether to output the sums from which the metrics are computed instead
+    progress : Progress, optional
+        A Progress to which to count the bytes of the GFA as they are parsed
+
+    Returns
+    -------
+    items : list
+        The columns of the output line for the graph
+    """
+    if log is None:
+        log = getLogger(name="complexity", level="ERROR")
+    node_table = None
+    index_file = get_index_path(graph_file)
+    with profiler.stage("build"):
+        if index_file.exists():
+            try:
+                node_table = gutils.ColumnarNodeTable.load_from_index(
+                    index_file, exclude, graph_file
+                )
+                log.info(f"Loaded graph from index {index_file}")
+            except ValueError as e:
+                log.warning(f"Ignoring index: {e}")
+        if node_table is None:
+            table_class = gutils.ColumnarNodeTable if columnar else gutils.NodeTable
+            node_table = table_class()
+            node_table.load_from_gfa(
+                graph_file, exclude, threads, progress=progress, log=log
+            )
+    log.debug(f"Node table memory usage: {node_table.get_memory_usage()} bytes")
+    with profiler.stage("metric"):
+        if partial_sums:
+            return list(WindowSums.from_node_table(node_table))
+        metric_results = compute_complexities(node_table, metrics)
+    items = [
+        len(node_table.nodes.keys()),
+        node_table.get_total_node_length(),
+        node_table.numwalks,
+    ] + metric_results
+    return items
+
+
+def iter_window_results(
+    graph_file: Path,
+    regions: Iterable[Region],
+    window: int,
+    step: int,
+    reference: str = "GRCh38",
+    metrics: list[str] = ["sequniq-normwalk"],
+    threads: int = 1,
+    log: logging.Logger = None,
+    partial_sums: bool = False,
+) -> Iterator[tuple[Region, Optional[list], Optional[Exception]]]:
+    """
+    Slide a window along each region of a graph and yield the results for each
+    window
+
+    A GFA file is loaded once and windows slide along each of the regions or, if
+    none are given, along the whole reference path of each contig. For a GBZ
+    file, each region is extracted and then scanned separately.
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to a GFA (optionally ending in .gz) or GBZ file
+    regions : Iterable[Region]
+        The regions in which to slide the window
+    window : int
+        The size of each window
+    step : int
+        The distance between the starts of consecutive windows
+    reference : str, optional
+        Sample ID of reference
+    metrics : list[str], optional
+        Which metrics to compute
+    threads : int, optional
+        Number of threads to use to decompress a BGZF-compressed GFA
+    log : logging.Logger, optional
+        Logger object
+    partial_sums : bool, optional
+        Whether to output the sums from which the metrics are computed instead.
+        Each node is then only assigned to the window containing its start
+
+    Yields
+    ------
+    tuple[Region, Optional[list], Optional[Exception]]
+        Each window (or a region, if it could not be processed), the columns of
+        its output line, and the exception raised while processing the region
+    """
+    if log is None:
+        log = getLogger(name="complexity", level="ERROR")
+    sliding_window = None
+    if graph_file.suffix != ".gbz":
+        with profiler.stage("build"):
+            sliding_window = SlidingWindow.from_gfa(
+                graph_file, reference, threads=threads
+            )
+        if not regions:
+            regions = [
+                Region(c, *sliding_window.spans[c]) for c in sliding_window.contigs
             ]
-            + metric_results
+    for region in regions:
+        try:
+            if graph_file.suffix == ".gbz":
+                with profiler.stage("build", region):
+                    sliding_window = SlidingWindow.from_gbz(
+                        graph_file, region, reference
+                    )
+        except ValueError as e:
+            yield region, None, e
+            continue
+        # windows past the end of the reference path would be empty
+        end = sliding_window.spans.get(region.chrom, (0, region.start))[1]
+        region = Region(region.chrom, region.start, min(region.end, end))
+        log.info(f"Sliding windows along {region.chrom}:{region.start}-{region.end}")
+        windows = sliding_window.iter_windows(region, window, step, partial_sums)
+        for win, sums in profiler.iter_stage("metric", windows, region):
+            items = [win.chrom, win.start, win.end]
+            if partial_sums:
+                items += list(sums)
+            else:
+                items += [sums.numnodes, sums.total_length, sums.numwalks]
+                items += sums.get_complexities(metrics)
+            yield win, items, None
+
+
+def read_completed(output_file: Path, header: list[str]) -> Optional[set[tuple]]:
+    """
+    Find the regions in a partially written output file
+
+    An incomplete last line, like one left behind if the program was killed while
+    writing, is removed from the file.
+
+    Parameters
+    ----------
+    output_file : Path
+        The output file of a previous run
+    header : list[str]
+        The columns that the header of the file must have
+
+    Returns
+    -------
+    Optional[set[tuple]]
+        The (chrom, start, end) of each region in the file or, for the line of a
+        whole graph, an empty tuple. None if the header does not match
+    """
+    num_keys = 3 if header[:3] == ["chrom", "start", "end"] else 0
+    completed = set()
+    with open(output_file, "r+") as f:
+        if f.readline().rstrip("\n").split("\t") != header:
+            return None
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.endswith("\n"):
+                f.seek(pos)
+                f.truncate()
+                break
+            key = ()
+            if num_keys:
+                chrom, start, end = line.split("\t", num_keys)[:num_keys]
+                key = (chrom, int(start), int(end))
+            completed.add(key)
+    return completed
+
+
+def _merge_cached_results(
+    regions: list[Region],
+    cached_items: list[Optional[list]],
+    results: Iterator[tuple[Region, Any, Optional[Exception]]],
+) -> Iterator[tuple[Region, Any, Optional[Exception], bool]]:
+    """
+    Interleave cached results with the results of the regions that were not in
+    the cache, in the order of the regions
+
+    Each result is followed by whether it was taken from the cache
+    """
+    for region, items in zip(regions, cached_items):
+        if items is None:
+            yield *next(results), False
+        else:
+            yield region, items, None, True
+
+
+def process_region(
+    graph_file: Path,
+    region: Region,
+    reference: str = "GRCh38",
+    metrics: list[str] = ["sequniq-normwalk"],
+    columnar: bool = False,
+    log: logging.Logger = None,
+    backend: str = "query",
+    partial_sums: bool = False,
+) -> list:
+    """
+    Compute complexity scores for a single region of a GBZ file
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to the GBZ file
+    region : Region
+        The region to process
+    reference : str, optional
+        Sample ID of reference
+    metrics : list[str], optional
+        Which metrics to compute
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    log : logging.Logger, optional
+        Logger object
+    backend : str, optional
+        How to extract the region. Options: see gbz_utils.GBZ_BACKENDS
+    partial_sums : bool, optional
+        Whether to output the sums from which the metrics are computed instead
+
+    Returns
+    -------
+    items : list
+        The columns of the output line for this region
+    """
+    node_table = gbz.load_node_table_from_gbz(
+        graph_file, region, reference, columnar, log, backend
+    )
+    with profiler.stage("metric", region):
+        return _get_region_items(region, node_table, metrics, partial_sums)
+
+
+def _get_region_items(
+    region: Region,
+    node_table: gutils.NodeTable,
+    metrics: list[str],
+    partial_sums: bool = False,
+) -> list:
+    """
+    Get the columns of the output line for a region from its node table
+    """
+    if partial_sums:
+        sums = WindowSums.from_node_table(node_table)
+        return [region.chrom, region.start, region.end] + list(sums)
+    metric_results = compute_complexities(node_table, metrics)
+    return [
+        region.chrom,
+        region.start,
+        region.end,
+        len(node_table.nodes.keys()),
+        node_table.get_total_node_length(),
+        node_table.numwalks,
+    ] + metric_results
+
+
+def find_reference_index(
+    graph_file: Path, reference: str, log: logging.Logger = None
+) -> tuple[Optional[Path], Optional[ReferenceIndex]]:
+    """
+    Find the .walk file of a GFA and its reference index
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to the GFA file (optionally ending in .gz)
+    reference : str
+        Sample ID of the reference
+    log : logging.Logger, optional
+        Logger object
+
+    Returns
+    -------
+    tuple[Optional[Path], Optional[ReferenceIndex]]
+        The path to the .walk file and its reference index, or None and None if
+        there isn't an up-to-date index for the reference
+    """
+    if log is None:
+        log = getLogger(name="complexity", level="ERROR")
+    walk_file = gutils.NodeTable.find_walk_file(graph_file)
+    if walk_file is None:
+        return None, None
+    index_file = get_reference_index_path(walk_file)
+    if not index_file.exists():
+        return None, None
+    try:
+        ref_index = ReferenceIndex.read(index_file, walk_file)
+    except ValueError as e:
+        log.warning(f"Ignoring reference index: {e}")
+        return None, None
+    if ref_index.reference != reference:
+        log.warning(
+            f"Ignoring reference index {index_file}, since it was created for "
+            f"reference {ref_index.reference}"
         )
-        outf.write("\t".join([str(item) for item in items]) + "\n")
-        outf.flush()
+        return None, None
+    log.info(f"Using reference index {index_file}")
+    return walk_file, ref_index
 
-    ##### Cleanup #####
-    end_time = time.time()
-    time_per_region = (end_time - start_time) / len(regions)
-    log.debug(f"Time per region\t{time_per_region}\n")
-    outf.close()
-    return 0
+
+def iter_walk_results(
+    walk_file: Path,
+    ref_index: ReferenceIndex,
+    regions: list[Region],
+    exclude: list[str],
+    metrics: list[str] = ["sequniq-normwalk"],
+    columnar: bool = False,
+    log: logging.Logger = None,
+    partial_sums: bool = False,
+) -> Iterator[tuple[Region, Optional[list], Optional[Exception]]]:
+    """
+    Compute complexity scores for regions of a GFA from its .walk file
+
+    Each region is mapped to a range of node IDs with the reference index, and
+    the walks through all of the ranges are read with a single pass over the
+    .walk file. Each haplotype visiting a range is counted as one walk.
+
+    Parameters
+    ----------
+    walk_file : Path
+        Path to the .walk file of the GFA
+    ref_index : ReferenceIndex
+        The reference index of the .walk file
+    regions : list[Region]
+        The regions to process
+    exclude : list[str]
+        Samples to exclude from the walks
+    metrics : list[str], optional
+        Which metrics to compute
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    log : logging.Logger, optional
+        Logger object
+    partial_sums : bool, optional
+        Whether to output the sums from which the metrics are computed instead
+
+    Yields
+    ------
+    tuple[Region, Optional[list], Optional[Exception]]
+        Each region, the columns of its output line (or None if it failed), and
+        the exception raised while processing it (or None if it succeeded)
+    """
+    table_class = gutils.ColumnarNodeTable if columnar else gutils.NodeTable
+    ranges = [ref_index.get_node_range(region) for region in regions]
+    walks_iter = ColumnarWalks.read_many(
+        walk_file, [f"{lo}-{hi}" for lo, hi in filter(None, ranges)], log
+    )
+    for region, node_range in zip(regions, ranges):
+        if node_range is None:
+            error = ValueError(f"The region is not on {ref_index.reference}")
+            yield region, None, error
+            continue
+        try:
+            with profiler.stage("extract", region):
+                walks = next(walks_iter)
+            with profiler.stage("build", region):
+                node_table = table_class()
+                lengths = ref_index.get_node_lengths(walks.nodes)
+                node_table.load_from_walks(walks, lengths, exclude)
+            with profiler.stage("metric", region):
+                items = _get_region_items(region, node_table, metrics, partial_sums)
+        except Exception as e:
+            yield region, None, e
+            continue
+        yield region, items, None
+
+
+def process_contig(
+    graph_file: Path,
+    regions: tuple[Region, ...],
+    reference: str = "GRCh38",
+    metrics: list[str] = ["sequniq-normwalk"],
+    columnar: bool = False,
+    log: logging.Logger = None,
+    backend: str = "sqlite",
+    partial_sums: bool = False,
+) -> list[tuple[Optional[list], Optional[Exception]]]:
+    """
+    Compute complexity scores for several regions on the same contig of a GBZ
+    file
+
+    The reference path spanning all of the regions is indexed once, so that
+    each region can be sliced out of it without another lookup in the database.
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to the GBZ file
+    regions : tuple[Region, ...]
+        The regions to process. They must all be on the same contig
+    reference : str, optional
+        Sample ID of reference
+    metrics : list[str], optional
+        Which metrics to compute
+    columnar : bool, optional
+        Whether to store nodes in an array-backed ColumnarNodeTable
+    log : logging.Logger, optional
+        Logger object
+    backend : str, optional
+        How to extract the regions. Must be "sqlite"
+    partial_sums : bool, optional
+        Whether to output the sums from which the metrics are computed instead
+
+    Returns
+    -------
+    list[tuple[Optional[list], Optional[Exception]]]
+        For each region, the columns of its output line (or None if it failed)
+        and the exception raised while processing it (or None if it succeeded)
+    """
+    span = Region(
+        regions[0].chrom,
+        min(region.start for region in regions),
+        max(region.end for region in regions),
+    )
+    with profiler.stage("extract", span):
+        gbz.get_gbzbase(graph_file).index_reference(reference, span)
+    results = []
+    for region in regions:
+        try:
+            items = process_region(
+                graph_file,
+                region,
+                reference,
+                metrics,
+                columnar,
+                log,
+                backend,
+                partial_sums,
+            )
+            results.append((items, None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def _iter_batch_results(
+    batches: Iterable[tuple[Region, ...]],
+    worker: Callable[[tuple[Region, ...]], list],
+    threads: int = 1,
+) -> Iterator[tuple[Region, Any, Optional[Exception]]]:
+    """
+    Like iter_region_results(), but for a worker that processes batches of
+    regions, like process_contig()
+    """
+    for batch, results, error in iter_region_results(batches, worker, threads):
+        if error is not None:
+            results = [(None, error)] * len(batch)
+        for region, (items, region_error) in zip(batch, results):
+            yield region, items, region_error
+
+
+def iter_region_results(
+    regions: Iterable[Region],
+    worker: Callable[[Region], Any],
+    threads: int = 1,
+    max_pending: int = None,
+) -> Iterator[tuple[Region, Any, Optional[Exception]]]:
+    """
+    Apply a function to each region, possibly in parallel, and yield the results
+    in the same order as the regions
+
+    When more than one thread is requested, regions are processed by a pool of
+    worker processes. At most max_pending regions are in flight at any time, so
+    results that finish early wait in a bounded buffer until their turn comes.
+    If a Profiler is active, the stages recorded in the workers are added to it.
+
+    Parameters
+    ----------
+    regions : Iterable[Region]
+        The regions to process
+    worker : Callable[[Region], Any]
+        A picklable function to call on each region
+    threads : int, optional
+        The number of worker processes to use
+    max_pending : int, optional
+        The maximum number of regions to process at once. Defaults to four times
+        the number of threads
+
+    Yields
+    ------
+    tuple[Region, Any, Optional[Exception]]
+        Each region, the return value of the worker (or None if it failed), and
+        the exception raised by the worker (or None if it succeeded)
+    """
+    if threads <= 1:
+        for region in regions:
+            try:
+                yield region, worker(region), None
+            except Exception as e:
+                yield region, None, e
+        return
+    if max_pending is None:
+        max_pending = 4 * threads
+    active = profiler.get_profiler()
+    if active is not None:
+        worker = partial(profiler.call_profiled, worker)
+    regions = iter(regions)
+    with ProcessPoolExecutor(max_workers=threads) as pool:
+        pending = deque(
+            (region, pool.submit(worker, region))
+            for region in islice(regions, max_pending)
+        )
+        while pending:
+            region, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+                if active is not None:
+                    result, records = result
+                    active.records.extend(records)
+            except Exception as e:
+                result, error = None, e
+            for next_region in islice(regions, 1):
+                pending.append((next_region, pool.submit(worker, next_region)))
+            yield region, result, error
+
+
+def compute_complexities(
+    node_table: gutils.NodeTable, metrics: list[str]
+) -> list[Optional[float]]:
+    """
+    Compute several complexity metrics for a node table at once
+
+    The shared numerator, sum_n len(n)*p_n*(1-p_n), is computed a single time
+    from arrays of node lengths and sample counts and then normalized for each
+    of the requested metrics. See compute_complexity() for a description of the
+    metrics.
+
+    Parameters
+    ----------
+    node_table : graph_utils.NodeTable
+       Stores info on lengths/walks through each node
+    metrics : list[str]
+       Which metrics to compute
+
+    Returns
+    -------
+    complexities : list[float]
+       Complexity scores, in the same order as the metrics. The scores are None
+       if there are no walks through the node table
+
+    Raises
+    ------
+    ValueError
+       If invalid metric specified
+    """
+    for metric in metrics:
+        if metric not in AVAILABLE_METRICS:
+            raise ValueError(f"Invalid metric {metric}")
+    if node_table.numwalks == 0:
+        return [None] * len(metrics)
+    lengths = node_table.get_node_lengths()
+    p = node_table.get_node_counts() / node_table.numwalks
+    numerator = float(np.sum(lengths * p * (1 - p)))
+    complexities = []
+    for metric in metrics:
+        if metric == "sequniq-normwalk":
+            complexities.append(numerator / node_table.get_mean_walk_length())
+        elif metric == "sequniq-normnode":
+            mean_node_length = float(np.mean(lengths)) if len(lengths) else np.nan
+            complexities.append(numerator / mean_node_length)
+    return complexities
 
 
 def compute_complexity(node_table: gutils.NodeTable, metric: str) -> Optional[float]:
@@ -187,19 +1448,4 @@ def compute_complexity(node_table: gutils.NodeTable, metric: str) -> Optional[fl
     ValueError
        If invalid metric specified
     """
-    if node_table.numwalks == 0:
-        return None
-    complexity = 0
-    # Add up value for each node
-    if metric in ("sequniq-normwalk", "sequniq-normnode"):
-        for n in node_table.nodes.keys():
-            length = node_table.nodes[n].length
-            p = len(node_table.nodes[n].samples) / node_table.numwalks
-            complexity += length * p * (1 - p)
-        # Normalize
-        if metric == "sequniq-normwalk":
-            complexity = complexity / node_table.get_mean_walk_length()
-        elif metric == "sequniq-normnode":
-            complexity = complexity / node_table.get_mean_node_length()
-        return complexity
-    raise ValueError(f"Invalid metric {metric}")
+    return compute_complexities(node_table, [metric])[0]
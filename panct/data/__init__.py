@@ -1,3 +1,3 @@
 from .data import Data
-from .walks import Walks
+from .walks import Walks, ColumnarWalks
 from .regions import Region, Regions
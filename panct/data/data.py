@@ -1,4 +1,5 @@
 from __future__ import annotations
+import io
 import os
 import gzip
 from pathlib import Path
@@ -7,6 +8,8 @@ from abc import ABC, abstractmethod
 from logging import getLogger, Logger
 from typing import Iterator, IO, Any, Type
 
+from ..bgzf import BGZFReader, is_bgzf
+
 
 class Data(ABC):
     """
@@ -59,7 +62,9 @@ class Data(ABC):
     #     pass
 
     @staticmethod
-    def hook_compressed(filename: Path | str, mode: str) -> gzip.GzipFile | IO[Any]:
+    def hook_compressed(
+        filename: Path | str, mode: str, threads: int = 1
+    ) -> gzip.GzipFile | IO[Any]:
         """
         A utility to help open files regardless of their compression
 
@@ -72,6 +77,8 @@ class Data(ABC):
             The path to the file
         mode : str
             Either 'r' for read or 'w' for write
+        threads : int, optional
+            The number of threads to use when decompressing a BGZF file for reading
 
         Returns
         -------
@@ -82,6 +89,9 @@ class Data(ABC):
             mode += "t"
         ext = os.path.splitext(filename)[1]
         if ext == ".gz":
+            if "r" in mode and threads > 1 and is_bgzf(filename):
+                f = io.BufferedReader(BGZFReader(filename, threads), 1 << 20)
+                return f if "b" in mode else io.TextIOWrapper(f)
             return gzip.open(filename, mode)
         else:
             return open(filename, mode)
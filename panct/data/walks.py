@@ -1,17 +1,47 @@
 """
 Utilities for processing .walk files
+
+Each line of a .walk file describes the haplotypes passing through a node. The
+first column is empty, so that the file can be indexed by tabix with the node ID
+(in the second column) as the position.
+
+In version 1 of the format, the remaining columns hold the "sample:haplotype"
+label of every visit to the node::
+
+    \t1\tGRCh38:0\tsamp1:0\tsamp1:1\tsamp2:1
+
+Version 2 starts with a header that assigns an integer ID to each label, and
+each line holds the sorted IDs of the visits as comma-separated differences
+from the previous ID (so a repeated visit is a 0). An optional header line
+records the number of W lines of each haplotype in the GFA::
+
+    ##walk-version=2
+    #labels\tGRCh38:0\tsamp1:0\tsamp1:1\tsamp2:1
+    #walks\t1\t1\t1\t1
+    \t1\t0,1,1,1
 """
 
 from __future__ import annotations
-from typing import Type
+from typing import Type, Iterable, Iterator, Mapping
 from pathlib import Path
 from logging import Logger
-from collections import Counter
+from itertools import accumulate, chain
+from collections import Counter, OrderedDict
 
+import numpy as np
 from pysam import TabixFile
 
 from .data import Data
 
+# the first line of a version 2 .walk file
+WALK_V2_HEADER = "##walk-version=2"
+# the prefix of the header line listing the labels in a version 2 .walk file
+LABELS_PREFIX = "#labels"
+# the prefix of the header line with the number of W lines of each haplotype
+WALKS_PREFIX = "#walks"
+# the default number of blocks of nodes to keep in memory in read_many()
+DEFAULT_CACHE_BLOCKS = 16
+
 
 class Walks(Data):
     """
@@ -42,7 +72,7 @@ class Walks(Data):
         Parameters
         ----------
         fname: Path | str
-            A .walk file of walks
+            A .walk file of walks, in either version of the format
         region: str, optional
             A region string denoting the start and end node IDs in the form
             of f'{start}-{end}'
@@ -54,8 +84,121 @@ class Walks(Data):
         Walks
             A Walks object loaded with a bunch of Node objects
         """
-        nodes = {}
-        parse_samp = lambda samp: (samp[0], int(samp[1]))
+        return cls._from_lines(*cls._read_lines(fname, region), log)
+
+    @classmethod
+    def read_many(
+        cls: Type[Walks],
+        fname: Path | str,
+        regions: Iterable[str],
+        log: Logger = None,
+        cache_size: int = DEFAULT_CACHE_BLOCKS,
+    ) -> Iterator[Walks]:
+        """
+        Extract walks for many ranges of nodes from a .walk file
+
+        If the file is indexed by tabix, it is opened only once. Overlapping and
+        adjacent ranges are merged into blocks, and each block is fetched and
+        parsed once, as long as it is still among the cache_size blocks that
+        were used most recently. Otherwise, the whole file is read once.
+
+        Parameters
+        ----------
+        fname: Path | str
+            A .walk file of walks, in either version of the format
+        regions: Iterable[str]
+            Region strings denoting the start and end node IDs of each range in
+            the form of f'{start}-{end}'
+        log: Logger, optional
+            A Logger object to use for debugging statements
+        cache_size: int, optional
+            The maximum number of parsed blocks to keep in memory
+
+        Yields
+        ------
+        Walks
+            The walks through each range, in the order of the regions
+        """
+        return _read_many(cls, fname, regions, log, cache_size)
+
+    @classmethod
+    def _from_lines(
+        cls: Type[Walks], header: list[str], lines: list[str], log: Logger = None
+    ) -> Walks:
+        """
+        Create a Walks object from the header and lines of a .walk file
+        """
+        parse_line = cls._get_line_parser(header)
+        nodes = dict(parse_line(line) for line in lines)
+        return cls(nodes, log)
+
+    def get_range(self, start: int = None, end: int = None) -> Walks:
+        """
+        Get the walks through a range of nodes
+
+        Parameters
+        ----------
+        start : int, optional
+            The smallest node ID to include. Defaults to the first node
+        end : int, optional
+            The largest node ID to include. Defaults to the last node
+
+        Returns
+        -------
+        Walks
+            The walks through the nodes in [start, end]
+        """
+        start = -float("inf") if start is None else start
+        end = float("inf") if end is None else end
+        nodes = {node: data for node, data in self.data.items() if start <= node <= end}
+        return self.__class__(nodes, self.log)
+
+    @staticmethod
+    def _parse_range(region: str = None) -> tuple[int | float, int | float]:
+        """
+        Split a region string into its start and end node IDs
+
+        Parameters
+        ----------
+        region: str, optional
+            A region string in the form of f'{start}-{end}', where either
+            coordinate may be omitted
+
+        Returns
+        -------
+        tuple[int | float, int | float]
+            The start and end node IDs, which are infinite if omitted
+        """
+        start, end = -float("inf"), float("inf")
+        if region is not None:
+            start, end = tuple(
+                (int(coord) if coord != "" else float("inf"))
+                for coord in region.split("-")
+            )
+            if start == float("inf"):
+                start = -start
+        return start, end
+
+    @classmethod
+    def _read_lines(
+        cls, fname: Path | str, region: str = None
+    ) -> tuple[list[str], list[str]]:
+        """
+        Read the header and the lines of a .walk file within a range of nodes
+
+        Parameters
+        ----------
+        fname: Path | str
+            A .walk file of walks
+        region: str, optional
+            A region string denoting the start and end node IDs in the form
+            of f'{start}-{end}'
+
+        Returns
+        -------
+        tuple[list[str], list[str]]
+            The header lines and the lines of the nodes within the region
+        """
         # Try to read the file with tabix
         if Path(fname).suffix == ".gz" and region is not None:
             # preprocess the region into a tabix region string
@@ -63,34 +206,526 @@ class Walks(Data):
             # iterate over the lines using tabix
             try:
                 with TabixFile(filename=str(fname)) as f:
-                    for line in f.fetch(region=region_str):
-                        samples = line.strip().split("\t")
-                        node = int(samples.pop(0))
-
-                        nodes[node] = Counter(
-                            parse_samp(samp.rsplit(":", 1)) for samp in samples
-                        )
-                return cls(nodes, log)
+                    return list(f.header), list(f.fetch(region=region_str))
             except ValueError:
                 pass
         # If we couldn't parse with tabix, then fall back to slow loading
         # First, split the region into start and end coordinates
-        start, end = -float("inf"), float("inf")
-        if region is not None:
-            start, end = tuple(
-                (int(coord) if coord != "" else float("inf"))
-                for coord in region.split("-")
-            )
-            if start == float("inf"):
-                start = -start
+        start, end = cls._parse_range(region)
         # Now iterate over the lines
+        header, lines = [], []
         with cls.hook_compressed(fname, "r") as f:
-            for line in f:
-                samples = str(line.strip())
-                node = int(samples.split("\t", maxsplit=1)[0])
-                if node < start or node > end:
-                    continue
-                nodes[node] = Counter(
-                    parse_samp(samp.rsplit(":", 1)) for samp in samples.split("\t")[1:]
+            line = f.readline()
+            while line.startswith("#"):
+                header.append(line)
+                line = f.readline()
+            while line:
+                node = int(line.lstrip("\t").split("\t", maxsplit=1)[0])
+                if start <= node <= end:
+                    lines.append(line)
+                line = f.readline()
+        return header, lines
+
+    @staticmethod
+    def _get_line_parser(header: Iterable[str]):
+        """
+        Create a function that parses a line of a .walk file
+
+        Parameters
+        ----------
+        header : Iterable[str]
+            The header lines of the file, if any
+
+        Returns
+        -------
+        Callable[[str], tuple[int, Counter[tuple[str, int]]]]
+            A function that returns the node ID and the visits of a line
+
+        Raises
+        ------
+        ValueError
+            If the header declares an unsupported version of the format
+        """
+        labels = Walks._get_labels(header)
+        if labels is None:
+            parse_samp = lambda samp: (samp[0], int(samp[1]))
+
+            def parse_v1(line: str) -> tuple[int, Counter[tuple[str, int]]]:
+                samples = line.strip().split("\t")
+                node = int(samples.pop(0))
+                return node, Counter(
+                    parse_samp(samp.rsplit(":", 1)) for samp in samples
                 )
-        return cls(nodes, log)
+
+            return parse_v1
+
+        def parse_v2(line: str) -> tuple[int, Counter[tuple[str, int]]]:
+            _, node, ids = line.rstrip("\n").split("\t")
+            counts = Counter(accumulate(map(int, ids.split(","))))
+            return int(node), Counter({labels[i]: count for i, count in counts.items()})
+
+        return parse_v2
+
+    @staticmethod
+    def _get_labels(header: Iterable[str]) -> list[tuple[str, int]] | None:
+        """
+        Get the haplotype labels from the header of a .walk file
+
+        Parameters
+        ----------
+        header : Iterable[str]
+            The header lines of the file, if any
+
+        Returns
+        -------
+        list[tuple[str, int]] | None
+            The (sample, haplotype) label of each haplotype ID in a version 2
+            file, or None for a version 1 file
+
+        Raises
+        ------
+        ValueError
+            If the header declares an unsupported version of the format
+        """
+        header = [line.rstrip("\n") for line in header]
+        if not header:
+            return None
+        if header[0] != WALK_V2_HEADER:
+            raise ValueError(f"Unsupported .walk file version: {header[0]}")
+        labels = []
+        for line in header:
+            if line.startswith(LABELS_PREFIX + "\t"):
+                labels = [label.rsplit(":", 1) for label in line.split("\t")[1:]]
+        return [(sample, int(hap)) for sample, hap in labels]
+
+    @staticmethod
+    def read_walk_counts(fname: Path | str) -> dict[tuple[str, int], int] | None:
+        """
+        Read the number of W lines of each haplotype from the header of a .walk
+        file
+
+        Parameters
+        ----------
+        fname: Path | str
+            A .walk file of walks, in either version of the format
+
+        Returns
+        -------
+        dict[tuple[str, int], int] | None
+            The number of W lines of each (sample, haplotype) label, or None if
+            the header doesn't record them, as in version 1 files and in files
+            written by older versions of panCT
+
+        Raises
+        ------
+        ValueError
+            If the header is invalid
+        """
+        header = []
+        with Data.hook_compressed(fname, "r") as f:
+            for line in f:
+                if not line.startswith("#"):
+                    break
+                header.append(line.rstrip("\n"))
+        labels = Walks._get_labels(header)
+        if labels is None:
+            return None
+        for line in header:
+            if line.startswith(WALKS_PREFIX + "\t"):
+                counts = [int(count) for count in line.split("\t")[1:]]
+                if len(counts) != len(labels):
+                    raise ValueError("The number of walks doesn't match the labels")
+                return dict(zip(labels, counts))
+        return None
+
+
+class ColumnarWalks(Data):
+    """
+    Store walks from a .walk file in arrays
+
+    The node IDs are stored in a single sorted array, and the haplotypes that
+    visit each node are stored in compressed sparse row (CSR) form: the
+    haplotypes of the node at index i are haps[indptr[i]:indptr[i+1]], sorted,
+    and each of them visits the node counts[indptr[i]:indptr[i+1]] times.
+
+    Attributes
+    ----------
+    data : Mapping[int, Counter[tuple[str, int]]]
+        A read-only view of the walks with the same form as Walks.data, which
+        creates a Counter on access
+    nodes : np.ndarray
+        The sorted node IDs
+    indptr : np.ndarray
+        The offsets of each node's haplotypes in haps and counts
+    haps : np.ndarray
+        The index of each haplotype (into labels) that visits each node
+    counts : np.ndarray
+        The number of times each haplotype visits each node
+    labels : list[tuple[str, int]]
+        The (sample label, haplotype ID) of each haplotype index
+    log: Logger
+        A logging instance for recording debug statements.
+
+    Methods
+    -------
+    get_range(start, end)
+        Get the walks through a range of nodes
+    get_node(node)
+        Get the haplotypes that visit a node
+    get_haplotype(hap)
+        Get the nodes visited by a haplotype
+    """
+
+    def __init__(
+        self,
+        nodes: np.ndarray,
+        indptr: np.ndarray,
+        haps: np.ndarray,
+        counts: np.ndarray,
+        labels: list[tuple[str, int]],
+        log: Logger = None,
+    ):
+        super().__init__(log=log)
+        self.nodes = nodes
+        self.indptr = indptr
+        self.haps = haps
+        self.counts = counts
+        self.labels = labels
+        self.data = _WalkCounters(self)
+        self._by_hap = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def read(
+        cls: Type[ColumnarWalks],
+        fname: Path | str,
+        region: str = None,
+        log: Logger = None,
+    ) -> ColumnarWalks:
+        """
+        Extract walks from a .walk file
+
+        The lines of the file are parsed all at once, so no Python objects are
+        created for each visit to a node. Version 2 files are much faster to
+        read than version 1 files.
+
+        Parameters
+        ----------
+        fname: Path | str
+            A .walk file of walks, in either version of the format
+        region: str, optional
+            A region string denoting the start and end node IDs in the form
+            of f'{start}-{end}'
+        log: Logger, optional
+            A Logger object to use for debugging statements
+
+        Returns
+        -------
+        ColumnarWalks
+            A ColumnarWalks object loaded with the walks of each node
+        """
+        return cls._from_lines(*Walks._read_lines(fname, region), log)
+
+    @classmethod
+    def read_many(
+        cls: Type[ColumnarWalks],
+        fname: Path | str,
+        regions: Iterable[str],
+        log: Logger = None,
+        cache_size: int = DEFAULT_CACHE_BLOCKS,
+    ) -> Iterator[ColumnarWalks]:
+        """
+        Extract walks for many ranges of nodes from a .walk file
+
+        See Walks.read_many() for details. The arrays of each ColumnarWalks
+        object are views into the arrays of its block.
+
+        Parameters
+        ----------
+        fname: Path | str
+            A .walk file of walks, in either version of the format
+        regions: Iterable[str]
+            Region strings denoting the start and end node IDs of each range in
+            the form of f'{start}-{end}'
+        log: Logger, optional
+            A Logger object to use for debugging statements
+        cache_size: int, optional
+            The maximum number of parsed blocks to keep in memory
+
+        Yields
+        ------
+        ColumnarWalks
+            The walks through each range, in the order of the regions
+        """
+        return _read_many(cls, fname, regions, log, cache_size)
+
+    @classmethod
+    def _from_lines(
+        cls: Type[ColumnarWalks],
+        header: list[str],
+        lines: list[str],
+        log: Logger = None,
+    ) -> ColumnarWalks:
+        """
+        Create a ColumnarWalks object from the header and lines of a .walk file
+        """
+        labels = Walks._get_labels(header)
+        # sort the lines by node, in case the file wasn't created by 'panct walks'
+        nodes = np.array(
+            [line.lstrip("\t").split("\t", 1)[0] for line in lines], dtype=np.int64
+        )
+        if np.any(nodes[1:] < nodes[:-1]):
+            order = np.argsort(nodes, kind="stable")
+            nodes, lines = nodes[order], [lines[i] for i in order]
+        if labels is None:
+            lengths, haps, labels = cls._parse_v1(lines)
+        else:
+            lengths, haps = cls._parse_v2(lines)
+        # the haplotypes of each node are sorted, so each run of the same
+        # haplotype within a line is one haplotype that visits the node
+        starts = np.cumsum(lengths) - lengths
+        is_new = np.ones(len(haps), dtype=bool)
+        is_new[1:] = haps[1:] != haps[:-1]
+        is_new[starts[lengths > 0]] = True
+        firsts = np.flatnonzero(is_new)
+        counts = np.diff(np.append(firsts, len(haps))).astype(np.int32)
+        num_new = np.zeros(len(haps) + 1, dtype=np.int64)
+        np.cumsum(is_new, out=num_new[1:])
+        indptr = num_new[np.append(starts, len(haps))]
+        return cls(nodes, indptr, haps[firsts], counts, labels, log)
+
+    @staticmethod
+    def _parse_v1(
+        lines: list[str],
+    ) -> tuple[np.ndarray, np.ndarray, list[tuple[str, int]]]:
+        """
+        Parse the lines of a version 1 .walk file
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, list[tuple[str, int]]]
+            The number of visits in each line, the sorted haplotype index of
+            each visit, and the label of each haplotype index
+        """
+        label_index = {}
+        lengths = np.empty(len(lines), dtype=np.int64)
+        haps = []
+        for i, line in enumerate(lines):
+            samples = line.strip().split("\t")[1:]
+            lengths[i] = len(samples)
+            haps.extend(
+                label_index.setdefault(samp, len(label_index)) for samp in samples
+            )
+        haps = np.array(haps, dtype=np.int32)
+        # sort the haplotypes within each line
+        rows = np.repeat(np.arange(len(lines), dtype=np.int64), lengths)
+        haps = np.sort(rows * max(len(label_index), 1) + haps) % max(
+            len(label_index), 1
+        )
+        labels = [label.rsplit(":", 1) for label in label_index]
+        return (
+            lengths,
+            haps.astype(np.int32),
+            [(sample, int(hap)) for sample, hap in labels],
+        )
+
+    @staticmethod
+    def _parse_v2(lines: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Parse the lines of a version 2 .walk file
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The number of visits in each line and the sorted haplotype index of
+            each visit
+
+        Raises
+        ------
+        ValueError
+            If the haplotype IDs are not sorted integers
+        """
+        try:
+            ids = [line.rstrip("\n").rsplit("\t", 1)[1] for line in lines]
+        except IndexError:
+            raise ValueError("Each line must have a node ID and haplotype IDs")
+        lengths = np.array([field.count(",") + 1 for field in ids], dtype=np.int64)
+        try:
+            deltas = np.array(",".join(ids).split(","), dtype=np.int64)
+        except ValueError:
+            raise ValueError("Haplotype IDs must be integers")
+        del ids
+        # undo the delta coding within each line
+        starts = np.cumsum(lengths) - lengths
+        if np.any(np.delete(deltas, starts) < 0):
+            raise ValueError("Haplotype IDs must be sorted")
+        haps = np.cumsum(deltas)
+        haps -= np.repeat(haps[starts] - deltas[starts], lengths)
+        return lengths, haps.astype(np.int32)
+
+    def get_range(self, start: int = None, end: int = None) -> ColumnarWalks:
+        """
+        Get the walks through a range of nodes
+
+        The arrays of the new object are views into the arrays of this one.
+
+        Parameters
+        ----------
+        start : int, optional
+            The smallest node ID to include. Defaults to the first node
+        end : int, optional
+            The largest node ID to include. Defaults to the last node
+
+        Returns
+        -------
+        ColumnarWalks
+            The walks through the nodes in [start, end]
+        """
+        lo = 0 if start is None else np.searchsorted(self.nodes, start, "left")
+        hi = len(self) if end is None else np.searchsorted(self.nodes, end, "right")
+        lo, hi = int(lo), int(max(lo, hi))
+        first, last = int(self.indptr[lo]), int(self.indptr[hi])
+        return ColumnarWalks(
+            self.nodes[lo:hi],
+            self.indptr[lo : hi + 1] - first,
+            self.haps[first:last],
+            self.counts[first:last],
+            self.labels,
+            self.log,
+        )
+
+    def get_node(self, node: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the haplotypes that visit a node
+
+        Parameters
+        ----------
+        node : int
+            The node ID
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The index of each haplotype and the number of times it visits the
+            node
+
+        Raises
+        ------
+        KeyError
+            If the node is not in the walks
+        """
+        idx = int(np.searchsorted(self.nodes, node))
+        if idx == len(self.nodes) or self.nodes[idx] != node:
+            raise KeyError(node)
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        return self.haps[start:end], self.counts[start:end]
+
+    def get_haplotype(self, hap: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the nodes visited by a haplotype
+
+        The first call creates an index of the visits by haplotype, which makes
+        later calls fast.
+
+        Parameters
+        ----------
+        hap : int
+            The index of the haplotype in labels
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The sorted IDs of the nodes visited by the haplotype and the number
+            of times it visits each one
+        """
+        if self._by_hap is None:
+            order = np.argsort(self.haps, kind="stable")
+            indptr = np.zeros(len(self.labels) + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.haps, minlength=len(self.labels)), out=indptr[1:]
+            )
+            rows = np.repeat(np.arange(len(self.nodes)), np.diff(self.indptr))
+            self._by_hap = (indptr, self.nodes[rows[order]], self.counts[order])
+        indptr, nodes, counts = self._by_hap
+        start, end = indptr[hap], indptr[hap + 1]
+        return nodes[start:end], counts[start:end]
+
+
+class _WalkCounters(Mapping):
+    """
+    A read-only mapping of node IDs to Counters for a ColumnarWalks object
+    """
+
+    def __init__(self, walks: ColumnarWalks):
+        self.walks = walks
+
+    def __getitem__(self, node: int) -> Counter[tuple[str, int]]:
+        haps, counts = self.walks.get_node(node)
+        labels = self.walks.labels
+        return Counter(
+            {labels[hap]: count for hap, count in zip(haps.tolist(), counts.tolist())}
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.walks.nodes.tolist())
+
+    def __len__(self) -> int:
+        return len(self.walks.nodes)
+
+
+def _read_many(
+    cls: Type[Walks] | Type[ColumnarWalks],
+    fname: Path | str,
+    regions: Iterable[str],
+    log: Logger = None,
+    cache_size: int = DEFAULT_CACHE_BLOCKS,
+) -> Iterator[Walks] | Iterator[ColumnarWalks]:
+    """
+    Extract walks for many ranges of nodes from a .walk file
+
+    See Walks.read_many() for details
+    """
+    ranges = [Walks._parse_range(region) for region in regions]
+    # merge the ranges that overlap or touch into blocks
+    blocks, block_index = [], [0] * len(ranges)
+    for i in sorted(range(len(ranges)), key=ranges.__getitem__):
+        start, end = ranges[i]
+        if blocks and start <= blocks[-1][1] + 1:
+            blocks[-1][1] = max(blocks[-1][1], end)
+        else:
+            blocks.append([start, end])
+        block_index[i] = len(blocks) - 1
+    tabix = None
+    if Path(fname).suffix == ".gz":
+        try:
+            tabix = TabixFile(filename=str(fname))
+        except (OSError, ValueError):
+            pass
+    if tabix is None:
+        # If we can't use tabix, then read the whole file once
+        walks = cls.read(fname, log=log)
+        for start, end in ranges:
+            yield walks.get_range(start, end)
+        return
+    cache = OrderedDict()
+    with tabix:
+        header = list(tabix.header)
+        for (start, end), index in zip(ranges, block_index):
+            if index in cache:
+                cache.move_to_end(index)
+            else:
+                block_start, block_end = blocks[index]
+                region_str = f":{max(block_start, 0)}-"
+                if block_end != float("inf"):
+                    region_str += str(block_end)
+                try:
+                    lines = list(tabix.fetch(region=region_str))
+                except ValueError:
+                    # the file has no nodes
+                    lines = []
+                cache[index] = cls._from_lines(header, lines, log)
+                if len(cache) > cache_size:
+                    cache.popitem(last=False)
+            yield cache[index].get_range(start, end)
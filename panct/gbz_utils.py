@@ -2,23 +2,33 @@
 Utilities for dealing with GBZ files
 """
 
+from __future__ import annotations
 import os
+import heapq
+import sqlite3
 import logging
 import tempfile
 import subprocess
+from array import array
 from shutil import which
 from pathlib import Path
 from typing import Optional
+from collections import Counter, OrderedDict
+
+import numpy as np
 
 from .data import Region
+from . import profiler
 from . import graph_utils as gutils
 
+# ways of extracting regions from a GBZ file: "query" runs gbz-base's query
+# command, while "sqlite" reads the GBZ-base database in-process
+GBZ_BACKENDS = ["query", "sqlite"]
 
-def extract_region_from_gbz(
-    gbz_file: Path, region: Region, reference: str
-) -> Optional[Path]:
+
+def get_query_command(gbz_file: Path, region: Region, reference: str) -> list[str]:
     """
-    Extract GFA for a region from an indexed GBZ file
+    Get the gbz-base query command that extracts a region as GFA
 
     Parameters
     ----------
@@ -31,11 +41,10 @@ def extract_region_from_gbz(
 
     Returns
     -------
-    gfa_file : Path
-        Path to GFA file
+    list[str]
+        The command and its arguments
     """
-    tmpfile = tempfile.NamedTemporaryFile(delete=False)
-    cmd = [
+    return [
         "query",
         "--sample",
         reference,
@@ -45,8 +54,38 @@ def extract_region_from_gbz(
         str(region.start) + ".." + str(region.end),
         str(gbz_file) + ".db",
     ]
+
+
+def extract_region_from_gbz(
+    gbz_file: Path, region: Region, reference: str
+) -> Optional[Path]:
+    """
+    Extract GFA for a region from an indexed GBZ file
+
+    The GFA is written to a temporary file, which the caller is responsible for
+    deleting. Use load_node_table_from_gbz() to parse the region without writing
+    it to disk.
+
+    Parameters
+    ----------
+    gbz_file : Path
+        Path to GBZ file. Must be indexed
+    region : Region
+        Region to extract
+    reference : str
+        Sample to use as reference
+
+    Returns
+    -------
+    gfa_file : Path
+        Path to GFA file
+    """
+    tmpfile = tempfile.NamedTemporaryFile(delete=False)
+    cmd = get_query_command(gbz_file, region, reference)
     proc = subprocess.run(cmd, stdout=tmpfile)
+    tmpfile.close()
     if proc.returncode != 0:
+        os.unlink(tmpfile.name)
         return None
     else:
         return Path(tmpfile.name)
@@ -85,6 +124,8 @@ def index_gbz(gbz_file: Path):
     passed : bool
         True if we were able to create the .gbz.db file
     """
+    if which("gbz2db") is None:
+        return False
     cmd = ["gbz2db", gbz_file]
     proc = subprocess.run(cmd, stdout=subprocess.PIPE)
     return proc.returncode == 0
@@ -112,17 +153,27 @@ def check_gbzfile(gbz_file: Path, log: logging.Logger):
     if not os.path.exists(str(gbz_file) + ".db"):
         log.info(f"{gbz_file}.db does not exist. Attempting to create")
         if not index_gbz(gbz_file):
-            log.critical("Failed to create GBZ index")
+            log.critical("Failed to create GBZ index. Is gbz2db installed?")
             return False
     return True
 
 
 def load_node_table_from_gbz(
-    gbz_file: Path, region: Region, reference: str
+    gbz_file: Path,
+    region: Region,
+    reference: str,
+    columnar: bool = False,
+    log: logging.Logger = None,
+    backend: str = "query",
 ) -> gutils.NodeTable:
     """
     Load a NodeTable for a certain region from a GBZ file
 
+    By default, the region is extracted with gbz-base's query command, whose
+    output is parsed in a single pass as it is produced, without being written
+    to a temporary file. With the opt-in sqlite backend, the region is instead
+    read directly from the GBZ-base database in-process with a GBZBase reader.
+
     Parameters
     ----------
     gbz_file : Path
@@ -131,13 +182,632 @@ def load_node_table_from_gbz(
         Region to load
     reference : str
         ID of reference sequence
+    columnar : bool, optional
+        Whether to return an array-backed ColumnarNodeTable
+    log : logging.Logger, optional
+        A logger to which to report failures of the query command
+    backend : str, optional
+        How to extract the region: "query" (the default) or "sqlite". See
+        GBZ_BACKENDS
 
     Returns
     -------
     node_table : NodeTable
-        NodeTable oject for the region
+        NodeTable oject for the region. It will be empty if the query failed
+
+    Raises
+    ------
+    ValueError
+        If the sqlite backend can't find the region in the reference
+    """
+    if log is None:
+        log = logging.getLogger("panct")
+    if backend == "sqlite":
+        return get_gbzbase(gbz_file).load_node_table(region, reference, columnar)
+    table_class = gutils.ColumnarNodeTable if columnar else gutils.NodeTable
+    node_table = table_class()
+    cmd = get_query_command(gbz_file, region, reference)
+    # write stderr to a file so that the process can't block on a full pipe
+    # the table is built as the region is extracted, so both are one stage
+    with tempfile.TemporaryFile() as stderr, profiler.stage("extract", region):
+        with subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr, text=True
+        ) as proc:
+            try:
+                node_table.load_from_gfa_stream(proc.stdout, [reference])
+            except BaseException:
+                proc.kill()
+                raise
+            # drain anything the parser didn't consume before checking the exit code
+            proc.stdout.read()
+            returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode(errors="replace").strip()
+            log.error(f"{' '.join(cmd)} failed with exit code {returncode}: {message}")
+            return table_class()
+    return node_table
+
+
+def _read_bytecode(data: bytes, pos: int) -> tuple[int, int]:
+    """
+    Decode a variable-length integer, 7 bits per byte with the high bit set on
+    every byte except the last
+
+    Returns
+    -------
+    tuple[int, int]
+        The value and the position of the next byte
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _sequence_length(sequence: bytes) -> int:
     """
-    gfa_file = extract_region_from_gbz(gbz_file, region, reference)
-    if gfa_file is None:
-        return gutils.NodeTable()
-    return gutils.NodeTable(gfa_file=gfa_file, exclude_samples=[reference])
+    Get the length of a sequence packed by GBZ-base, which stores three bases
+    per byte as base-6 digits and pads the last byte with zeros
+    """
+    if not sequence:
+        return 0
+    last = sequence[-1]
+    return 3 * (len(sequence) - 1) + (1 if last < 6 else 2 if last < 36 else 3)
+
+
+class GBWTRecord:
+    """
+    A node of the GBWT, decoded from a row of the Nodes table of a GBZ-base
+    database
+
+    Each visit of a haplotype to this node (in this orientation) has an offset.
+    The successor of the visit at offset i is the visit at offset
+    next_offsets[i] of node next_handles[i]. A next handle of 0 marks the end of
+    a path.
+
+    Attributes
+    ----------
+    handle : int
+        The GBWT handle of the node: 2 * node ID + (1 if reverse else 0)
+    length : int
+        The length of the sequence of the node
+    successors : list[int]
+        The handles of the nodes that follow this one, excluding the end marker
+    next_handles : list[int]
+        The handle of the next node for each visit
+    next_offsets : list[int]
+        The offset of the next visit for each visit
+    """
+
+    def __init__(self, handle: int, edges: bytes, bwt: bytes, sequence: bytes):
+        self.handle = handle
+        self.length = _sequence_length(sequence)
+        # the edges are stored as the outdegree followed by (handle delta, offset)
+        sigma, pos = _read_bytecode(edges, 0)
+        edge_handles = []
+        edge_offsets = []
+        prev = 0
+        for _ in range(sigma):
+            delta, pos = _read_bytecode(edges, pos)
+            offset, pos = _read_bytecode(edges, pos)
+            prev += delta
+            edge_handles.append(prev)
+            edge_offsets.append(offset)
+        self.successors = [h for h in edge_handles if h != 0]
+        # the BWT is a run-length encoding of the rank of the next edge of each
+        # visit; short runs fit in a single byte as rank + sigma * (length - 1)
+        run_continues = 256 // sigma if 0 < sigma < 255 else 0
+        self.next_handles = []
+        self.next_offsets = []
+        pos = 0
+        while pos < len(bwt):
+            if run_continues:
+                rank, length = bwt[pos] % sigma, bwt[pos] // sigma + 1
+                pos += 1
+                if length >= run_continues:
+                    extra, pos = _read_bytecode(bwt, pos)
+                    length += extra
+            else:
+                rank, pos = _read_bytecode(bwt, pos)
+                length, pos = _read_bytecode(bwt, pos)
+                length += 1
+            offset = edge_offsets[rank]
+            self.next_handles.extend([edge_handles[rank]] * length)
+            self.next_offsets.extend(range(offset, offset + length))
+            edge_offsets[rank] += length
+
+    def __len__(self) -> int:
+        return len(self.next_handles)
+
+
+class ReferencePath:
+    """
+    The nodes visited by a stretch of a reference path, indexed by position
+
+    Attributes
+    ----------
+    reference : str
+        The sample name of the reference
+    contig : str
+        The contig of the reference path
+    positions : np.ndarray
+        The position along the contig at which each node starts, in increasing
+        order
+    handles : np.ndarray
+        The GBWT handle of each node
+    offsets : np.ndarray
+        The offset of the reference visit within each node
+    end : int
+        The position at which the last node ends
+    path_end : bool
+        Whether the last node is the end of the reference path
+    """
+
+    def __init__(
+        self,
+        reference: str,
+        contig: str,
+        positions: np.ndarray,
+        handles: np.ndarray,
+        offsets: np.ndarray,
+        end: int,
+        path_end: bool,
+    ):
+        self.reference = reference
+        self.contig = contig
+        self.positions = positions
+        self.handles = handles
+        self.offsets = offsets
+        self.end = end
+        self.path_end = path_end
+
+    def covers(self, reference: str, region: Region) -> bool:
+        """
+        Check whether a region lies within the indexed stretch of the path
+
+        A region that extends past the end of the contig is still covered, as
+        long as the rest of the contig was indexed.
+        """
+        return (
+            len(self.positions) > 0
+            and reference == self.reference
+            and region.chrom == self.contig
+            and self.positions[0] <= region.start < self.end
+            and (region.end <= self.end or self.path_end)
+        )
+
+    def slice(self, region: Region) -> tuple[list[int], tuple[int, int]]:
+        """
+        Find the reference nodes that overlap a region
+
+        Returns
+        -------
+        tuple[list[int], tuple[int, int]]
+            The IDs of the nodes and the handle and offset of the reference visit
+            to the first one
+        """
+        first = np.searchsorted(self.positions, region.start, side="right") - 1
+        last = np.searchsorted(self.positions, region.end, side="left")
+        nodes = (self.handles[first:last] // 2).tolist()
+        return nodes, (int(self.handles[first]), int(self.offsets[first]))
+
+
+class GBZBase:
+    """
+    Read regions of a pangenome graph directly from a GBZ-base SQLite database
+
+    This is an in-process alternative to gbz-base's query command. A single
+    read-only connection is kept open and decoded nodes are cached, so there is
+    no process start-up, database open, or GFA serialization for each region.
+
+    A region is extracted like query does by default: we find the nodes of the
+    reference path that overlap the region, add every node within `context` bp
+    of them, and then collect the fragments of all haplotypes passing through
+    that subgraph.
+
+    Attributes
+    ----------
+    db_file : Path
+        Path to the .gbz.db file
+    context : int
+        Extract nodes within this many bp of the region
+    cache_visits : int
+        The maximum number of haplotype visits held by the nodes kept in memory.
+        A decoded visit takes about 50 bytes. Nodes that haven't been decoded
+        yet are charged one visit per byte of their encoded BWT
+    block_size : int
+        The number of consecutive node handles read from the database at once
+    """
+
+    # sample name used for the walks of haplotype fragments
+    FRAGMENT_SAMPLE = "unknown"
+
+    def __init__(
+        self,
+        db_file: Path,
+        context: int = 100,
+        cache_visits: int = 1 << 22,
+        block_size: int = 256,
+    ):
+        self.db_file = Path(db_file)
+        self.context = context
+        self.cache_visits = cache_visits
+        self.block_size = block_size
+        self.connection = sqlite3.connect(
+            f"file:{self.db_file}?mode=ro", uri=True, check_same_thread=False
+        )
+        # records are decoded lazily, so the cache holds either a GBWTRecord or
+        # the raw row from the Nodes table
+        self._records = OrderedDict()
+        self._num_visits = 0
+        self._reference_path = None
+
+    def __enter__(self) -> GBZBase:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the database
+        """
+        self.connection.close()
+
+    def get_record(self, handle: int) -> GBWTRecord:
+        """
+        Get a decoded node of the GBWT
+
+        On a cache miss, all rows in the same block of block_size consecutive
+        handles are read with a single query, since neighboring nodes in a graph
+        usually have neighboring IDs.
+
+        Parameters
+        ----------
+        handle : int
+            The GBWT handle of the node
+
+        Returns
+        -------
+        GBWTRecord
+            The decoded node
+
+        Raises
+        ------
+        KeyError
+            If the node is not in the database
+        """
+        record = self._records.get(handle)
+        if record is None:
+            self._load_block(handle)
+            record = self._records.get(handle)
+            if record is None:
+                raise KeyError(f"Node handle {handle} is not in {self.db_file}")
+        self._records.move_to_end(handle)
+        if not isinstance(record, GBWTRecord):
+            self._num_visits -= self._count_visits(record)
+            record = GBWTRecord(handle, *record)
+            self._records[handle] = record
+            self._num_visits += self._count_visits(record)
+        self._evict()
+        return record
+
+    @staticmethod
+    def _count_visits(record: GBWTRecord | tuple) -> int:
+        """
+        Count the visits that a cached node is charged for. See cache_visits
+        """
+        if isinstance(record, GBWTRecord):
+            return len(record) + 1
+        return len(record[1]) + 1
+
+    def _evict(self):
+        """
+        Remove the least recently used nodes until they fit in cache_visits
+
+        The most recently used node is always kept, even if it doesn't fit.
+        """
+        while self._num_visits > self.cache_visits and len(self._records) > 1:
+            _, record = self._records.popitem(last=False)
+            self._num_visits -= self._count_visits(record)
+
+    def _load_block(self, handle: int):
+        """
+        Read the rows of the Nodes table in the block containing a handle
+        """
+        start = handle - handle % self.block_size
+        rows = self.connection.execute(
+            "SELECT handle, edges, bwt, sequence FROM Nodes "
+            "WHERE handle >= ? AND handle < ?",
+            (start, start + self.block_size),
+        )
+        for row in rows:
+            if row[0] not in self._records:
+                self._records[row[0]] = row[1:]
+                self._num_visits += self._count_visits(row[1:])
+
+    def find_path_position(
+        self, sample: str, contig: str, offset: int
+    ) -> tuple[int, int, int]:
+        """
+        Find the visit of an indexed reference path that covers an offset
+
+        Parameters
+        ----------
+        sample : str
+            The sample name of the reference path
+        contig : str
+            The contig name of the reference path
+        offset : int
+            The position along the contig
+
+        Returns
+        -------
+        tuple[int, int, int]
+            The position of the start of the node along the contig, along with
+            the handle and offset of the visit
+
+        Raises
+        ------
+        ValueError
+            If there is no indexed path for the contig or if it does not reach
+            the offset
+        """
+        paths = self.connection.execute(
+            "SELECT handle, fragment FROM Paths WHERE sample = ? AND contig = ? "
+            "AND is_indexed = 1 AND fragment <= ? ORDER BY fragment DESC LIMIT 1",
+            (sample, contig, offset),
+        ).fetchone()
+        if paths is None:
+            raise ValueError(f"Could not find an indexed path for {sample} {contig}")
+        path_handle, fragment = paths
+        sample_point = self.connection.execute(
+            "SELECT path_offset, node_handle, node_offset FROM ReferenceIndex "
+            "WHERE path_handle = ? AND path_offset <= ? "
+            "ORDER BY path_offset DESC LIMIT 1",
+            (path_handle, offset - fragment),
+        ).fetchone()
+        if sample_point is None:
+            raise ValueError(f"Path {sample} {contig} is not indexed")
+        pos, handle, visit = sample_point
+        pos += fragment
+        record = self.get_record(handle)
+        while pos + record.length <= offset:
+            pos += record.length
+            handle, visit = record.next_handles[visit], record.next_offsets[visit]
+            if handle == 0:
+                raise ValueError(f"Offset {offset} is past the end of {contig}")
+            record = self.get_record(handle)
+        return pos, handle, visit
+
+    def extract_region(
+        self, region: Region, reference: str
+    ) -> tuple[dict[int, int], list[tuple[int, ...]]]:
+        """
+        Extract the subgraph around a region of the reference
+
+        Parameters
+        ----------
+        region : Region
+            The region to extract, in coordinates of the reference
+        reference : str
+            The sample name of the reference
+
+        Returns
+        -------
+        tuple[dict[int, int], list[tuple[int, ...]]]
+            The length of each node in the subgraph, keyed by node ID, and the
+            handles visited by each haplotype fragment in the subgraph, excluding
+            the fragment of the reference path that covers the region
+        """
+        ref_path = self._reference_path
+        if ref_path is not None and ref_path.covers(reference, region):
+            start_nodes, ref_visit = ref_path.slice(region)
+        else:
+            pos, handle, visit = self.find_path_position(
+                reference, region.chrom, region.start
+            )
+            ref_visit = (handle, visit)
+            # collect the nodes of the reference path that overlap the region
+            start_nodes = []
+            while handle != 0 and pos < region.end:
+                record = self.get_record(handle)
+                start_nodes.append(handle // 2)
+                pos += record.length
+                handle, visit = record.next_handles[visit], record.next_offsets[visit]
+        subgraph = self._add_context(start_nodes)
+        fragments = self._extract_fragments(subgraph, ref_visit)
+        lengths = {node: self.get_record(2 * node).length for node in subgraph}
+        return lengths, fragments
+
+    def index_reference(self, reference: str, region: Region) -> ReferencePath:
+        """
+        Index the positions of the nodes of the reference path in a large region,
+        such as a whole contig
+
+        The index is kept until the next call, and extract_region() then finds
+        the reference nodes of any region within it by binary search instead of
+        by following the path from the nearest sample point in the database.
+
+        Parameters
+        ----------
+        reference : str
+            The sample name of the reference
+        region : Region
+            The region to index. The end may be past the end of the contig
+
+        Returns
+        -------
+        ReferencePath
+            The index of the reference path
+
+        Raises
+        ------
+        ValueError
+            If the region is not on an indexed reference path
+        """
+        self._reference_path = None
+        pos, handle, visit = self.find_path_position(
+            reference, region.chrom, region.start
+        )
+        positions = array("q")
+        handles = array("q")
+        offsets = array("q")
+        while handle != 0 and pos < region.end:
+            record = self.get_record(handle)
+            positions.append(pos)
+            handles.append(handle)
+            offsets.append(visit)
+            pos += record.length
+            handle, visit = record.next_handles[visit], record.next_offsets[visit]
+        self._reference_path = ReferencePath(
+            reference,
+            region.chrom,
+            np.frombuffer(positions, dtype=np.int64),
+            np.frombuffer(handles, dtype=np.int64),
+            np.frombuffer(offsets, dtype=np.int64),
+            pos,
+            handle == 0,
+        )
+        return self._reference_path
+
+    def load_node_table(
+        self, region: Region, reference: str, columnar: bool = False
+    ) -> gutils.NodeTable:
+        """
+        Load a NodeTable for a region
+
+        Each haplotype fragment is added as its own walk, like in the GFA output
+        of gbz-base's query command. Fragments that visit the same handles are
+        collapsed, so that each distinct path is only processed once.
+
+        Parameters
+        ----------
+        region : Region
+            The region to load, in coordinates of the reference
+        reference : str
+            The sample name of the reference
+        columnar : bool, optional
+            Whether to return an array-backed ColumnarNodeTable
+
+        Returns
+        -------
+        node_table : NodeTable
+            NodeTable object for the region
+        """
+        table_class = gutils.ColumnarNodeTable if columnar else gutils.NodeTable
+        node_table = table_class()
+        with profiler.stage("extract", region):
+            lengths, fragments = self.extract_region(region, reference)
+        with profiler.stage("build", region):
+            for node, length in lengths.items():
+                node_table.add_node(gutils.Node(str(node), length))
+            walks = (
+                (f"{self.FRAGMENT_SAMPLE}:{i}", f) for i, f in enumerate(fragments)
+            )
+            for sampids, fragment in gutils.collapse_walks(walks):
+                nodelist = [str(handle // 2) for handle in fragment]
+                node_table.add_walk_group(sampids, nodelist)
+        return node_table
+
+    def _add_context(self, start_nodes: list[int]) -> set[int]:
+        """
+        Find all nodes within self.context bp of the start nodes, in either
+        direction
+        """
+        subgraph = set()
+        heap = [(0, node) for node in start_nodes]
+        heapq.heapify(heap)
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if node in subgraph:
+                continue
+            subgraph.add(node)
+            forward = self.get_record(2 * node)
+            distance += forward.length
+            if distance > self.context:
+                continue
+            for record in (forward, self.get_record(2 * node + 1)):
+                for handle in record.successors:
+                    if handle // 2 not in subgraph:
+                        heapq.heappush(heap, (distance, handle // 2))
+        return subgraph
+
+    def _extract_fragments(
+        self, subgraph: set[int], ref_visit: tuple[int, int]
+    ) -> list[tuple[int, ...]]:
+        """
+        Trace the fragments of the haplotypes through a subgraph
+
+        Since every path is stored in both orientations, each fragment is traced
+        twice. Fragments are counted in the orientation that sorts first and the
+        one containing the reference visit is dropped.
+        """
+        handles = [2 * node + o for node in sorted(subgraph) for o in (0, 1)]
+        records = {handle: self.get_record(handle) for handle in handles}
+        # a visit starts a fragment if its predecessor is outside of the subgraph
+        has_predecessor = set()
+        for record in records.values():
+            for next_handle, next_offset in zip(
+                record.next_handles, record.next_offsets
+            ):
+                if next_handle in records:
+                    has_predecessor.add((next_handle, next_offset))
+        traces = Counter()
+        ref_trace = None
+        for handle in handles:
+            for offset in range(len(records[handle])):
+                if (handle, offset) in has_predecessor:
+                    continue
+                trace = []
+                is_ref = False
+                visit_handle, visit_offset = handle, offset
+                while visit_handle in records:
+                    trace.append(visit_handle)
+                    is_ref = is_ref or (visit_handle, visit_offset) == ref_visit
+                    record = records[visit_handle]
+                    visit_handle, visit_offset = (
+                        record.next_handles[visit_offset],
+                        record.next_offsets[visit_offset],
+                    )
+                trace = tuple(trace)
+                key = min(trace, tuple(h ^ 1 for h in reversed(trace)))
+                traces[key] += 1
+                if is_ref:
+                    ref_trace = key
+        fragments = Counter({key: count // 2 for key, count in traces.items()})
+        if ref_trace is not None:
+            fragments[ref_trace] -= 1
+        return list(fragments.elements())
+
+
+def get_gbzbase(gbz_file: Path) -> GBZBase:
+    """
+    Get a GBZBase reader for the database of a GBZ file
+
+    Readers are cached, so that each process keeps a single connection open per
+    database
+
+    Parameters
+    ----------
+    gbz_file : Path
+        Path to the GBZ file. Its .gbz.db database must exist
+
+    Returns
+    -------
+    GBZBase
+        The reader for the database
+    """
+    key = (os.getpid(), str(gbz_file))
+    if key not in _GBZBASE_READERS:
+        _GBZBASE_READERS[key] = GBZBase(Path(str(gbz_file) + ".db"))
+    return _GBZBASE_READERS[key]
+
+
+_GBZBASE_READERS = {}
@@ -2,10 +2,227 @@
 Utilities for dealing with node tables
 """
 
+from __future__ import annotations
+import re
+import sys
+import logging
+from array import array
 from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from collections.abc import Mapping
+from typing import Hashable, Iterable, Iterator, Optional, Sequence, TextIO
 
 import numpy as np
 
+from .data import Data, Walks, ColumnarWalks
+from .index import read_index, write_index
+from .logging import getLogger
+from .progress import Progress, ProgressReader
+
+# the number of characters to read from a GFA at a time when streaming walks
+WALK_CHUNK_SIZE = 1 << 20
+# translate the orientations of the steps of a walk into spaces
+_STEP_TABLE = str.maketrans("<>", "  ")
+_ORIENTATION_RE = re.compile("[<>]")
+
+
+def iter_gfa_records(
+    f: TextIO, chunk_size: int = WALK_CHUNK_SIZE
+) -> Iterator[tuple[str, Optional[Iterator[str]]]]:
+    """
+    Read the lines of a GFA file without holding any walk in memory
+
+    The file is read in chunks. Every line other than a W line is yielded whole.
+    For a W line, we yield its first six fields and an iterator over consecutive
+    pieces of its walk, each at most chunk_size characters long. The iterator
+    must be consumed before the next line is requested, or the rest of the walk
+    is skipped.
+
+    Parameters
+    ----------
+    f : TextIO
+        The GFA file
+    chunk_size : int, optional
+        The number of characters to read at a time
+
+    Yields
+    ------
+    tuple[str, Optional[Iterator[str]]]
+        Each line (without its newline) or, for a W line, its first six fields
+        joined by tabs. The second item is the iterator over the walk, or None
+        for other lines and for W lines with fewer than seven fields
+    """
+    reader = _ChunkReader(f, chunk_size)
+    while True:
+        record = reader.next_record()
+        if record is None:
+            return
+        yield record
+        if record[1] is not None:
+            # skip whatever is left of the walk
+            for _ in record[1]:
+                pass
+
+
+def iter_walk_steps(chunks: Iterable[str]) -> Iterator[tuple[list[str], list[str]]]:
+    """
+    Split the pieces of a walk into the node IDs and orientations of its steps
+
+    A node ID that is split between two pieces is joined back together.
+
+    Parameters
+    ----------
+    chunks : Iterable[str]
+        Consecutive pieces of a walk, ex: '>1<2', '2>3'
+
+    Yields
+    ------
+    tuple[list[str], list[str]]
+        The node IDs and orientations of consecutive batches of steps, ex:
+        (['1'], ['>']), (['22', '3'], ['<', '>'])
+    """
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        # the last step may continue in the next piece
+        cut = max(text.rfind(">"), text.rfind("<"))
+        if cut <= 0:
+            carry = text
+            continue
+        carry = text[cut:]
+        text = text[:cut]
+        yield text.translate(_STEP_TABLE).split(), _ORIENTATION_RE.findall(text)
+    if carry:
+        yield carry.translate(_STEP_TABLE).split(), _ORIENTATION_RE.findall(carry)
+
+
+def collapse_walks(
+    walks: Iterable[tuple[str, Sequence[Hashable]]],
+) -> list[tuple[list[str], Sequence[Hashable]]]:
+    """
+    Group walks that follow exactly the same path
+
+    Parameters
+    ----------
+    walks : Iterable[tuple[str, Sequence[Hashable]]]
+        The ID and the sequence of nodes of each walk
+
+    Returns
+    -------
+    list[tuple[list[str], Sequence[Hashable]]]
+        The IDs of the walks following each distinct path, and the path. The
+        paths are in the order in which they were first seen
+    """
+    groups = {}
+    for sampid, nodelist in walks:
+        key = tuple(nodelist)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = ([sampid], nodelist)
+        else:
+            group[0].append(sampid)
+    return list(groups.values())
+
+
+class _ChunkReader:
+    """
+    Split a text stream into lines, reading it in chunks
+
+    See iter_gfa_records()
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        """
+        Read another chunk, discarding the part of the buffer before pos
+        """
+        data = self.f.read(self.chunk_size)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def _find(self, char: str, offset: int = 0) -> int:
+        """
+        Find a character at or after pos + offset, reading more of the stream if
+        necessary
+
+        Returns
+        -------
+        int
+            The position of the character relative to pos, or -1 if it isn't in
+            the rest of the stream
+        """
+        while True:
+            idx = self.buf.find(char, self.pos + offset)
+            if idx != -1:
+                return idx - self.pos
+            offset = len(self.buf) - self.pos
+            if not self._fill():
+                return -1
+
+    def _take_line(self) -> str:
+        """
+        Consume the rest of the current line
+        """
+        end = self._find("\n")
+        if end == -1:
+            end = len(self.buf) - self.pos
+        line = self.buf[self.pos : self.pos + end]
+        self.pos += end + 1
+        return line
+
+    def next_record(self) -> Optional[tuple[str, Optional[Iterator[str]]]]:
+        """
+        Read the start of the next non-empty line
+        """
+        while True:
+            if self.pos >= len(self.buf) and not self._fill():
+                return None
+            if self.buf[self.pos] != "\n":
+                break
+            self.pos += 1
+        if self.buf[self.pos] != "W":
+            return self._take_line(), None
+        # find the end of the sixth field, without reading past it
+        offset = 0
+        for _ in range(6):
+            tab = self._find("\t", offset)
+            start = self.pos + offset
+            if tab == -1 or self.buf.find("\n", start, self.pos + tab) != -1:
+                return self._take_line(), None
+            offset = tab + 1
+        header = self.buf[self.pos : self.pos + offset - 1]
+        self.pos += offset
+        return header, self._iter_walk()
+
+    def _iter_walk(self) -> Iterator[str]:
+        """
+        Yield pieces of the walk in the current line and then skip any tags
+        """
+        while True:
+            tab = self.buf.find("\t", self.pos)
+            newline = self.buf.find("\n", self.pos)
+            end = min(i for i in (tab, newline, len(self.buf)) if i != -1)
+            chunk = self.buf[self.pos : end]
+            self.pos = end
+            if end < len(self.buf):
+                self._take_line()
+                if chunk:
+                    yield chunk
+                return
+            if chunk:
+                yield chunk
+            if not self._fill():
+                return
+
 
 class Node:
     """
@@ -60,12 +277,22 @@ class NodeTable:
 
     Methods
     -------
-    load_from_gfa(gfafile)
+    load_from_gfa(gfa_file, exclude_samples=[])
         Generate NodeTable from GFA file
+    load_from_gfa_stream(stream, exclude_samples=[])
+        Generate NodeTable from the lines of a GFA file in a single pass
     add_node(node)
         Add node to the table
     add_walk(sampid, nodelist)
         Add a walk to the node table
+    add_walks(walks)
+        Add several walks, processing each distinct path once
+    add_walk_group(sampids, nodelist)
+        Add several walks that follow the same path
+    add_walk_stream(sampid, batches)
+        Add a walk whose nodes arrive in batches
+    extend_walk(walk, sampid, nodelist)
+        Add more nodes to a walk in the table
     get_walk_length(nodelist=[])
         Get the total length of a walk
         through the given list of nodes
@@ -75,16 +302,27 @@ class NodeTable:
         Get mean length of all nodes
     get_total_node_length()
         Get total length of all nodes
+    get_node_lengths()
+        Get the length of each node as an array
+    get_node_counts()
+        Get the number of samples through each node as an array
+    get_memory_usage()
+        Get the approximate number of bytes used by the table
     get_nodes_from_walk(walk_string)
         Get list of nodes from the walk
     """
 
-    def __init__(self, gfa_file: Path = None, exclude_samples: list[str] = []):
+    def __init__(
+        self,
+        gfa_file: Path = None,
+        exclude_samples: list[str] = [],
+        threads: int = 1,
+    ):
         self.nodes = {}  # node ID-> Node
         self.numwalks = 0
         self.walk_lengths = []
         if gfa_file is not None:
-            self.load_from_gfa(gfa_file, exclude_samples)
+            self.load_from_gfa(gfa_file, exclude_samples, threads)
 
     def add_node(self, node: Node):
         """
@@ -108,10 +346,111 @@ class NodeTable:
         nodelist : list[str]
         """
         self.walk_lengths.append(self.get_walk_length(nodelist))
+        nodes = self.nodes
         for n in nodelist:
-            self.nodes[n].add_sample(sampid)
+            nodes[n].add_sample(sampid)
         self.numwalks += 1
 
+    def add_walks(self, walks: Iterable[tuple[str, list[str]]]):
+        """
+        Add several walks to the node table
+
+        Walks that follow exactly the same path are collapsed with
+        collapse_walks(), so that each distinct path is only processed once.
+
+        Parameters
+        ----------
+        walks : Iterable[tuple[str, list[str]]]
+            The ID and the node IDs of each walk
+        """
+        for sampids, nodelist in collapse_walks(walks):
+            self.add_walk_group(sampids, nodelist)
+
+    def add_walk_group(self, sampids: list[str], nodelist: list[str]):
+        """
+        Add several walks that follow the same path
+
+        This is equivalent to calling add_walk() for each of the walks, except
+        that the length of the path is computed once and each node is visited
+        once.
+
+        Parameters
+        ----------
+        sampids : list[str]
+            The ID of each walk
+        nodelist : list[str]
+            The node IDs of the path
+        """
+        length = self.get_walk_length(nodelist)
+        self.walk_lengths.extend([length] * len(sampids))
+        nodes = self.nodes
+        for n in dict.fromkeys(nodelist):
+            nodes[n].samples.update(sampids)
+        self.numwalks += len(sampids)
+
+    def add_walk_stream(
+        self, sampid: str, batches: Iterable[list[str]]
+    ) -> tuple[int, list[str]]:
+        """
+        Add a walk whose nodes arrive in batches
+
+        Only one batch is held in memory at a time. Nodes that are not in the
+        table yet are left out of the walk and returned, so that they can be
+        added with extend_walk() once they are.
+
+        Parameters
+        ----------
+        sampid : str
+            ID of the walk
+        batches : Iterable[list[str]]
+            Consecutive batches of the node IDs of the walk
+
+        Returns
+        -------
+        tuple[int, list[str]]
+            The index of the walk and the IDs of the nodes that were left out
+        """
+        walk = self._start_walk(sampid)
+        missing = []
+        nodes = self.nodes
+        for batch in batches:
+            if not all(n in nodes for n in batch):
+                missing.extend(n for n in batch if n not in nodes)
+                batch = [n for n in batch if n in nodes]
+            self.extend_walk(walk, sampid, batch)
+        return walk, missing
+
+    def _start_walk(self, sampid: str) -> int:
+        """
+        Add an empty walk to the table and return its index
+        """
+        self.walk_lengths.append(0)
+        self.numwalks += 1
+        return len(self.walk_lengths) - 1
+
+    def extend_walk(self, walk: int, sampid: str, nodelist: list[str]):
+        """
+        Add more nodes to a walk in the table
+
+        Parameters
+        ----------
+        walk : int
+            The index of the walk, from add_walk_stream()
+        sampid : str
+            ID of the walk
+        nodelist : list[str]
+            The node IDs to add
+
+        Raises
+        ------
+        ValueError
+            If we encounter a node ID not in the NodeTable
+        """
+        self.walk_lengths[walk] += self.get_walk_length(nodelist)
+        nodes = self.nodes
+        for n in nodelist:
+            nodes[n].add_sample(sampid)
+
     def get_walk_length(self, nodelist: list[str]) -> int:
         """
         Get the total length of a walk
@@ -132,12 +471,11 @@ class NodeTable:
         ValueError
             If we encounter a node ID not in the NodeTable
         """
-        length = 0
-        for n in nodelist:
-            if n not in self.nodes.keys():
-                raise ValueError(f"Encountered unknown node {n}")
-            length += self.nodes[n].length
-        return length
+        nodes = self.nodes
+        try:
+            return sum(nodes[n].length for n in nodelist)
+        except KeyError as e:
+            raise ValueError(f"Encountered unknown node {e.args[0]}")
 
     def get_mean_walk_length(self) -> float:
         """
@@ -175,6 +513,61 @@ class NodeTable:
         """
         return np.sum([n.length for n in self.nodes.values()])
 
+    def get_node_lengths(self) -> np.ndarray:
+        """
+        Get the length of each node
+
+        Returns
+        -------
+        np.ndarray
+            An array of node lengths, in the same order as the nodes
+        """
+        return np.fromiter(
+            (n.length for n in self.nodes.values()),
+            dtype=np.int64,
+            count=len(self.nodes),
+        )
+
+    def get_node_counts(self) -> np.ndarray:
+        """
+        Get the number of samples (haplotypes) that go through each node
+
+        Returns
+        -------
+        np.ndarray
+            An array of sample counts, in the same order as the nodes
+        """
+        return np.fromiter(
+            (len(n.samples) for n in self.nodes.values()),
+            dtype=np.int64,
+            count=len(self.nodes),
+        )
+
+    def get_memory_usage(self) -> int:
+        """
+        Get the approximate number of bytes used by the table
+
+        This counts the node dictionary, each Node object and its set of samples,
+        and the list of walk lengths. Sample labels shared between nodes are only
+        counted once.
+
+        Returns
+        -------
+        nbytes : int
+            Approximate memory usage in bytes
+        """
+        nbytes = sys.getsizeof(self.nodes) + sys.getsizeof(self.walk_lengths)
+        nbytes += sum(sys.getsizeof(length) for length in self.walk_lengths)
+        labels = set()
+        for nodeid, node in self.nodes.items():
+            nbytes += sys.getsizeof(nodeid) + sys.getsizeof(node)
+            nbytes += sys.getsizeof(node.__dict__) + sys.getsizeof(node.samples)
+            for sampid in node.samples:
+                if id(sampid) not in labels:
+                    labels.add(id(sampid))
+                    nbytes += sys.getsizeof(sampid)
+        return nbytes
+
     def get_nodes_from_walk(self, walk_string: str) -> list[str]:
         """
         Get list of nodes from a walk string
@@ -192,49 +585,795 @@ class NodeTable:
         ws = walk_string.replace(">", ":").replace("<", ":").strip(":")
         return ws.split(":")
 
-    def load_from_gfa(self, gfa_file: Path, exclude_samples: list[str] = []):
-        # First parse all the nodes
-        with open(gfa_file, "r") as f:
-            for line in f:
-                linetype = line.split()[0]
-                if linetype != "S":
-                    continue
-                nodeid = line.split()[1]
-                nodelen = 0
-                nodeseq = line.strip().split()[2]
-                if nodeseq.strip() != "*":
-                    nodelen = len(nodeseq)
-                else:
-                    for var in line.strip().split()[3:]:
-                        if var.startswith("LN"):
-                            nodelen = int(var.split(":")[2])
-                if nodelen == 0:
-                    raise ValueError(f"Could not determine node length for {nodeid}")
-                self.add_node(Node(nodeid, length=nodelen))
-
-        # try to find the .walk file
-        walk_file = Path("")
-        if gfa_file.suffix == ".gz":
-            walk_file = gfa_file.with_suffix("").with_suffix(".walk")
+    def load_from_gfa(
+        self,
+        gfa_file: Path,
+        exclude_samples: list[str] = [],
+        threads: int = 1,
+        use_walk_file: bool = True,
+        progress: Progress = None,
+        log: logging.Logger = None,
+    ):
+        """
+        Load nodes and walks from a GFA file
+
+        The GFA may be gzip or BGZF-compressed, in which case it must end in .gz.
+        It is parsed in a single pass with load_from_gfa_stream().
+
+        If an up-to-date .walk file exists next to the GFA (see find_walk_file()),
+        node membership is read from it and only the S lines of the GFA are parsed.
+        We fall back to parsing the whole GFA if the .walk file does not match the
+        GFA or if a haplotype has more than one W line, since the length of each
+        of its walks cannot be recovered from the .walk file. The number of W
+        lines of each haplotype is taken from the header of the .walk file or,
+        for .walk files that don't record it, counted from the GFA.
+
+        Parameters
+        ----------
+        gfa_file : Path
+            Path to the GFA file
+        exclude_samples : list[str], optional
+            Sample IDs whose walks should be skipped
+        threads : int, optional
+            The number of threads to use for decompressing a BGZF-compressed GFA
+        use_walk_file : bool, optional
+            Whether to read node membership from a .walk file, if one exists
+        progress : Progress, optional
+            A Progress to which to count the bytes of the GFA as they are parsed
+        log : logging.Logger, optional
+            A logger to which to report whether a .walk file was used
+
+        Raises
+        ------
+        ValueError
+            If the GFA could not be parsed
+        """
+        if log is None:
+            log = getLogger(name="graph_utils", level="ERROR")
+        walk_file = self.find_walk_file(gfa_file) if use_walk_file else None
+        if walk_file is not None:
+            if self._load_from_gfa_and_walks(
+                gfa_file, walk_file, exclude_samples, threads, progress
+            ):
+                log.info(f"Read node membership from {walk_file}")
+                return
+            log.info(f"Ignoring {walk_file}, which can't be used with {gfa_file}")
+        with self._open_gfa(gfa_file, threads, progress) as f:
+            self.load_from_gfa_stream(f, exclude_samples)
+
+    @staticmethod
+    @contextmanager
+    def _open_gfa(gfa_file: Path, threads: int = 1, progress: Progress = None):
+        """
+        Open a GFA file, counting the bytes read from it if a Progress is given
+        """
+        with Data.hook_compressed(gfa_file, "r", threads) as f:
+            yield f if progress is None else ProgressReader(f, progress)
+
+    @staticmethod
+    def find_walk_file(gfa_file: Path) -> Path | None:
+        """
+        Find an up-to-date .walk file for a GFA file
+
+        For a GFA named graph.gfa or graph.gfa.gz, we look for graph.walk.gz and
+        then graph.walk (as created by 'panct walks'). The .walk file must not be
+        older than the GFA.
+
+        Parameters
+        ----------
+        gfa_file : Path
+            Path to the GFA file
+
+        Returns
+        -------
+        Path | None
+            The path to the .walk file, or None if there isn't a usable one
+        """
+        gfa_file = Path(gfa_file)
+        stem = gfa_file.with_suffix("") if gfa_file.suffix == ".gz" else gfa_file
+        gfa_mtime = gfa_file.stat().st_mtime
+        for walk_file in (stem.with_suffix(".walk.gz"), stem.with_suffix(".walk")):
+            if walk_file.exists() and walk_file.stat().st_mtime >= gfa_mtime:
+                return walk_file
+        return None
+
+    def _load_from_gfa_and_walks(
+        self,
+        gfa_file: Path,
+        walk_file: Path,
+        exclude_samples: list[str] = [],
+        threads: int = 1,
+        progress: Progress = None,
+    ) -> bool:
+        """
+        Load node lengths from a GFA file and node membership from a .walk file
+
+        See load_from_gfa() for details
+
+        Returns
+        -------
+        bool
+            False if the .walk file cannot be used, in which case only some of
+            the nodes may have been added
+        """
+        exclude_samples = set(exclude_samples)
+        try:
+            counts = Walks.read_walk_counts(walk_file)
+        except (ValueError, OSError):
+            return False
+        num_walks = Counter()
+        if counts is not None:
+            for (sample, hap), count in counts.items():
+                if sample not in exclude_samples:
+                    num_walks[f"{sample}:{hap}"] = count
+            if any(count > 1 for count in num_walks.values()):
+                return False
+        # parse the S lines, skipping over the walks without holding them in memory
+        with self._open_gfa(gfa_file, threads, progress) as f:
+            for line, walk in iter_gfa_records(f):
+                linetype = line[:1]
+                if linetype == "S":
+                    fields = line.split("\t")
+                    self.add_node(Node(fields[1], length=self._get_node_length(fields)))
+                elif linetype == "W" and counts is None:
+                    # older .walk files don't record the W lines of each haplotype
+                    fields = line.split("\t", 3)
+                    if fields[1] not in exclude_samples:
+                        num_walks[f"{fields[1]}:{fields[2]}"] += 1
+        return self._add_walks_from_walk_file(walk_file, num_walks, exclude_samples)
+
+    def _add_walks_from_walk_file(
+        self, walk_file: Path, num_walks: Counter, exclude_samples: set[str]
+    ) -> bool:
+        """
+        Add a walk for each haplotype in a .walk file
+
+        Parameters
+        ----------
+        walk_file : Path
+            Path to the .walk file
+        num_walks : Counter
+            The number of W lines in the GFA for each (non-excluded) haplotype
+        exclude_samples : set[str]
+            Sample IDs whose walks should be skipped
+
+        Returns
+        -------
+        bool
+            False if nothing was added because the .walk file cannot be used
+        """
+        if any(count > 1 for count in num_walks.values()):
+            return False
+        try:
+            walks = ColumnarWalks.read(walk_file)
+        except (ValueError, OSError):
+            return False
+        node_ids = walks.nodes.astype(str)
+        if not all(nodeid in self.nodes for nodeid in node_ids):
+            return False
+        hap_nodes = {}
+        for hap, (sample, hapid) in enumerate(walks.labels):
+            nodes, counts = walks.get_haplotype(hap)
+            if sample not in exclude_samples and len(nodes):
+                indices = np.searchsorted(walks.nodes, nodes)
+                hap_nodes[f"{sample}:{hapid}"] = np.repeat(
+                    node_ids[indices], counts
+                ).tolist()
+        if hap_nodes.keys() != num_walks.keys():
+            return False
+        self.add_walks(hap_nodes.items())
+        return True
+
+    def load_from_walks(
+        self,
+        walks: ColumnarWalks,
+        node_lengths: np.ndarray,
+        exclude_samples: list[str] = [],
+    ):
+        """
+        Load nodes and walks from the contents of a .walk file
+
+        Each haplotype that visits any of the nodes is added as a single walk
+        through the nodes it visits, so its length is the total length of the
+        nodes it visits. Haplotypes that visit the same nodes are collapsed with
+        add_walks().
+
+        Parameters
+        ----------
+        walks : ColumnarWalks
+            The walks through the nodes
+        node_lengths : np.ndarray
+            The length of each of the nodes in walks.nodes
+        exclude_samples : list[str], optional
+            Sample IDs whose walks should be skipped
+        """
+        exclude_samples = set(exclude_samples)
+        node_ids = walks.nodes.astype(str)
+        for nodeid, length in zip(node_ids.tolist(), node_lengths.tolist()):
+            self.add_node(Node(nodeid, length=length))
+        self.add_walks(self._iter_haplotype_walks(walks, node_ids, exclude_samples))
+
+    @staticmethod
+    def _iter_haplotype_walks(
+        walks: ColumnarWalks, node_ids: np.ndarray, exclude_samples: set[str]
+    ) -> Iterator[tuple[str, list[str]]]:
+        """
+        Yield the ID and node IDs of the walk of each haplotype in a .walk file
+        """
+        for hap, (sample, hapid) in enumerate(walks.labels):
+            if sample in exclude_samples:
+                continue
+            nodes, counts = walks.get_haplotype(hap)
+            if len(nodes):
+                indices = np.searchsorted(walks.nodes, nodes)
+                yield f"{sample}:{hapid}", np.repeat(node_ids[indices], counts).tolist()
+
+    def load_from_gfa_stream(
+        self, stream: Iterable[str] | TextIO, exclude_samples: list[str] = []
+    ):
+        """
+        Load nodes and walks from the lines of a GFA in a single pass
+
+        Each line is split at most once. Walks that refer to nodes whose S lines
+        have not been seen yet are set aside and added once the stream is exhausted.
+
+        If the stream is a file, it is read in chunks with iter_gfa_records(), and
+        the nodes of each walk are added to the table as they are read. So no walk
+        is ever held in memory, except for any nodes whose S lines come later.
+
+        Parameters
+        ----------
+        stream : Iterable[str] | TextIO
+            Lines of a GFA file, or the file itself
+        exclude_samples : list[str], optional
+            Sample IDs whose walks should be skipped
+
+        Raises
+        ------
+        ValueError
+            If a node length could not be determined or a walk refers to an
+            unknown node
+        """
+        exclude_samples = set(exclude_samples)
+        if hasattr(stream, "read"):
+            records = iter_gfa_records(stream)
         else:
-            walk_file = gfa_file.with_suffix("")
-        if not walk_file.exists():
-            walk_file = walk_file.with_suffix(".walk.gz")
-
-        # TODO: get nodes from .walk file and add with self.add_walk()
-        # if walk_file.exists():
-        # else:
-
-        # Second pass to get the walks
-        with open(gfa_file, "r") as f:
-            for line in f:
-                linetype = line.split()[0]
-                if linetype != "W":
-                    continue
-                sampid = line.split()[1]
-                if sampid in exclude_samples:
+            records = ((line, None) for line in stream)
+        pending = []
+        for line, walk in records:
+            linetype = line[:1]
+            if linetype == "S":
+                fields = line.rstrip("\n").split("\t")
+                self.add_node(Node(fields[1], length=self._get_node_length(fields)))
+            elif linetype == "W":
+                fields = line.rstrip("\n").split("\t", 7)
+                if fields[1] in exclude_samples:
                     continue
-                hapid = line.split()[2]
-                walk = line.split()[6]
-                nodes = self.get_nodes_from_walk(walk)
-                self.add_walk(f"{sampid}:{hapid}", nodes)
+                sampid = f"{fields[1]}:{fields[2]}"
+                if walk is None:
+                    walk = (fields[6],)
+                batches = (nodes for nodes, _ in iter_walk_steps(walk))
+                walk_index, missing = self.add_walk_stream(sampid, batches)
+                if missing:
+                    # the S lines for these nodes may come later in the file
+                    pending.append((walk_index, sampid, missing))
+        for walk_index, sampid, missing in pending:
+            self.extend_walk(walk_index, sampid, missing)
+
+    @staticmethod
+    def _get_node_length(fields: list[str]) -> int:
+        """
+        Get the length of a node from the fields of its S line
+
+        Parameters
+        ----------
+        fields : list[str]
+            The fields of the S line
+
+        Returns
+        -------
+        nodelen : int
+            Length of the node sequence
+
+        Raises
+        ------
+        ValueError
+            If the node length could not be determined
+        """
+        nodelen = 0
+        nodeseq = fields[2].strip()
+        if nodeseq != "*":
+            nodelen = len(nodeseq)
+        else:
+            for var in fields[3:]:
+                if var.startswith("LN"):
+                    nodelen = int(var.split(":")[2])
+        if nodelen == 0:
+            raise ValueError(f"Could not determine node length for {fields[1]}")
+        return nodelen
+
+
+class ColumnarNodeTable(NodeTable):
+    """
+    Array-backed table of nodes storing node metadata
+    for a region
+
+    Node IDs are mapped to contiguous integers, node lengths are stored in a
+    single array, and the haplotypes that go through each node are stored in
+    compressed sparse row (CSR) form: the haplotypes of the node with index i
+    are hap_indices[hap_indptr[i]:hap_indptr[i+1]]. Memberships are buffered as
+    integer pairs while walks are added and are converted to CSR form lazily.
+
+    A table can also be opened from a binary index created by 'panct index' with
+    load_from_index(), in which case the arrays are memory-mapped from the file.
+
+    Attributes
+    ----------
+    nodes : Mapping[str, Node]
+        A read-only view of the table that creates a Node object on access
+    node_ids : list[str]
+        IDs of the nodes, in order of their integer index
+    node_index : dict[str, int]
+        Mapping of node IDs to their integer index
+    hap_labels : list[str]
+        IDs of the samples (haplotypes), in order of their integer index
+    numwalks : int
+        Number of walks going through this region
+    walk_lengths : array[int]
+        Lengths of walks through this region
+    walk_haps : array[int]
+        The index of the sample (haplotype) of each walk
+
+    Methods
+    -------
+    get_haplotype_csr()
+        Get the haplotypes of each node in CSR form
+    load_from_index(index_file, exclude_samples=[], graph_file=None)
+        Open a NodeTable from a binary index
+    write_index(index_file, graph_file)
+        Write the table to a binary index
+    """
+
+    # how many memberships to buffer before merging them into the CSR arrays
+    BUFFER_SIZE = 1 << 22
+
+    def __init__(
+        self,
+        gfa_file: Path = None,
+        exclude_samples: list[str] = [],
+        threads: int = 1,
+    ):
+        self._node_ids = []
+        self._node_index = {}
+        self._node_id_blob = None
+        self.hap_labels = []
+        self.hap_index = {}
+        self.numwalks = 0
+        self.walk_lengths = array("q")
+        self.walk_haps = array("i")
+        self._lengths = array("q")
+        # buffered (node, haplotype) memberships, merged into _keys as needed
+        self._member_nodes = array("i")
+        self._member_haps = array("i")
+        self._keys = np.empty(0, dtype=np.int64)
+        self._csr = None
+        if gfa_file is not None:
+            self.load_from_gfa(gfa_file, exclude_samples, threads)
+
+    @property
+    def nodes(self) -> Mapping:
+        return _ColumnarNodes(self)
+
+    @property
+    def node_ids(self) -> list[str]:
+        if self._node_ids is None:
+            self._node_ids = bytes(self._node_id_blob).decode().split("\n")
+            if self._node_ids == [""]:
+                self._node_ids = []
+        return self._node_ids
+
+    @property
+    def node_index(self) -> dict[str, int]:
+        if self._node_index is None:
+            self._node_index = {n: i for i, n in enumerate(self.node_ids)}
+        return self._node_index
+
+    @classmethod
+    def load_from_index(
+        cls,
+        index_file: Path,
+        exclude_samples: list[str] = [],
+        graph_file: Path = None,
+    ) -> ColumnarNodeTable:
+        """
+        Open a NodeTable from a binary index created by 'panct index'
+
+        The arrays in the index are memory-mapped rather than read into memory.
+        They are only copied if some of the samples in the index must be excluded
+        or if nodes or walks are later added to the table.
+
+        Parameters
+        ----------
+        index_file : Path
+            Path to the index
+        exclude_samples : list[str], optional
+            Sample IDs whose walks should be skipped
+        graph_file : Path, optional
+            The graph from which the index was created. If given, we check that
+            the index is not stale
+
+        Returns
+        -------
+        ColumnarNodeTable
+            The table stored in the index
+
+        Raises
+        ------
+        ValueError
+            If the index is invalid or stale
+        """
+        header, arrays = read_index(index_file, graph_file)
+        table = cls()
+        table._node_ids = None
+        table._node_index = None
+        table._node_id_blob = arrays["node_ids"]
+        table.hap_labels = header["hap_labels"]
+        table.hap_index = {label: i for i, label in enumerate(table.hap_labels)}
+        table._lengths = arrays["node_lengths"]
+        indptr, indices = arrays["hap_indptr"], arrays["hap_indices"]
+        walk_lengths, walk_haps = arrays["walk_lengths"], arrays["walk_haps"]
+        exclude_samples = set(exclude_samples)
+        excluded = [
+            i
+            for i, label in enumerate(table.hap_labels)
+            if label.rsplit(":", 1)[0] in exclude_samples
+        ]
+        if excluded:
+            keep = ~np.isin(indices, excluded)
+            indptr = np.concatenate(([0], np.cumsum(keep)))[indptr]
+            indices = indices[keep]
+            keep = ~np.isin(walk_haps, excluded)
+            walk_lengths, walk_haps = walk_lengths[keep], walk_haps[keep]
+        table._csr = (indptr, indices)
+        table._keys = None
+        table.walk_lengths = walk_lengths
+        table.walk_haps = walk_haps
+        table.numwalks = len(walk_lengths)
+        return table
+
+    def write_index(self, index_file: Path, graph_file: Path):
+        """
+        Write the table to a binary index that can be opened with load_from_index()
+
+        Parameters
+        ----------
+        index_file : Path
+            Path to the index
+        graph_file : Path
+            The graph from which the table was loaded. Its size and modification
+            time are recorded so that stale indices can be detected
+        """
+        indptr, indices = self.get_haplotype_csr()
+        arrays = {
+            "node_ids": np.frombuffer("\n".join(self.node_ids).encode(), np.uint8),
+            "node_lengths": self.get_node_lengths(),
+            "hap_indptr": indptr,
+            "hap_indices": indices,
+            "walk_lengths": np.asarray(self.walk_lengths, dtype=np.int64),
+            "walk_haps": np.asarray(self.walk_haps, dtype=np.int32),
+        }
+        write_index(index_file, graph_file, arrays, {"hap_labels": self.hap_labels})
+
+    def add_node(self, node: Node):
+        """
+        Add a node to the node table
+
+        Parameters
+        ----------
+        node : Node
+            Node to add
+        """
+        self._thaw()
+        idx = self.node_index.get(node.nodeid)
+        if idx is None:
+            idx = len(self.node_ids)
+            self.node_index[node.nodeid] = idx
+            self.node_ids.append(node.nodeid)
+            self._lengths.append(node.length)
+        else:
+            self._lengths[idx] = node.length
+        for sampid in node.samples:
+            self._add_memberships([idx], sampid)
+
+    def add_walk(self, sampid: str, nodelist: list[str]):
+        """
+        Add a walk to the node table
+
+        Parameters
+        ----------
+        sampid : str
+            ID of the walk
+        nodelist : list[str]
+        """
+        self._thaw()
+        indices = self._get_node_indices(nodelist)
+        lengths = self._lengths
+        self.walk_lengths.append(sum(lengths[i] for i in indices))
+        self._add_memberships(indices, sampid)
+        self.walk_haps.append(self.hap_index[sampid])
+        self.numwalks += 1
+
+    def add_walk_group(self, sampids: list[str], nodelist: list[str]):
+        """
+        Add several walks that follow the same path
+
+        Parameters
+        ----------
+        sampids : list[str]
+            The ID of each walk
+        nodelist : list[str]
+            The node IDs of the path
+        """
+        self._thaw()
+        indices = self._get_node_indices(nodelist)
+        lengths = self._lengths
+        length = sum(lengths[i] for i in indices)
+        haps = [self._get_hap_index(sampid) for sampid in sampids]
+        self.walk_lengths.extend([length] * len(haps))
+        self.walk_haps.extend(haps)
+        self._add_group_memberships(list(dict.fromkeys(indices)), haps)
+        self.numwalks += len(haps)
+
+    def _start_walk(self, sampid: str) -> int:
+        """
+        Add an empty walk to the table and return its index
+        """
+        self._thaw()
+        self.walk_lengths.append(0)
+        self.walk_haps.append(self._get_hap_index(sampid))
+        self.numwalks += 1
+        return len(self.walk_lengths) - 1
+
+    def extend_walk(self, walk: int, sampid: str, nodelist: list[str]):
+        """
+        Add more nodes to a walk in the table
+
+        Parameters
+        ----------
+        walk : int
+            The index of the walk, from add_walk_stream()
+        sampid : str
+            ID of the walk
+        nodelist : list[str]
+            The node IDs to add
+
+        Raises
+        ------
+        ValueError
+            If we encounter a node ID not in the NodeTable
+        """
+        self._thaw()
+        indices = self._get_node_indices(nodelist)
+        lengths = self._lengths
+        self.walk_lengths[walk] += sum(lengths[i] for i in indices)
+        self._add_memberships(indices, sampid)
+
+    def get_walk_length(self, nodelist: list[str]) -> int:
+        """
+        Get the total length of a walk
+        through the given list of nodes
+
+        Parameters
+        ----------
+        nodelist : list[str]
+            List of nodes of the walk
+
+        Returns
+        -------
+        length : int
+            Length (bp) of the walk
+
+        Raises
+        ------
+        ValueError
+            If we encounter a node ID not in the NodeTable
+        """
+        lengths = self._lengths
+        return sum(lengths[i] for i in self._get_node_indices(nodelist))
+
+    def get_mean_node_length(self) -> float:
+        """
+        Get mean length of all nodes
+
+        Returns
+        -------
+        mean_node_length : float
+            Returns np.nan if there are no nodes
+        """
+        if len(self.node_ids) == 0:
+            return np.nan
+        return float(np.mean(self.get_node_lengths()))
+
+    def get_total_node_length(self) -> int:
+        """
+        Get total length of all nodes
+
+        Returns
+        -------
+        total_walk_length : int
+        """
+        return int(np.sum(self.get_node_lengths()))
+
+    def get_node_lengths(self) -> np.ndarray:
+        """
+        Get the length of each node
+
+        Returns
+        -------
+        np.ndarray
+            An array of node lengths, in order of the node indices
+        """
+        if isinstance(self._lengths, np.ndarray):
+            return self._lengths
+        return np.array(self._lengths, dtype=np.int64)
+
+    def get_node_counts(self) -> np.ndarray:
+        """
+        Get the number of samples (haplotypes) that go through each node
+
+        Returns
+        -------
+        np.ndarray
+            An array of sample counts, in order of the node indices
+        """
+        return np.diff(self.get_haplotype_csr()[0])
+
+    def get_haplotype_csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the haplotypes that go through each node in CSR form
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The indptr (int64) and indices (int32) arrays. The haplotype indices
+            of the node with index i are indices[indptr[i]:indptr[i+1]]
+        """
+        if self._csr is None or self._csr[0].shape[0] != len(self._lengths) + 1:
+            self._merge_memberships()
+            node_idx = (self._keys >> 32).astype(np.int64)
+            counts = np.bincount(node_idx, minlength=len(self.node_ids))
+            indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            indices = (self._keys & 0xFFFFFFFF).astype(np.int32)
+            self._csr = (indptr, indices)
+        return self._csr
+
+    def get_memory_usage(self) -> int:
+        """
+        Get the approximate number of bytes used by the table
+
+        This counts the arrays, the buffered memberships, and the dictionaries
+        that map node and sample IDs to integers.
+
+        Returns
+        -------
+        nbytes : int
+            Approximate memory usage in bytes
+        """
+        nbytes = 0
+        for buf in (
+            self._keys,
+            *(self._csr or ()),
+            self.walk_lengths,
+            self.walk_haps,
+            self._lengths,
+            self._member_nodes,
+            self._member_haps,
+            self._node_id_blob,
+        ):
+            if isinstance(buf, np.ndarray):
+                nbytes += buf.nbytes
+            elif buf is not None:
+                nbytes += sys.getsizeof(buf)
+        for ids, index in (
+            (self._node_ids, self._node_index),
+            (self.hap_labels, self.hap_index),
+        ):
+            if ids is not None:
+                nbytes += sys.getsizeof(ids) + sum(sys.getsizeof(i) for i in ids)
+            if index is not None:
+                nbytes += sys.getsizeof(index)
+        return nbytes
+
+    def _thaw(self):
+        """
+        Copy any memory-mapped arrays into growable arrays before modifying them
+        """
+        if not isinstance(self._lengths, np.ndarray):
+            return
+        indptr, indices = self.get_haplotype_csr()
+        node_idx = np.repeat(
+            np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr)
+        )
+        self._keys = (node_idx << 32) | indices
+        self._lengths = array("q", self._lengths.tobytes())
+        self.walk_lengths = array("q", self.walk_lengths.astype(np.int64).tobytes())
+        self.walk_haps = array("i", self.walk_haps.astype(np.int32).tobytes())
+        self._csr = None
+
+    def _get_node_indices(self, nodelist: list[str]) -> list[int]:
+        """
+        Get the integer index of each node, raising a ValueError for unknown nodes
+        """
+        node_index = self.node_index
+        try:
+            return [node_index[n] for n in nodelist]
+        except KeyError as e:
+            raise ValueError(f"Encountered unknown node {e.args[0]}")
+
+    def _get_hap_index(self, sampid: str) -> int:
+        """
+        Get the integer index of a haplotype, adding it if it's new
+        """
+        hap = self.hap_index.get(sampid)
+        if hap is None:
+            hap = len(self.hap_labels)
+            self.hap_index[sampid] = hap
+            self.hap_labels.append(sampid)
+        return hap
+
+    def _add_memberships(self, indices: list[int], sampid: str):
+        """
+        Buffer the memberships of a haplotype in some nodes
+        """
+        self._add_group_memberships(indices, [self._get_hap_index(sampid)])
+
+    def _add_group_memberships(self, indices: list[int], haps: list[int]):
+        """
+        Buffer the memberships of several haplotypes in the same nodes
+        """
+        self._member_nodes.extend(array("i", indices) * len(haps))
+        for hap in haps:
+            self._member_haps.extend(array("i", (hap,)) * len(indices))
+        self._csr = None
+        if len(self._member_nodes) >= self.BUFFER_SIZE:
+            self._merge_memberships()
+
+    def _merge_memberships(self):
+        """
+        Merge the buffered memberships into the sorted array of unique keys
+        """
+        if not len(self._member_nodes):
+            return
+        keys = np.frombuffer(self._member_nodes, dtype=np.int32).astype(np.int64)
+        keys <<= 32
+        keys |= np.frombuffer(self._member_haps, dtype=np.int32)
+        self._keys = np.unique(np.concatenate((self._keys, keys)))
+        self._member_nodes = array("i")
+        self._member_haps = array("i")
+
+
+class _ColumnarNodes(Mapping):
+    """
+    A read-only mapping of node IDs to Node objects for a ColumnarNodeTable
+    """
+
+    def __init__(self, table: ColumnarNodeTable):
+        self.table = table
+
+    def __getitem__(self, nodeid: str) -> Node:
+        idx = self.table.node_index[nodeid]
+        node = Node(nodeid, length=self.table._lengths[idx])
+        indptr, indices = self.table.get_haplotype_csr()
+        labels = self.table.hap_labels
+        node.samples = {labels[h] for h in indices[indptr[idx] : indptr[idx + 1]]}
+        return node
+
+    def __contains__(self, nodeid: str) -> bool:
+        return nodeid in self.table.node_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.table.node_ids)
+
+    def __len__(self) -> int:
+        return len(self.table.node_ids)
@@ -0,0 +1,196 @@
+"""
+Create and read binary indices of pangenome graphs
+
+An index stores the node lengths, haplotype labels, and node->haplotype
+membership of a graph as flat arrays, so that they can be memory-mapped instead
+of re-parsed from a GFA on every run. The layout of an index file is:
+
+1. The magic bytes b"PANCTIDX"
+2. The format version as a little-endian uint32
+3. The length of the JSON header as a little-endian uint32
+4. The JSON header, describing the source graph and the arrays
+5. The arrays, each starting on a 64-byte boundary
+"""
+
+from __future__ import annotations
+import os
+import json
+import struct
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from .logging import getLogger
+
+MAGIC = b"PANCTIDX"
+VERSION = 1
+INDEX_SUFFIX = ".pctx"
+ALIGNMENT = 64
+
+
+def get_index_path(graph_file: Path) -> Path:
+    """
+    Get the default path to the index of a graph
+
+    Parameters
+    ----------
+    graph_file : Path
+        Path to the graph
+
+    Returns
+    -------
+    Path
+        The path to the graph with INDEX_SUFFIX appended to it
+    """
+    return Path(str(graph_file) + INDEX_SUFFIX)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _describe_source(graph_file: Path) -> dict:
+    stat = Path(graph_file).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_index(
+    index_file: Path, graph_file: Path, arrays: dict[str, np.ndarray], extra: dict
+):
+    """
+    Write arrays to an index file
+
+    The file is written to a temporary path first and then moved into place, so
+    that readers never see a partially written index.
+
+    Parameters
+    ----------
+    index_file : Path
+        Path to the index
+    graph_file : Path
+        The graph from which the arrays were created
+    arrays : dict[str, np.ndarray]
+        One-dimensional arrays to store, keyed by name
+    extra : dict
+        Any other JSON-serializable values to store in the header
+    """
+    header = dict(extra)
+    header["source"] = _describe_source(graph_file)
+    header["arrays"] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        header["arrays"][name] = {
+            "dtype": arr.dtype.str,
+            "offset": offset,
+            "length": len(arr),
+        }
+        offset = _align(offset + arr.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_file = Path(str(index_file) + ".tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        # pad the file so that the last array is complete
+        f.truncate(data_start + offset)
+    os.replace(tmp_file, index_file)
+
+
+def read_index(
+    index_file: Path, graph_file: Path = None
+) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Memory-map the arrays in an index file
+
+    Parameters
+    ----------
+    index_file : Path
+        Path to the index
+    graph_file : Path, optional
+        The graph from which the index was created. If given, we check that its
+        size and modification time match the ones recorded in the index
+
+    Returns
+    -------
+    tuple[dict, dict[str, np.ndarray]]
+        The JSON header and the read-only arrays, keyed by name
+
+    Raises
+    ------
+    ValueError
+        If the file is not a valid index or if the index is stale
+    """
+    with open(index_file, "rb") as f:
+        prefix = f.read(len(MAGIC) + 8)
+        if len(prefix) < len(MAGIC) + 8 or prefix[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{index_file} is not a panct index")
+        version, header_len = struct.unpack("<II", prefix[len(MAGIC) :])
+        if version != VERSION:
+            raise ValueError(f"{index_file} has unsupported version {version}")
+        header = json.loads(f.read(header_len))
+    if graph_file is not None and header["source"] != _describe_source(graph_file):
+        raise ValueError(f"{index_file} is out of date with {graph_file}")
+    data_start = _align(len(MAGIC) + 8 + header_len)
+    buf = np.memmap(index_file, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, desc in header["arrays"].items():
+        dtype = np.dtype(desc["dtype"])
+        start = data_start + desc["offset"]
+        end = start + desc["length"] * dtype.itemsize
+        if end > len(buf):
+            raise ValueError(f"{index_file} is truncated")
+        arrays[name] = buf[start:end].view(dtype)
+    return header, arrays
+
+
+def index_graph(
+    graph: Path,
+    output: Path = None,
+    threads: int = 1,
+    log: logging.Logger = None,
+) -> int:
+    """
+    Create a binary index of a GFA file
+
+    Parameters
+    ----------
+    graph : Path
+        The path to a pangenome graph in GFA format (optionally ending in .gz)
+    output : Path, optional
+        The location to which to write the index. If not specified, we use the
+        path to the graph with INDEX_SUFFIX appended to it
+    threads : int, optional
+        Number of threads to use for decompressing a BGZF-compressed GFA
+    log : Logger, optional
+        A logging module to which to write messages about progress and any errors
+
+    Returns
+    -------
+    retcode : int
+        Return code of the program
+    """
+    from .graph_utils import ColumnarNodeTable
+
+    if log is None:
+        log = getLogger(name="index", level="ERROR")
+    if output is None:
+        output = get_index_path(graph)
+
+    log.info(f"Loading {graph}")
+    try:
+        table = ColumnarNodeTable(graph, threads=threads)
+    except ValueError as e:
+        log.critical(f"Could not load {graph}: {e}")
+        return 1
+    log.info(
+        f"Writing an index of {len(table.node_ids)} nodes and "
+        f"{table.numwalks} walks to {output}"
+    )
+    table.write_index(output, graph)
+    return 0
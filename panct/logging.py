@@ -1,11 +1,19 @@
 from __future__ import annotations
+import sys
 import logging
 
+# the handler that getLogger() attached to each logger, by the name of the logger
+_handlers = {}
+
 
 def getLogger(name: str = None, level: str = "ERROR", exact_time: bool = False):
     """
     Retrieve a Logger object
 
+    A handler that writes to stderr is attached to each logger the first time it
+    is retrieved. Later calls reuse the same handler, updating its level and
+    format, so that messages aren't repeated.
+
     Parameters
     ----------
     name : str, optional
@@ -24,8 +32,16 @@ def getLogger(name: str = None, level: str = "ERROR", exact_time: bool = False):
     logger = logging.getLogger("panct" + name)
     logger.setLevel(level)
 
-    # create console handler and set level to debug
-    ch = logging.StreamHandler()
+    # create console handler, or reuse the one created before
+    ch = _handlers.get(logger.name)
+    if ch is None or ch not in logger.handlers:
+        ch = logging.StreamHandler()
+        _handlers[logger.name] = ch
+        logger.addHandler(ch)
+    else:
+        # stderr may have been replaced since the handler was created. The old
+        # stream may be closed, so it can't be flushed by setStream()
+        ch.stream = sys.stderr
     ch.setLevel(level)
 
     # create formatter
@@ -42,7 +58,4 @@ def getLogger(name: str = None, level: str = "ERROR", exact_time: bool = False):
     # add formatter to ch
     ch.setFormatter(formatter)
 
-    # add ch to logger
-    logger.addHandler(ch)
-
     return logger
@@ -0,0 +1,334 @@
+"""
+Write the results of 'panct complexity'
+
+The format of the output is chosen from the name of the output file:
+
+- By default, the results are written as tab-separated text. Lines are
+  collected and written in batches, rather than one at a time, and the file is
+  flushed at most once every FLUSH_INTERVAL seconds.
+- If the name ends in .gz, the text is BGZF-compressed. Once the file is closed,
+  it is indexed with tabix if its first columns are chrom, start, and end.
+- If the name ends in .npz, each column is stored as a numpy array in a
+  compressed .npz archive that can be loaded with numpy.load().
+"""
+
+from __future__ import annotations
+import io
+import time
+import logging
+from pathlib import Path
+from abc import ABC, abstractmethod
+from typing import Any, Sequence
+
+import numpy as np
+from pysam import tabix_index
+
+from .bgzf import BGZFWriter
+from .logging import getLogger
+
+REGION_COLUMNS = ["chrom", "start", "end"]
+# the maximum number of results held in memory before they are written
+BATCH_SIZE = 1000
+# the maximum number of seconds between flushes of a text file
+FLUSH_INTERVAL = 5.0
+
+
+class ResultWriter(ABC):
+    """
+    Abstract class for writing rows of results to a file
+
+    Use open_writer() to create a writer for the format of a file.
+
+    Attributes
+    ----------
+    output_file : Path
+        The path to the output file
+    header : list[str]
+        The name of each column
+    log : logging.Logger
+        A logging object
+    """
+
+    def __init__(
+        self, output_file: Path, header: list[str], log: logging.Logger = None
+    ):
+        self.output_file = output_file
+        self.header = header
+        self.log = log if log is not None else getLogger(name="output")
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @abstractmethod
+    def write(self, items: Sequence[Any]):
+        """
+        Write a row of results
+
+        Parameters
+        ----------
+        items : Sequence[Any]
+            The value of each column
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """
+        Write any remaining results and close the file
+        """
+        pass
+
+
+class TextResultWriter(ResultWriter):
+    """
+    Write results as tab-separated text, in batches
+
+    Attributes
+    ----------
+    output_file : Path
+        The path to the output file
+    header : list[str]
+        The name of each column
+    log : logging.Logger
+        A logging object
+    append : bool
+        Whether to append to an existing file instead of writing a new one with
+        a header
+    batch_size : int
+        The maximum number of lines held in memory before they are written
+    flush_interval : float
+        The maximum number of seconds between flushes
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        header: list[str],
+        log: logging.Logger = None,
+        append: bool = False,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        super().__init__(output_file, header, log)
+        self.append = append
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._next_flush = time.monotonic() + flush_interval
+        self._file = self._open()
+        if not append:
+            self._lines.append("\t".join(header))
+
+    def _open(self):
+        """
+        Open the output file for writing text
+        """
+        return open(self.output_file, "a" if self.append else "w")
+
+    def write(self, items: Sequence[Any]):
+        self._lines.append("\t".join([str(item) for item in items]))
+        if len(self._lines) >= self.batch_size:
+            self._write_lines()
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the lines held in memory and flush the file
+        """
+        self._write_lines()
+        self._file.flush()
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def _write_lines(self):
+        if self._lines:
+            self._file.write("\n".join(self._lines) + "\n")
+            self._lines.clear()
+
+    def close(self):
+        if not self._file.closed:
+            self._write_lines()
+            self._file.close()
+
+
+class BGZFResultWriter(TextResultWriter):
+    """
+    Write results as BGZF-compressed text and index them with tabix
+
+    The file is only indexed if its first columns are chrom, start, and end, and
+    indexing fails if the regions are not sorted.
+
+    Attributes
+    ----------
+    output_file : Path
+        The path to the output file
+    header : list[str]
+        The name of each column
+    log : logging.Logger
+        A logging object
+    batch_size : int
+        The maximum number of lines held in memory before they are written
+    flush_interval : float
+        The maximum number of seconds between flushes. Only complete BGZF blocks
+        are written when the file is flushed
+    threads : int
+        The number of threads used for compression
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        header: list[str],
+        log: logging.Logger = None,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        threads: int = 1,
+    ):
+        self.threads = threads
+        super().__init__(output_file, header, log, False, batch_size, flush_interval)
+
+    def _open(self):
+        writer = io.BufferedWriter(BGZFWriter(self.output_file, self.threads))
+        return io.TextIOWrapper(writer)
+
+    def close(self):
+        if self._file.closed:
+            return
+        super().close()
+        if self.header[:3] != REGION_COLUMNS:
+            return
+        try:
+            tabix_index(
+                str(self.output_file),
+                seq_col=0,
+                start_col=1,
+                end_col=2,
+                line_skip=1,
+                zerobased=True,
+                force=True,
+            )
+        except OSError as e:
+            # check if the error message matches what we expect if the file is unsorted
+            if str(e).startswith("building of index for "):
+                self.log.error(
+                    f"Failed to index {self.output_file}. Are the regions sorted?"
+                )
+            else:
+                raise
+
+
+class NpzResultWriter(ResultWriter):
+    """
+    Write each column of results as an array in a compressed .npz archive
+
+    The chrom column is stored as an array of strings. Every other column is an
+    array of integers if all of its values are integers, or of floats otherwise.
+    Missing values are stored as NaN.
+
+    Attributes
+    ----------
+    output_file : Path
+        The path to the output file
+    header : list[str]
+        The name of each column
+    log : logging.Logger
+        A logging object
+    batch_size : int
+        The maximum number of rows held in memory before they are converted to
+        arrays
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        header: list[str],
+        log: logging.Logger = None,
+        batch_size: int = BATCH_SIZE,
+    ):
+        super().__init__(output_file, header, log)
+        self.batch_size = batch_size
+        self._rows = []
+        self._chunks = {column: [] for column in header}
+        self._closed = False
+
+    def write(self, items: Sequence[Any]):
+        self._rows.append(items)
+        if len(self._rows) >= self.batch_size:
+            self._convert_rows()
+
+    def _convert_rows(self):
+        """
+        Convert the rows held in memory into an array for each column
+        """
+        if not self._rows:
+            return
+        for column, values in zip(self.header, zip(*self._rows)):
+            if column == "chrom":
+                array = np.array(values, dtype=str)
+            else:
+                array = np.asarray(values)
+                if array.dtype.kind not in "iuf":
+                    # None becomes NaN
+                    array = np.array(values, dtype=np.float64)
+            self._chunks[column].append(array)
+        self._rows.clear()
+
+    def close(self):
+        if self._closed:
+            return
+        self._convert_rows()
+        arrays = {}
+        for column, chunks in self._chunks.items():
+            if chunks:
+                arrays[column] = np.concatenate(chunks)
+            else:
+                arrays[column] = np.empty(0, dtype=str if column == "chrom" else float)
+        with open(self.output_file, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        self._closed = True
+
+
+def open_writer(
+    output_file: Path,
+    header: list[str],
+    log: logging.Logger = None,
+    append: bool = False,
+    threads: int = 1,
+) -> ResultWriter:
+    """
+    Create a writer for the format of an output file
+
+    Parameters
+    ----------
+    output_file : Path
+        The path to the output file. Its suffix determines its format
+    header : list[str]
+        The name of each column
+    log : logging.Logger, optional
+        A logging object
+    append : bool, optional
+        Whether to append to an existing text file
+    threads : int, optional
+        The number of threads used to compress a .gz file
+
+    Returns
+    -------
+    ResultWriter
+        A writer for the file
+
+    Raises
+    ------
+    ValueError
+        If append is True for a .gz or .npz file
+    """
+    suffix = Path(output_file).suffix
+    if append and suffix in (".gz", ".npz"):
+        raise ValueError("Only uncompressed text output can be appended to")
+    if suffix == ".gz":
+        return BGZFResultWriter(output_file, header, log, threads=threads)
+    if suffix == ".npz":
+        return NpzResultWriter(output_file, header, log)
+    return TextResultWriter(output_file, header, log, append)
@@ -0,0 +1,351 @@
+"""
+Record the time and memory used by each stage of computing complexity
+
+Stages are timed by wrapping them in stage() or iter_stage(). Nothing is
+recorded unless a Profiler is active (see profiling()), in which case the wall
+time, CPU time, and peak resident memory of every stage are recorded for each
+region. When no Profiler is active, stage() returns a shared no-op context
+manager, so the stages cost little more than a function call.
+
+The stages are:
+
+parse
+    Reading the regions
+extract
+    Extracting the nodes and walks of a region from the graph, or from the .walk
+    file of a GFA
+build
+    Creating the node table of a region, or of a whole GFA
+metric
+    Computing the complexity metrics from the node table
+write
+    Writing the output line of a region
+"""
+
+from __future__ import annotations
+import sys
+import json
+import time
+import logging
+import resource
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+from .data import Region
+
+STAGES = ["parse", "extract", "build", "metric", "write"]
+PERCENTILES = [50, 90, 99]
+
+_active = None
+_null = nullcontext()
+_done = object()
+
+
+class StageRecord(NamedTuple):
+    """
+    The resources used by one stage for one region
+
+    Attributes
+    ----------
+    stage : str
+        The name of the stage. See STAGES
+    region : str
+        The region, as chrom:start-end, or an empty string if the stage was not
+        specific to a region
+    wall : float
+        The elapsed time, in seconds
+    cpu : float
+        The CPU time used by the process, in seconds
+    peak_rss : int
+        The peak resident memory of the process during the stage, in bytes. If
+        the peak can't be reset, this is the peak since the process started
+    """
+
+    stage: str
+    region: str
+    wall: float
+    cpu: float
+    peak_rss: int
+
+
+class Profiler:
+    """
+    Record the resources used by each stage
+
+    Attributes
+    ----------
+    records : list[StageRecord]
+        The records of every stage so far, in the order in which they ended
+    """
+
+    def __init__(self):
+        self.records = []
+        # the peak RSS of each open stage, from before its inner stages reset it
+        self._peaks = []
+
+    @contextmanager
+    def stage(self, name: str, region: Optional[Region] = None):
+        """
+        Record the resources used within a with block
+
+        Stages can be nested. The peak RSS of an outer stage includes the peaks
+        of its inner stages, even though each stage resets the peak when it
+        starts.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        region : Optional[Region], optional
+            The region being processed, if any
+        """
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], _get_peak_rss())
+        self._peaks.append(0)
+        _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            peak_rss = max(_get_peak_rss(), self._peaks.pop())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak_rss)
+            region_name = ""
+            if region is not None:
+                region_name = f"{region.chrom}:{region.start}-{region.end}"
+            self.records.append(
+                StageRecord(
+                    name,
+                    region_name,
+                    time.perf_counter() - wall,
+                    time.process_time() - cpu,
+                    peak_rss,
+                )
+            )
+
+    def summarize(self) -> list[dict]:
+        """
+        Summarize the records of each stage
+
+        Returns
+        -------
+        list[dict]
+            For each stage that was recorded, in the order of STAGES, the number
+            of records, the total wall and CPU time, percentiles and the maximum
+            of the wall time, and the maximum peak RSS in bytes
+        """
+        summary = []
+        names = STAGES + sorted({r.stage for r in self.records} - set(STAGES))
+        for name in names:
+            records = [r for r in self.records if r.stage == name]
+            if not records:
+                continue
+            wall = np.array([r.wall for r in records])
+            row = {
+                "stage": name,
+                "count": len(records),
+                "wall_total": float(wall.sum()),
+                "cpu_total": sum(r.cpu for r in records),
+            }
+            for q, value in zip(PERCENTILES, np.percentile(wall, PERCENTILES)):
+                row[f"wall_p{q}"] = float(value)
+            row["wall_max"] = float(wall.max())
+            row["peak_rss"] = max(r.peak_rss for r in records)
+            summary.append(row)
+        return summary
+
+    def write(self, profile_file: Path):
+        """
+        Write the summary of the records to a file
+
+        Parameters
+        ----------
+        profile_file : Path
+            Path to the file. If it ends with .json, the summary and every
+            record are written as JSON. Otherwise, the summary is written as a
+            TSV
+        """
+        summary = self.summarize()
+        with open(profile_file, "w") as f:
+            if Path(profile_file).suffix == ".json":
+                records = [r._asdict() for r in self.records]
+                json.dump({"summary": summary, "records": records}, f, indent=2)
+                return
+            columns = list(summary[0]) if summary else ["stage", "count"]
+            f.write("\t".join(columns) + "\n")
+            for row in summary:
+                f.write("\t".join(_format(row[col]) for col in columns) + "\n")
+
+
+def stage(name: str, region: Optional[Region] = None):
+    """
+    Record the resources used within a with block, if a Profiler is active
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage. See STAGES
+    region : Optional[Region], optional
+        The region being processed, if any
+
+    Returns
+    -------
+    ContextManager
+        A context manager that records the stage
+    """
+    if _active is None:
+        return _null
+    return _active.stage(name, region)
+
+
+def iter_stage(name: str, items: Iterable, region: Optional[Region] = None) -> Iterable:
+    """
+    Record the resources used to produce each item of an iterable, if a
+    Profiler is active
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage. See STAGES
+    items : Iterable
+        The iterable. If it is a generator, the stage covers the work it does to
+        produce each item
+    region : Optional[Region], optional
+        The region being processed, if any
+
+    Returns
+    -------
+    Iterable
+        The items
+    """
+    if _active is None:
+        return items
+    return _iter_stage(_active, name, iter(items), region)
+
+
+def _iter_stage(
+    profiler: Profiler, name: str, items: Iterator, region: Optional[Region]
+) -> Iterator:
+    while True:
+        with profiler.stage(name, region):
+            item = next(items, _done)
+        if item is _done:
+            return
+        yield item
+
+
+def get_profiler() -> Optional[Profiler]:
+    """
+    Get the active Profiler, or None if there isn't one
+    """
+    return _active
+
+
+@contextmanager
+def profiling(
+    profile_file: Optional[Path] = None,
+    cprofile_file: Optional[Path] = None,
+    log: logging.Logger = None,
+):
+    """
+    Activate a Profiler within a with block and write out what it records
+
+    Parameters
+    ----------
+    profile_file : Optional[Path], optional
+        The file to which to write the summary. See Profiler.write(). If None,
+        no Profiler is activated
+    cprofile_file : Optional[Path], optional
+        The file to which to write statistics from cProfile, in the format read
+        by the pstats module. If None, cProfile is not used
+    log : logging.Logger, optional
+        Logger object
+    """
+    global _active
+    if log is None:
+        log = logging.getLogger("panct")
+    profiler = None
+    if profile_file is not None:
+        profiler = Profiler()
+        _active = profiler
+    cprofiler = None
+    if cprofile_file is not None:
+        import cProfile
+
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+            cprofiler.dump_stats(cprofile_file)
+            log.info(f"Wrote cProfile statistics to {cprofile_file}")
+        if profiler is not None:
+            _active = None
+            profiler.write(profile_file)
+            log.info(f"Wrote a profile of each stage to {profile_file}")
+
+
+def call_profiled(func: Callable, *args) -> tuple[Any, list[StageRecord]]:
+    """
+    Call a function with a new Profiler active
+
+    This is meant for calls in worker processes, whose records must be sent back
+    to the main process and added to its Profiler.
+
+    Parameters
+    ----------
+    func : Callable
+        The function
+    *args
+        The arguments to the function
+
+    Returns
+    -------
+    tuple[Any, list[StageRecord]]
+        The return value of the function and the records of its stages
+    """
+    global _active
+    previous, _active = _active, Profiler()
+    try:
+        return func(*args), _active.records
+    finally:
+        _active = previous
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak resident memory of the process, on Linux
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _get_peak_rss() -> int:
+    """
+    Get the peak resident memory of the process, in bytes
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS but in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format(value) -> str:
+    """
+    Format a value in the summary for a TSV
+    """
+    return f"{value:.6f}" if isinstance(value, float) else str(value)
@@ -0,0 +1,273 @@
+"""
+Report the progress of long-running commands
+
+A Progress object counts the items (ex: regions) and bytes processed so far and,
+at most once every interval, reports the rate at which they are being processed,
+an estimate of the time remaining, and the current memory usage of the process.
+On a terminal, the report is a bar that is redrawn in place. Otherwise, each
+report is logged as a line of key=value pairs, ex:
+
+    progress task=complexity done=120/30000 regions rate=12.0/s eta=0:41:20
+    rss=512.3MB
+
+Counting an item only costs an addition and a call to time.monotonic(), so a
+Progress can be updated in tight loops.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import logging
+import resource
+from pathlib import Path
+from typing import Optional, TextIO
+
+DEFAULT_INTERVAL = 5.0
+BAR_WIDTH = 30
+
+
+class Progress:
+    """
+    Periodically report the progress of a task
+
+    Attributes
+    ----------
+    task : str
+        The name of the task
+    total : Optional[int]
+        The number of items to process, if known
+    total_bytes : Optional[int]
+        The number of bytes to process, if known. The time remaining is
+        estimated from the bytes if the total number of items is unknown
+    unit : Optional[str]
+        What the items are called, or None if only bytes are counted
+    interval : Optional[float]
+        The minimum number of seconds between reports, or None to never report
+    log : logging.Logger
+        The logger to which to report, at the INFO level. Nothing is reported if
+        it doesn't log INFO messages
+    stream : TextIO
+        The stream on which to draw a bar. Defaults to sys.stderr
+    bar : bool
+        Whether to draw a bar instead of logging each report. Defaults to
+        whether the stream is a terminal
+    count : int
+        The number of items processed so far
+    nbytes : int
+        The number of bytes processed so far
+    """
+
+    def __init__(
+        self,
+        task: str,
+        total: Optional[int] = None,
+        unit: Optional[str] = "regions",
+        total_bytes: Optional[int] = None,
+        interval: Optional[float] = DEFAULT_INTERVAL,
+        log: logging.Logger = None,
+        stream: TextIO = None,
+        bar: bool = None,
+    ):
+        self.task = task
+        self.total = total
+        self.total_bytes = total_bytes
+        self.unit = unit
+        self.interval = interval
+        self.count = 0
+        self.nbytes = 0
+        self.log = log if log is not None else logging.getLogger("panct")
+        self.stream = stream if stream is not None else sys.stderr
+        self.bar = self.stream.isatty() if bar is None else bar
+        self.enabled = interval is not None and self.log.isEnabledFor(logging.INFO)
+        self._start = time.monotonic()
+        self._next = self._start + (interval or 0)
+        self._drawn = False
+
+    @classmethod
+    def for_file(
+        cls,
+        task: str,
+        path: Path,
+        interval: Optional[float] = DEFAULT_INTERVAL,
+        log: logging.Logger = None,
+    ) -> Progress:
+        """
+        Create a Progress that counts the bytes parsed from a file
+
+        Parameters
+        ----------
+        task : str
+            The name of the task
+        path : Path
+            The path to the file. If it isn't compressed, its size is used to
+            estimate the time remaining
+        interval : Optional[float], optional
+            The minimum number of seconds between reports, or None to never report
+        log : logging.Logger, optional
+            The logger to which to report
+
+        Returns
+        -------
+        Progress
+            A Progress without a unit, for use with ProgressReader
+        """
+        total_bytes = None
+        if Path(path).suffix != ".gz" and Path(path).is_file():
+            total_bytes = Path(path).stat().st_size
+        return cls(task, unit=None, total_bytes=total_bytes, interval=interval, log=log)
+
+    def __enter__(self) -> Progress:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def update(self, count: int = 1, nbytes: int = 0):
+        """
+        Count some processed items and bytes, and report if it's time to
+
+        Parameters
+        ----------
+        count : int, optional
+            The number of items processed since the last update
+        nbytes : int, optional
+            The number of bytes processed since the last update
+        """
+        self.count += count
+        self.nbytes += nbytes
+        if self.enabled:
+            now = time.monotonic()
+            if now >= self._next:
+                self._next = now + self.interval
+                self.report(now)
+
+    def report(self, now: float = None):
+        """
+        Report the progress so far
+
+        Parameters
+        ----------
+        now : float, optional
+            The current value of time.monotonic()
+        """
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self._start, 1e-9)
+        fraction = None
+        if self.total:
+            fraction = min(self.count / self.total, 1)
+        elif self.total_bytes:
+            fraction = min(self.nbytes / self.total_bytes, 1)
+        eta = None
+        if fraction:
+            eta = elapsed * (1 - fraction) / fraction
+        fields = []
+        if self.unit is not None:
+            done = f"{self.count}" + (f"/{self.total}" if self.total else "")
+            fields.append(("done", f"{done} {self.unit}"))
+            fields.append(("rate", f"{self.count / elapsed:.1f}/s"))
+        if self.nbytes:
+            fields.append(("parsed", _format_bytes(self.nbytes)))
+            fields.append(("speed", f"{_format_bytes(self.nbytes / elapsed)}/s"))
+        if eta is not None:
+            fields.append(("eta", _format_seconds(eta)))
+        fields.append(("rss", _format_bytes(get_rss())))
+        if self.bar:
+            line = " ".join(value for _, value in fields)
+            if fraction is not None:
+                filled = int(fraction * BAR_WIDTH)
+                line = (
+                    f"[{'#' * filled}{'.' * (BAR_WIDTH - filled)}] "
+                    f"{fraction:4.0%} {line}"
+                )
+            # pad the line to overwrite a longer previous line
+            self.stream.write(f"\r{self.task}: {line:<80}")
+            self.stream.flush()
+            self._drawn = True
+        else:
+            line = " ".join(f"{key}={value}" for key, value in fields)
+            self.log.info(f"progress task={self.task} {line}")
+
+    def close(self):
+        """
+        Make a final report, if any reports were made, and finish the bar
+        """
+        if not self.enabled:
+            return
+        if self._drawn or time.monotonic() - self._start >= self.interval:
+            self.report()
+        if self._drawn:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class ProgressReader:
+    """
+    Wrap a file object to count the bytes read from it with a Progress
+
+    For text files, the number of characters is counted instead. The file is
+    assumed to be mostly ASCII.
+
+    Attributes
+    ----------
+    f : IO
+        The file object
+    progress : Progress
+        The Progress to update
+    """
+
+    def __init__(self, f, progress: Progress):
+        self.f = f
+        self.progress = progress
+
+    def read(self, size: int = -1):
+        data = self.f.read(size)
+        self.progress.update(0, len(data))
+        return data
+
+    def readline(self, size: int = -1):
+        line = self.f.readline(size)
+        self.progress.update(0, len(line))
+        return line
+
+    def __iter__(self):
+        update = self.progress.update
+        for line in self.f:
+            update(0, len(line))
+            yield line
+
+
+def get_rss() -> int:
+    """
+    Get the current resident memory of the process
+
+    Returns
+    -------
+    int
+        The resident memory, in bytes. Where it can't be measured, the peak
+        resident memory is returned instead
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS but in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_bytes(nbytes: float) -> str:
+    """
+    Format a number of bytes in MB
+    """
+    return f"{nbytes / 1e6:.1f}MB"
+
+
+def _format_seconds(seconds: float) -> str:
+    """
+    Format a number of seconds as h:mm:ss
+    """
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,255 @@
+"""
+Map reference coordinates to ranges of node IDs
+
+A reference index is created by 'panct walks' from the W lines of the reference
+sample and is stored next to the .walk file. For each contig of the reference,
+it records the position at which the reference path enters each of its nodes.
+It also records the length of every node in the graph, since a .walk file does
+not contain them.
+
+A region of the reference is mapped to the range of node IDs spanned by the
+reference nodes that overlap it. This assumes that the node IDs of the graph
+are sorted topologically, as in graphs built by minigraph-cactus or vg, so that
+the nodes of any bubble along the reference lie within the range.
+
+The index uses the file format described in panct.index.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .data import Region
+from .index import read_index, write_index
+
+REFERENCE_INDEX_SUFFIX = ".ref.pctx"
+
+
+def get_reference_index_path(walk_file: Path) -> Path:
+    """
+    Get the path to the reference index of a .walk file
+
+    Parameters
+    ----------
+    walk_file : Path
+        Path to the .walk file
+
+    Returns
+    -------
+    Path
+        The path to the .walk file with REFERENCE_INDEX_SUFFIX appended to it
+    """
+    return Path(str(walk_file) + REFERENCE_INDEX_SUFFIX)
+
+
+class ReferenceIndex:
+    """
+    Map reference coordinates to ranges of node IDs
+
+    Attributes
+    ----------
+    reference : str
+        The sample ID of the reference
+    contigs : dict[str, tuple[int, int]]
+        The slice of starts and nodes belonging to each contig
+    starts : np.ndarray
+        The position at which the reference enters each of its nodes, sorted
+        within each contig
+    nodes : np.ndarray
+        The ID of each of the reference's nodes
+    node_ids : np.ndarray
+        The sorted IDs of all of the nodes in the graph
+    node_lengths : np.ndarray
+        The length of each node in node_ids
+    """
+
+    def __init__(
+        self,
+        reference: str,
+        contigs: dict[str, tuple[int, int]],
+        starts: np.ndarray,
+        nodes: np.ndarray,
+        node_ids: np.ndarray,
+        node_lengths: np.ndarray,
+    ):
+        self.reference = reference
+        self.contigs = contigs
+        self.starts = starts
+        self.nodes = nodes
+        self.node_ids = node_ids
+        self.node_lengths = node_lengths
+
+    @classmethod
+    def from_walks(
+        cls,
+        reference: str,
+        walks: list[tuple[str, int, np.ndarray]],
+        node_ids: np.ndarray,
+        node_lengths: np.ndarray,
+    ) -> ReferenceIndex:
+        """
+        Create an index from the walks of the reference
+
+        Parameters
+        ----------
+        reference : str
+            The sample ID of the reference
+        walks : list[tuple[str, int, np.ndarray]]
+            The contig, start position, and node IDs of each W line of the
+            reference
+        node_ids : np.ndarray
+            The IDs of all of the nodes in the graph
+        node_lengths : np.ndarray
+            The length of each node in node_ids
+
+        Returns
+        -------
+        ReferenceIndex
+            The index
+
+        Raises
+        ------
+        ValueError
+            If the reference visits a node that is not in node_ids
+        """
+        order = np.argsort(node_ids, kind="stable")
+        node_ids = np.asarray(node_ids, dtype=np.int64)[order]
+        node_lengths = np.asarray(node_lengths, dtype=np.int64)[order]
+        index = cls(reference, {}, None, None, node_ids, node_lengths)
+        by_contig = {}
+        for contig, start, nodes in walks:
+            lengths = index.get_node_lengths(nodes)
+            starts = start + np.cumsum(lengths) - lengths
+            by_contig.setdefault(contig, []).append((starts, nodes))
+        all_starts, all_nodes, offset = [], [], 0
+        for contig, steps in by_contig.items():
+            starts = np.concatenate([s for s, _ in steps])
+            nodes = np.concatenate([n for _, n in steps])
+            # the W lines of a contig may be out of order
+            order = np.argsort(starts, kind="stable")
+            all_starts.append(starts[order])
+            all_nodes.append(nodes[order])
+            index.contigs[contig] = (offset, offset + len(starts))
+            offset += len(starts)
+        index.starts = np.concatenate(all_starts) if walks else np.empty(0, np.int64)
+        index.nodes = np.concatenate(all_nodes) if walks else np.empty(0, np.int64)
+        return index
+
+    @classmethod
+    def read(cls, index_file: Path, walk_file: Path = None) -> ReferenceIndex:
+        """
+        Memory-map a reference index
+
+        Parameters
+        ----------
+        index_file : Path
+            Path to the index
+        walk_file : Path, optional
+            The .walk file next to which the index was created. If given, we
+            check that the index is not stale
+
+        Returns
+        -------
+        ReferenceIndex
+            The index
+
+        Raises
+        ------
+        ValueError
+            If the index is invalid or stale
+        """
+        header, arrays = read_index(index_file, walk_file)
+        if "reference" not in header:
+            raise ValueError(f"{index_file} is not a reference index")
+        return cls(
+            header["reference"],
+            {contig: tuple(span) for contig, span in header["contigs"].items()},
+            arrays["starts"],
+            arrays["nodes"],
+            arrays["node_ids"],
+            arrays["node_lengths"],
+        )
+
+    def write(self, index_file: Path, walk_file: Path):
+        """
+        Write the index to a file
+
+        Parameters
+        ----------
+        index_file : Path
+            Path to the index
+        walk_file : Path
+            The .walk file next to which the index is stored. Its size and
+            modification time are recorded so that stale indices can be detected
+        """
+        arrays = {
+            "starts": self.starts,
+            "nodes": self.nodes,
+            "node_ids": self.node_ids,
+            "node_lengths": self.node_lengths,
+        }
+        extra = {"reference": self.reference, "contigs": self.contigs}
+        write_index(index_file, walk_file, arrays, extra)
+
+    def get_node_lengths(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Look up the lengths of some nodes
+
+        Parameters
+        ----------
+        nodes : np.ndarray
+            The IDs of the nodes
+
+        Returns
+        -------
+        np.ndarray
+            The length of each node
+
+        Raises
+        ------
+        ValueError
+            If any of the nodes are not in the graph
+        """
+        indices = np.searchsorted(self.node_ids, nodes)
+        indices = np.minimum(indices, max(len(self.node_ids) - 1, 0))
+        if len(nodes) and (
+            not len(self.node_ids) or np.any(self.node_ids[indices] != nodes)
+        ):
+            raise ValueError("Some nodes are not in the graph")
+        return self.node_lengths[indices]
+
+    def get_node_range(self, region: Region) -> Optional[tuple[int, int]]:
+        """
+        Find the range of node IDs spanned by a region of the reference
+
+        Parameters
+        ----------
+        region : Region
+            The region, as a half-open interval of reference coordinates
+
+        Returns
+        -------
+        Optional[tuple[int, int]]
+            The smallest and largest IDs of the reference nodes overlapping the
+            region, or None if the reference doesn't overlap it
+        """
+        if region.chrom not in self.contigs:
+            return None
+        lo, hi = self.contigs[region.chrom]
+        starts = self.starts[lo:hi]
+        first = max(int(np.searchsorted(starts, region.start, side="right")) - 1, 0)
+        last = int(np.searchsorted(starts, region.end, side="left"))
+        if first < last:
+            # skip the first node if it ends before the region starts
+            end = (
+                starts[first]
+                + self.get_node_lengths(self.nodes[lo + first : lo + first + 1])[0]
+            )
+            if end <= region.start:
+                first += 1
+        if first >= last:
+            return None
+        nodes = self.nodes[lo + first : lo + last]
+        return int(nodes.min()), int(nodes.max())
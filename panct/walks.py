@@ -2,26 +2,55 @@
 Extract walks (W lines) from a GFA file into an indexed tab-separated format
 """
 
+from __future__ import annotations
+import io
+import sys
 import logging
-import subprocess
-from shutil import which
+import tempfile
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from array import array
+from collections import Counter
+from typing import BinaryIO, Optional
 
-from pysam import tabix_compress, tabix_index
+import numpy as np
+from pysam import tabix_index
 
+from .data import Data
+from .bgzf import BGZFWriter
+from .data.walks import WALK_V2_HEADER, LABELS_PREFIX, WALKS_PREFIX
+from .graph_utils import NodeTable
+from .progress import Progress, ProgressReader
+from .ref_index import ReferenceIndex, get_reference_index_path
 from .logging import getLogger
 
+# the versions of the .walk format that can be written (see panct.data.walks)
+WALK_VERSIONS = [1, 2]
+# the default amount of memory to use for sorting, in MB
+DEFAULT_MEMORY = 1024
+# the approximate number of bytes used by each (node, haplotype) pair while sorting
+PAIR_BYTES = 32
+# translate the orientations between the nodes of a walk into spaces
+_WALK_TABLE = str.maketrans("<>", "  ")
+
 
 def extract_walks(
     graph: Path,
     output: Path = None,
     log: logging.Logger = None,
+    threads: int = 1,
+    memory: int = DEFAULT_MEMORY,
+    version: int = 2,
+    reference: str = "GRCh38",
+    progress_interval: float = None,
 ):
     """
     Creates a .walk file mapping nodes in the graph to sample IDs representing
     haplotypes
 
+    If the output is written to a file and the graph has walks for the reference,
+    we also create a reference index next to it (see panct.ref_index), so that
+    regions of the reference can be looked up in the .walk file.
+
     Parameters
     ----------
     graph : Path
@@ -31,7 +60,23 @@ def extract_walks(
         the graph, but with a .walk.gz file ending, instead.
     log : Logger, optional
         A logging module to which to write messages about progress and any errors
+    threads : int, optional
+        The number of threads to use for decompressing the GFA and compressing the
+        output
+    memory : int, optional
+        The approximate amount of memory, in MB, to use for sorting before
+        spilling sorted runs to temporary files
+    version : int, optional
+        The version of the .walk format to write. Options: see WALK_VERSIONS
+    reference : str, optional
+        The sample ID of the reference, or an empty string to skip creating a
+        reference index
+    progress_interval : float, optional
+        If given, report how much of the graph has been parsed at most this often,
+        in seconds. See panct.progress
     """
+    if version not in WALK_VERSIONS:
+        raise ValueError(f"Invalid .walk version {version}")
     if log is None:
         log = getLogger(name="walks", level="ERROR")
 
@@ -43,40 +88,39 @@ def extract_walks(
     elif output == Path("/dev/stdout") or output == Path("-"):
         output = Path("")
 
-    also_index = False
-    tmp_walk = None
-    gz_file = output
-    if output.suffix == ".gz":
-        also_index = True
-        if which("bgzip") is None:
-            # if bgzip isn't installed, we need to bgzip the output ourselves
-            # so we first create an uncompressed file in $TMPDIR called tmp_walk
-            gz_file = output.with_suffix("").with_suffix(".walk.gz")
-            tmp_walk = NamedTemporaryFile(delete=False)
-            output = Path(tmp_walk.name)
-
-    # what is the path to the shell script build_node_sample_map.sh ?
-    script_path = Path(__file__).parent / "build_node_sample_map.sh"
-
-    args = [script_path, graph]
-    # is the output stdout?
-    if output != Path(""):
-        args.append(output)
+    also_index = output.suffix == ".gz"
+    if output == Path(""):
+        # write to the file descriptor, since sys.stdout may have been replaced
+        sys.stdout.flush()
+        out = open(1, "wb", closefd=False)
+    elif also_index:
+        out = io.BufferedWriter(BGZFWriter(output, threads))
+    else:
+        out = open(output, "wb")
 
     log.info("Building a mapping of nodes to samples")
-    subprocess.run(args, text=True, check=True)
+    max_pairs = max(memory * (1 << 20) // PAIR_BYTES, 1)
+    progress = Progress.for_file("walks", graph, progress_interval, log)
+    try:
+        ref_index = write_walks(
+            graph,
+            out,
+            threads,
+            max_pairs,
+            log,
+            version,
+            reference or None,
+            progress if progress.enabled else None,
+        )
+    finally:
+        out.close()
+        progress.close()
 
-    # bgzip and tabix index the resulting file
+    # tabix index the resulting file
     if also_index:
-        if tmp_walk is not None:
-            log.info("Bgzipping the output file")
-            tabix_compress(str(output), str(gz_file), force=True)
-            # now, properly close and delete the temporary file
-            tmp_walk.close()
-            output.unlink()
         try:
             log.info("Indexing the output file")
-            tabix_index(str(gz_file), seq_col=0, start_col=1, end_col=1, force=True)
+            tabix_index(str(output), seq_col=0, start_col=1, end_col=1, force=True)
         except OSError as e:
             # check if the error message matches what we expect if the file is unsorted
             if str(e).startswith("building of index for "):
@@ -84,3 +128,272 @@ def extract_walks(
             else:
                 # otherwise, re-raise it
                 raise
+
+    if ref_index is not None and output != Path(""):
+        index_file = get_reference_index_path(output)
+        log.info(f"Writing a reference index to {index_file}")
+        ref_index.write(index_file, output)
+
+
+def parse_walk(walk: str) -> np.ndarray:
+    """
+    Get the node IDs in the walk string of a W line
+
+    Parameters
+    ----------
+    walk : str
+        The walk, ex: '>1<2>3'
+
+    Returns
+    -------
+    np.ndarray
+        The node IDs as integers, ex: [1, 2, 3]
+
+    Raises
+    ------
+    ValueError
+        If a node ID is not an integer
+    """
+    num_nodes = walk.count(">") + walk.count("<")
+    node_ids = walk.translate(_WALK_TABLE).split()
+    if len(node_ids) != num_nodes or (walk and not walk.startswith((">", "<"))):
+        raise ValueError(f"Malformed walk {walk[:50]}")
+    try:
+        return np.array(node_ids, dtype=np.int64)
+    except ValueError:
+        raise ValueError("Node IDs must be integers")
+
+
+def write_walks(
+    graph: Path,
+    out: BinaryIO,
+    threads: int = 1,
+    max_pairs: int = 1 << 25,
+    log: logging.Logger = None,
+    version: int = 2,
+    reference: str = None,
+    progress: Progress = None,
+) -> Optional[ReferenceIndex]:
+    """
+    Write the haplotypes passing through each node of a GFA file
+
+    Every W line is parsed into (node, haplotype) pairs of integers. The pairs are
+    sorted by node in runs of at most max_pairs, and any runs that don't fit in
+    memory are written to temporary files (in $TMPDIR). The sorted runs are then
+    merged block by block, so memory use stays bounded no matter the size of the
+    graph.
+
+    Each line of the output is a tab, the node ID, and the visits to the node,
+    sorted by their "sample:haplotype" labels. See panct.data.walks for how the
+    visits are encoded in each version of the format. Version 2 files also
+    record the number of W lines of each haplotype in their header.
+
+    Parameters
+    ----------
+    graph : Path
+        The path to a pangenome graph in GFA format (optionally ending in .gz)
+    out : BinaryIO
+        The stream to which to write the output
+    threads : int, optional
+        The number of threads to use for decompressing a BGZF-compressed GFA
+    max_pairs : int, optional
+        The maximum number of pairs to sort in memory at a time
+    log : Logger, optional
+        A logging module to which to write messages about progress
+    version : int, optional
+        The version of the .walk format to write
+    reference : str, optional
+        The sample ID of the reference. If given, we also collect the lengths of
+        the nodes and the walks of the reference to create a reference index
+    progress : Progress, optional
+        A Progress to which to count the bytes of the GFA as they are parsed
+
+    Returns
+    -------
+    Optional[ReferenceIndex]
+        The reference index, if a reference was given and it has walks in the
+        graph with known node lengths
+
+    Raises
+    ------
+    ValueError
+        If a node ID is not an integer
+    """
+    if log is None:
+        log = getLogger(name="walks", level="ERROR")
+    labels = {}
+    num_walks = Counter()
+    node_ids, node_lengths, ref_walks = array("q"), array("q"), []
+    with tempfile.TemporaryDirectory(prefix="panct-walks-") as tmpdir:
+        sorter = _PairSorter(max_pairs, Path(tmpdir), log)
+        with Data.hook_compressed(graph, "r", threads) as gfa:
+            if progress is not None:
+                gfa = ProgressReader(gfa, progress)
+            for line in gfa:
+                linetype = line[:1]
+                if linetype == "S" and reference is not None:
+                    fields = line.rstrip("\n").split("\t")
+                    try:
+                        node_lengths.append(NodeTable._get_node_length(fields))
+                    except ValueError:
+                        log.warning("Skipping the reference index: unknown node length")
+                        reference = None
+                        continue
+                    node_ids.append(int(fields[1]))
+                if linetype != "W":
+                    continue
+                fields = line.rstrip("\n").split("\t", 7)
+                label = labels.setdefault(f"{fields[1]}:{fields[2]}", len(labels))
+                num_walks[label] += 1
+                nodes = parse_walk(fields[6])
+                sorter.add(nodes, label)
+                if fields[1] == reference:
+                    start = int(fields[4]) if fields[4] != "*" else 0
+                    ref_walks.append((fields[3], start, nodes))
+        # the labels of each node are sorted by name
+        names = np.array(list(labels), dtype=object)
+        ranks = np.empty(len(labels), dtype=np.int64)
+        order = np.argsort(names)
+        ranks[order] = np.arange(len(labels))
+        names = names[order]
+        if version > 1:
+            out.write(f"{WALK_V2_HEADER}\n{LABELS_PREFIX}\t".encode())
+            out.write(("\t".join(names) + "\n").encode())
+            counts = "\t".join(str(num_walks[label]) for label in order.tolist())
+            out.write(f"{WALKS_PREFIX}\t{counts}\n".encode())
+        for nodes, node_labels in sorter.merge():
+            node_ranks = ranks[node_labels]
+            order = np.lexsort((node_ranks, nodes))
+            if version > 1:
+                out.write(_format_lines_v2(nodes[order], node_ranks[order]))
+            else:
+                out.write(_format_lines(nodes[order], names[node_ranks[order]]))
+    if reference is None or not ref_walks:
+        return None
+    return ReferenceIndex.from_walks(reference, ref_walks, node_ids, node_lengths)
+
+
+def _format_lines(nodes: np.ndarray, labels: np.ndarray) -> bytes:
+    """
+    Format sorted (node, label) pairs as lines of a version 1 .walk file
+    """
+    if not len(nodes):
+        return b""
+    starts = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+    ends = np.r_[starts[1:], len(nodes)]
+    lines = [
+        f"\t{node}\t" + "\t".join(labels[start:end]) + "\n"
+        for node, start, end in zip(nodes[starts].tolist(), starts, ends)
+    ]
+    return "".join(lines).encode()
+
+
+def _format_lines_v2(nodes: np.ndarray, ids: np.ndarray) -> bytes:
+    """
+    Format sorted (node, label ID) pairs as lines of a version 2 .walk file
+    """
+    if not len(nodes):
+        return b""
+    starts = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+    ends = np.r_[starts[1:], len(nodes)]
+    # the IDs of each node are stored as differences from the previous ID
+    deltas = np.diff(ids, prepend=0)
+    deltas[starts] = ids[starts]
+    deltas = deltas.astype(str)
+    lines = [
+        f"\t{node}\t" + ",".join(deltas[start:end]) + "\n"
+        for node, start, end in zip(nodes[starts].tolist(), starts, ends)
+    ]
+    return "".join(lines).encode()
+
+
+class _PairSorter:
+    """
+    Sort (node, label) pairs by node in bounded memory
+    """
+
+    def __init__(self, max_pairs: int, tmpdir: Path, log: logging.Logger):
+        self.max_pairs = max_pairs
+        self.tmpdir = tmpdir
+        self.log = log
+        self._nodes = []
+        self._labels = []
+        self._num_pairs = 0
+        self._runs = []
+
+    def add(self, nodes: np.ndarray, label: int):
+        """
+        Add the nodes visited by a haplotype
+        """
+        self._nodes.append(nodes)
+        self._labels.append(np.full(len(nodes), label, dtype=np.int32))
+        self._num_pairs += len(nodes)
+        if self._num_pairs >= self.max_pairs:
+            self._spill()
+
+    def _sort(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Sort the pairs in memory by node
+        """
+        nodes = np.concatenate(self._nodes) if self._nodes else np.empty(0, np.int64)
+        labels = np.concatenate(self._labels) if self._labels else np.empty(0, np.int32)
+        self._nodes, self._labels, self._num_pairs = [], [], 0
+        order = np.argsort(nodes, kind="stable")
+        return nodes[order], labels[order]
+
+    def _spill(self):
+        """
+        Write the pairs in memory to a sorted run in a temporary file
+        """
+        nodes, labels = self._sort()
+        prefix = self.tmpdir / f"run{len(self._runs)}"
+        np.save(f"{prefix}.nodes.npy", nodes)
+        np.save(f"{prefix}.labels.npy", labels)
+        self.log.debug(f"Wrote a sorted run of {len(nodes)} pairs to {prefix}")
+        self._runs.append(prefix)
+
+    def merge(self):
+        """
+        Merge the sorted runs
+
+        Yields
+        ------
+        tuple[np.ndarray, np.ndarray]
+            Blocks of nodes and labels. All pairs for a node are in the same
+            block, and blocks are yielded in order of their nodes
+        """
+        if not self._runs:
+            yield self._sort()
+            return
+        if self._num_pairs:
+            self._spill()
+        runs = [
+            (
+                np.load(f"{prefix}.nodes.npy", mmap_mode="r"),
+                np.load(f"{prefix}.labels.npy", mmap_mode="r"),
+            )
+            for prefix in self._runs
+        ]
+        block = max(self.max_pairs // len(runs), 1)
+        positions = [0] * len(runs)
+        while True:
+            # every pair up to the smallest of the last nodes of each run's next
+            # block can be merged without looking further into any run
+            bounds = [
+                nodes[min(pos + block, len(nodes)) - 1]
+                for (nodes, _), pos in zip(runs, positions)
+                if pos < len(nodes)
+            ]
+            if not bounds:
+                return
+            bound = min(bounds)
+            merged_nodes, merged_labels = [], []
+            for i, (nodes, labels) in enumerate(runs):
+                pos = positions[i]
+                end = pos + int(np.searchsorted(nodes[pos:], bound, side="right"))
+                merged_nodes.append(nodes[pos:end])
+                merged_labels.append(labels[pos:end])
+                positions[i] = end
+            nodes = np.concatenate(merged_nodes)
+            order = np.argsort(nodes, kind="stable")
+            yield nodes[order], np.concatenate(merged_labels)[order]
@@ -0,0 +1,506 @@
+"""
+Compute complexity in sliding windows along the reference
+
+Every node is anchored to an interval of the reference: nodes on the reference
+path cover their own span, while all other nodes are assigned the span of the
+last reference node that precedes them in the first walk that visits them, so
+that a bubble belongs with its left flank. A node is in a window if its interval
+overlaps the window, and a walk is in a window if it visits any node in it.
+
+Both complexity metrics can be written in terms of sums over the nodes in a
+window. With W walks in the window and c_n walks visiting node n,
+
+    sum_n len(n)*p_n*(1-p_n) = S1/W - S2/W^2
+
+where S1 = sum_n len(n)*c_n and S2 = sum_n len(n)*c_n^2. The total length of
+the walks is sum_n len(n)*v_n, where v_n is the number of visits to node n. So
+as the window slides, we only need to add the nodes that enter it, subtract the
+nodes that leave it, and keep a count of the nodes in the window visited by each
+walk in order to know W.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from collections import Counter
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from .data import Data, Region
+from . import graph_utils as gutils
+
+
+class WindowSums(NamedTuple):
+    """
+    The sums over the nodes in a window from which complexity is computed
+
+    Attributes
+    ----------
+    numnodes : int
+        The number of nodes in the window
+    total_length : int
+        The total length of the nodes in the window
+    numwalks : int
+        The number of walks that visit at least one node in the window
+    total_walk_length : int
+        The total length of the walks within the window
+    sum_len_count : int
+        The sum of len(n)*c_n over the nodes, where c_n is the number of walks
+        that visit node n
+    sum_len_count2 : int
+        The sum of len(n)*c_n^2 over the nodes
+    """
+
+    numnodes: int
+    total_length: int
+    numwalks: int
+    total_walk_length: int
+    sum_len_count: int
+    sum_len_count2: int
+
+    @classmethod
+    def from_node_table(cls, node_table: gutils.NodeTable) -> WindowSums:
+        """
+        Compute the sums over all of the nodes and walks in a node table
+
+        Parameters
+        ----------
+        node_table : NodeTable
+            The node table
+
+        Returns
+        -------
+        WindowSums
+            The sums for the node table
+        """
+        lengths = np.asarray(node_table.get_node_lengths(), dtype=np.int64)
+        counts = np.asarray(node_table.get_node_counts(), dtype=np.int64)
+        return cls(
+            len(lengths),
+            int(lengths.sum()),
+            node_table.numwalks,
+            int(np.sum(node_table.walk_lengths, dtype=np.int64)),
+            int((lengths * counts).sum()),
+            int((lengths * counts * counts).sum()),
+        )
+
+    def combine(self, other: WindowSums) -> WindowSums:
+        """
+        Combine the sums of two windows into the sums of their union
+
+        Every sum is added, except for the number of walks: a walk that visits
+        both windows should only be counted once, so we use the larger of the two
+        numbers of walks. This is exact when the walks of one window are a subset
+        of the walks of the other, as is usually the case for adjacent windows.
+        The windows must not share any nodes.
+
+        Parameters
+        ----------
+        other : WindowSums
+            The sums of the other window
+
+        Returns
+        -------
+        WindowSums
+            The sums of the combined window
+        """
+        combined = [a + b for a, b in zip(self, other)]
+        combined[2] = max(self.numwalks, other.numwalks)
+        return WindowSums(*combined)
+
+    def get_complexities(self, metrics: list[str]) -> list[Optional[float]]:
+        """
+        Compute complexity metrics from the sums
+
+        Parameters
+        ----------
+        metrics : list[str]
+            Which metrics to compute. See complexity.compute_complexity()
+
+        Returns
+        -------
+        list[Optional[float]]
+            Complexity scores, in the same order as the metrics. The scores are
+            None if there are no walks through the window
+        """
+        if self.numwalks == 0:
+            return [None] * len(metrics)
+        walks = self.numwalks
+        numerator = (self.sum_len_count * walks - self.sum_len_count2) / walks**2
+        complexities = []
+        for metric in metrics:
+            if metric == "sequniq-normwalk":
+                complexities.append(numerator / (self.total_walk_length / walks))
+            elif metric == "sequniq-normnode":
+                complexities.append(numerator / (self.total_length / self.numnodes))
+            else:
+                raise ValueError(f"Invalid metric {metric}")
+        return complexities
+
+
+class SlidingWindow:
+    """
+    Slide a window along the reference, updating the sums over the nodes in it
+
+    Attributes
+    ----------
+    node_table : NodeTable
+        The nodes and walks of the graph
+    contigs : list[str]
+        The names of the reference contigs
+    spans : dict[str, tuple[int, int]]
+        The start and end of the reference path on each contig
+    """
+
+    def __init__(
+        self,
+        node_table: gutils.NodeTable,
+        anchors: dict[str, tuple[str, int, int]],
+        visits: Counter,
+    ):
+        """
+        Index the nodes of a graph by their reference intervals
+
+        Parameters
+        ----------
+        node_table : NodeTable
+            The nodes and walks of the graph, excluding the reference
+        anchors : dict[str, tuple[str, int, int]]
+            The contig, start, and end of the reference interval of each node.
+            Nodes without an interval are never in any window
+        visits : Counter
+            The number of times that the walks visit each node
+        """
+        self.node_table = node_table
+        self.contigs = []
+        self.spans = {}
+        self._contig_index = contig_index = {}
+        label_index = {}
+        node_ids = [n for n in anchors if n in node_table.nodes]
+        num_nodes = len(node_ids)
+        self._contig = np.empty(num_nodes, dtype=np.int32)
+        self._start = np.empty(num_nodes, dtype=np.int64)
+        self._end = np.empty(num_nodes, dtype=np.int64)
+        self._length = np.empty(num_nodes, dtype=np.int64)
+        self._count = np.empty(num_nodes, dtype=np.int64)
+        self._visits = np.empty(num_nodes, dtype=np.int64)
+        self._indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        labels = []
+        for i, nodeid in enumerate(node_ids):
+            contig, start, end = anchors[nodeid]
+            if contig not in contig_index:
+                contig_index[contig] = len(self.contigs)
+                self.contigs.append(contig)
+                self.spans[contig] = (start, end)
+            span = self.spans[contig]
+            self.spans[contig] = (min(span[0], start), max(span[1], end))
+            node = node_table.nodes[nodeid]
+            self._contig[i] = contig_index[contig]
+            self._start[i] = start
+            self._end[i] = end
+            self._length[i] = node.length
+            self._count[i] = len(node.samples)
+            self._visits[i] = visits[nodeid]
+            self._indptr[i + 1] = self._indptr[i] + len(node.samples)
+            labels.extend(
+                label_index.setdefault(label, len(label_index))
+                for label in node.samples
+            )
+        self._labels = np.array(labels, dtype=np.int64)
+        self._num_labels = len(label_index)
+
+    @classmethod
+    def from_gfa(
+        cls,
+        gfa_file: Path,
+        reference: str,
+        exclude_samples: list[str] = [],
+        threads: int = 1,
+    ) -> SlidingWindow:
+        """
+        Load the nodes and walks of a GFA file
+
+        The file is read twice: first for the nodes and the walks of the
+        reference, which determine the reference intervals, and then for the
+        walks of the other samples. Walks are streamed with
+        graph_utils.iter_gfa_records(), so no walk is ever held in memory.
+
+        Parameters
+        ----------
+        gfa_file : Path
+            Path to the GFA file (optionally ending in .gz)
+        reference : str
+            The sample name of the reference
+        exclude_samples : list[str], optional
+            Other samples whose walks should be ignored
+        threads : int, optional
+            Number of threads to use to decompress a BGZF-compressed GFA
+
+        Returns
+        -------
+        SlidingWindow
+            The graph, ready to be scanned
+
+        Raises
+        ------
+        ValueError
+            If a walk visits a node that is not in the graph
+        """
+        node_table = gutils.NodeTable()
+        anchors = {}
+        with Data.hook_compressed(gfa_file, "r", threads) as gfa:
+            for line, walk in gutils.iter_gfa_records(gfa):
+                if line[:1] == "S":
+                    fields = line.split("\t")
+                    length = gutils.NodeTable._get_node_length(fields)
+                    node_table.add_node(gutils.Node(fields[1], length))
+                elif walk is not None and line.split("\t", 2)[1] == reference:
+                    fields = line.split("\t")
+                    start = int(fields[4])
+                    for nodelist, _ in gutils.iter_walk_steps(walk):
+                        start = cls._anchor_reference(
+                            node_table, anchors, fields[3], start, nodelist
+                        )
+        exclude = set(exclude_samples) | {reference}
+        visits = Counter()
+        with Data.hook_compressed(gfa_file, "r", threads) as gfa:
+            for line, walk in gutils.iter_gfa_records(gfa):
+                if walk is None:
+                    continue
+                fields = line.split("\t", 3)
+                if fields[1] in exclude:
+                    continue
+                batches = cls._iter_walk_batches(walk, anchors, visits)
+                _, missing = node_table.add_walk_stream(
+                    f"{fields[1]}:{fields[2]}", batches
+                )
+                if missing:
+                    raise ValueError(f"Encountered unknown node {missing[0]}")
+        return cls(node_table, anchors, visits)
+
+    @classmethod
+    def from_gbz(cls, gbz_file: Path, region: Region, reference: str) -> SlidingWindow:
+        """
+        Extract a large region of a GBZ file
+
+        Each fragment of a haplotype in the region is a separate walk, like in
+        complexity.process_region().
+
+        Parameters
+        ----------
+        gbz_file : Path
+            Path to the GBZ file. Its .gbz.db database must exist
+        region : Region
+            The region to extract
+        reference : str
+            The sample name of the reference
+
+        Returns
+        -------
+        SlidingWindow
+            The region, ready to be scanned
+
+        Raises
+        ------
+        ValueError
+            If the region is not on an indexed reference path
+        """
+        from .gbz_utils import get_gbzbase
+
+        db = get_gbzbase(gbz_file)
+        # index the reference path beyond the region, so that the nodes added as
+        # context are anchored to their own positions instead of to the flanks
+        ref_path = db.index_reference(
+            reference,
+            Region(
+                region.chrom,
+                max(region.start - db.context, 0),
+                region.end + db.context,
+            ),
+        )
+        lengths, fragments = db.extract_region(region, reference)
+        node_table = gutils.NodeTable()
+        for node, length in lengths.items():
+            node_table.add_node(gutils.Node(str(node), length))
+        anchors = {}
+        nodes = node_table.nodes
+        for pos, handle in zip(ref_path.positions.tolist(), ref_path.handles.tolist()):
+            nodeid = str(handle // 2)
+            # the search for context stops at long nodes, so reference nodes near
+            # the ends of the indexed span may not have been extracted
+            if nodeid in nodes:
+                anchors.setdefault(
+                    nodeid, (region.chrom, pos, pos + nodes[nodeid].length)
+                )
+        visits = Counter()
+        for i, fragment in enumerate(fragments):
+            nodelist = [str(handle // 2) for handle in fragment]
+            node_table.add_walk(f"{db.FRAGMENT_SAMPLE}:{i}", nodelist)
+            visits.update(nodelist)
+            cls._anchor_walk(anchors, nodelist)
+        return cls(node_table, anchors, visits)
+
+    @staticmethod
+    def _anchor_reference(
+        node_table: gutils.NodeTable,
+        anchors: dict[str, tuple[str, int, int]],
+        contig: str,
+        start: int,
+        nodelist: list[str],
+    ) -> int:
+        """
+        Assign each node of a reference walk the interval that it covers
+
+        Returns
+        -------
+        int
+            The end of the last node, where the next node of the walk starts
+        """
+        nodes = node_table.nodes
+        for nodeid in nodelist:
+            try:
+                end = start + nodes[nodeid].length
+            except KeyError:
+                raise ValueError(f"Encountered unknown node {nodeid}")
+            anchors.setdefault(nodeid, (contig, start, end))
+            start = end
+        return start
+
+    @classmethod
+    def _iter_walk_batches(
+        cls,
+        walk: Iterable[str],
+        anchors: dict[str, tuple[str, int, int]],
+        visits: Counter,
+    ) -> Iterator[list[str]]:
+        """
+        Yield consecutive batches of the node IDs of a walk from
+        graph_utils.iter_gfa_records(), anchoring them with _anchor_walk() and
+        counting their visits along the way
+        """
+        state = None
+        for nodelist, _ in gutils.iter_walk_steps(walk):
+            visits.update(nodelist)
+            state = cls._anchor_walk(anchors, nodelist, state)
+            yield nodelist
+
+    @staticmethod
+    def _anchor_walk(
+        anchors: dict[str, tuple[str, int, int]],
+        nodelist: list[str],
+        state: tuple[Optional[tuple[str, int, int]], list[str]] = None,
+    ) -> tuple[Optional[tuple[str, int, int]], list[str]]:
+        """
+        Assign the nodes of a walk that are not yet anchored the interval of the
+        last anchored node before them, or of the first one after them if there
+        is none
+
+        A walk can be anchored in consecutive batches of nodes by passing the
+        state returned for each batch to the call for the next one
+        """
+        last, unanchored = state or (None, [])
+        for nodeid in nodelist:
+            anchor = anchors.get(nodeid)
+            if anchor is not None:
+                if unanchored:
+                    for other in unanchored:
+                        anchors.setdefault(other, anchor)
+                    unanchored = []
+                last = anchor
+            elif last is not None:
+                anchors[nodeid] = last
+            else:
+                unanchored.append(nodeid)
+        return last, unanchored
+
+    def iter_windows(
+        self, region: Region, window: int, step: int, by_start: bool = False
+    ) -> Iterator[tuple[Region, WindowSums]]:
+        """
+        Slide a window across a region, yielding the sums for each position
+
+        Windows start every step bp from the start of the region until its end.
+        Windows that extend past the end of the region are truncated, like the
+        ones created by bedtools makewindows.
+
+        If by_start is True, a node is only in a window if the start of its
+        interval is. Non-overlapping windows then partition the nodes, so that
+        their sums can be added up to get the sums for larger windows. See
+        WindowSums.combine()
+
+        Parameters
+        ----------
+        region : Region
+            The region to scan
+        window : int
+            The size of each window
+        step : int
+            The distance between the starts of consecutive windows
+        by_start : bool, optional
+            Whether to assign each node only to the windows containing its start,
+            instead of to all of the windows that it overlaps
+
+        Yields
+        ------
+        tuple[Region, WindowSums]
+            Each window and the sums over the nodes in it
+        """
+        if region.chrom in self._contig_index:
+            nodes = np.flatnonzero(self._contig == self._contig_index[region.chrom])
+        else:
+            nodes = np.empty(0, dtype=np.int64)
+        entering = nodes[np.argsort(self._start[nodes], kind="stable")]
+        # a node assigned by its start leaves once the window has passed it
+        node_ends = self._start + 1 if by_start else self._end
+        leaving = nodes[np.argsort(node_ends[nodes], kind="stable")]
+        starts = self._start[entering]
+        ends = node_ends[leaving]
+        refcount = np.zeros(self._num_labels, dtype=np.int64)
+        sums = np.zeros(len(WindowSums._fields), dtype=np.int64)
+        added = removed = 0
+        for start in range(region.start, region.end, step):
+            end = min(start + window, region.end)
+            # nodes enter once the window reaches their start...
+            last = np.searchsorted(starts, end, side="left")
+            self._update(entering[added:last], 1, refcount, sums)
+            added = last
+            # ...and leave once the window has passed their end
+            last = np.searchsorted(ends, start, side="right")
+            self._update(leaving[removed:last], -1, refcount, sums)
+            removed = last
+            yield Region(region.chrom, start, end), WindowSums(*sums.tolist())
+
+    def _update(
+        self, nodes: np.ndarray, sign: int, refcount: np.ndarray, sums: np.ndarray
+    ):
+        """
+        Add (sign=1) or remove (sign=-1) nodes from the window, updating the
+        number of nodes in the window visited by each walk and the sums in place
+        """
+        if not len(nodes):
+            return
+        starts = self._indptr[nodes]
+        counts = self._indptr[nodes + 1] - starts
+        # gather the walks of all of the nodes from the CSR arrays
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        labels = self._labels[offsets + np.arange(counts.sum())]
+        labels, changes = np.unique(labels, return_counts=True)
+        before = refcount[labels]
+        refcount[labels] = before + sign * changes
+        if sign > 0:
+            numwalks = np.count_nonzero(before == 0)
+        else:
+            numwalks = np.count_nonzero(refcount[labels] == 0)
+        length = self._length[nodes]
+        count = self._count[nodes]
+        sums += sign * np.array(
+            [
+                len(nodes),
+                length.sum(),
+                numwalks,
+                (length * self._visits[nodes]).sum(),
+                (length * count).sum(),
+                (length * count * count).sum(),
+            ],
+            dtype=np.int64,
+        )
@@ -0,0 +1,101 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from panct.__main__ import app
+from panct.data import Region
+from panct.window import WindowSums
+from panct.complexity import main as complexity_main
+from panct.aggregate import WindowAggregator, main, read_partial_sums
+
+DATADIR = Path(__file__).parent.joinpath("data")
+runner = CliRunner()
+
+
+def test_window_sums_combine():
+    a = WindowSums(1, 8, 3, 24, 24, 72)
+    b = WindowSums(1, 2, 2, 4, 4, 8)
+    # the number of walks is approximated by the larger of the two
+    assert a.combine(b) == WindowSums(2, 10, 3, 28, 28, 80)
+    assert a.combine(b).get_complexities(["sequniq-normwalk"]) == pytest.approx(
+        [0.047619047619047616]
+    )
+
+
+def test_window_aggregator():
+    sums = WindowSums(1, 1, 1, 1, 1, 1)
+    aggregator = WindowAggregator(10)
+    finished = [
+        aggregator.add(Region(chrom, start, start + 5), sums)
+        for chrom, start in (("chr1", 0), ("chr1", 5), ("chr1", 10), ("chr2", 0))
+    ]
+    assert finished[:2] == [None, None]
+    region, combined = finished[2]
+    assert (region.chrom, region.start, region.end) == ("chr1", 0, 10)
+    assert combined == WindowSums(2, 2, 1, 2, 2, 2)
+    region, combined = finished[3]
+    assert (region.chrom, region.start, region.end) == ("chr1", 10, 15)
+    region, combined = aggregator.flush()
+    assert (region.chrom, region.start, region.end) == ("chr2", 0, 5)
+    assert aggregator.flush() is None
+
+    # windows must be sorted and grouped by contig
+    aggregator = WindowAggregator(10)
+    aggregator.add(Region("chr1", 20, 25), sums)
+    aggregator.add(Region("chr2", 0, 5), sums)
+    with pytest.raises(ValueError):
+        aggregator.add(Region("chr1", 30, 35), sums)
+    aggregator = WindowAggregator(10)
+    aggregator.add(Region("chr1", 20, 25), sums)
+    with pytest.raises(ValueError):
+        aggregator.add(Region("chr1", 0, 5), sums)
+
+
+def test_aggregate(tmp_path):
+    """
+    panct complexity --partial-sums --window 2 -o partial.tsv tests/data/basic.gfa
+    panct complexity-aggregate -s 4,10 -o 'agg{size}.tsv' partial.tsv
+    """
+    partial_file = tmp_path / "partial.tsv"
+    cmd = f"complexity --partial-sums --window 2 -o {partial_file} "
+    cmd += str(DATADIR / "basic.gfa")
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    windows = list(read_partial_sums(partial_file))
+    assert [w[0].start for w in windows] == [0, 2, 4, 6, 8]
+    assert windows[0][1] == WindowSums(1, 8, 3, 24, 24, 72)
+
+    out_file = str(tmp_path / "agg{size}.tsv")
+    cmd = f"complexity-aggregate -s 4,10 -o {out_file} {partial_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    header = "chrom\tstart\tend\tnumnodes\ttotal_length\tnumwalks\tsequniq-normwalk\n"
+    assert (tmp_path / "agg4.tsv").read_text() == header + (
+        "chrTest\t0\t4\t1\t8\t3\t0.0\n"
+        "chrTest\t4\t8\t0\t0\t0\tNone\n"
+        "chrTest\t8\t10\t1\t2\t2\t0.0\n"
+    )
+    # the coarsest resolution should match computing complexity on the whole graph
+    assert (tmp_path / "agg10.tsv").read_text() == header + (
+        "chrTest\t0\t10\t2\t10\t3\t0.047619047619047616\n"
+    )
+
+    # the partial sums can also be read from and written to BGZF files
+    gz_file = tmp_path / "partial.tsv.gz"
+    assert (
+        complexity_main(DATADIR / "basic.gfa", gz_file, window=2, partial_sums=True)
+        == 0
+    )
+    assert [w[1] for w in read_partial_sums(gz_file)] == [w[1] for w in windows]
+    assert main(gz_file, tmp_path / "agg10.tsv.gz", "10") == 0
+    with gzip.open(tmp_path / "agg10.tsv.gz", "rt") as f:
+        assert f.read() == (tmp_path / "agg10.tsv").read_text()
+
+    # several sizes need a placeholder in the output file name
+    assert main(partial_file, tmp_path / "agg.tsv", "4,10") == 1
+    # partial sums can't be computed for overlapping windows
+    assert complexity_main(
+        DATADIR / "basic.gfa", partial_file, window=4, step=2, partial_sums=True
+    )
@@ -0,0 +1,65 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from pysam import tabix_compress
+
+from panct.data import Data
+from panct.bgzf import BGZFReader, BGZFWriter, is_bgzf
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+
+def _make_text(num_lines: int = 20000) -> str:
+    return "".join(f"S\t{i}\t{'ACGT' * (i % 7 + 1)}\n" for i in range(num_lines))
+
+
+def test_is_bgzf(tmp_path):
+    assert is_bgzf(DATADIR / "basic.walk.gz")
+    assert not is_bgzf(DATADIR / "basic.walk")
+    gz_file = tmp_path / "basic.walk.gz"
+    with gzip.open(gz_file, "wt") as f:
+        f.write((DATADIR / "basic.walk").read_text())
+    assert not is_bgzf(gz_file)
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_bgzf_reader(tmp_path, threads):
+    text = _make_text()
+    txt_file = tmp_path / "test.txt"
+    txt_file.write_text(text)
+    bgz_file = tmp_path / "test.txt.gz"
+    tabix_compress(str(txt_file), str(bgz_file))
+
+    # the file should span many BGZF blocks
+    with BGZFReader(bgz_file, threads) as f:
+        assert f.readall().decode() == text
+
+    with Data.hook_compressed(bgz_file, "r", threads) as f:
+        assert f.read() == text
+    with Data.hook_compressed(bgz_file, "r", threads) as f:
+        assert list(f) == text.splitlines(keepends=True)
+
+
+def test_bgzf_reader_invalid(tmp_path):
+    gz_file = tmp_path / "test.txt.gz"
+    with gzip.open(gz_file, "wt") as f:
+        f.write(_make_text(10))
+    with pytest.raises(OSError):
+        with BGZFReader(gz_file, 2) as f:
+            f.readall()
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_bgzf_writer(tmp_path, threads):
+    text = _make_text()
+    bgz_file = tmp_path / "test.txt.gz"
+    with BGZFWriter(bgz_file, threads) as f:
+        f.write(text[:100].encode())
+        f.write(text[100:].encode())
+
+    assert is_bgzf(bgz_file)
+    with gzip.open(bgz_file, "rt") as f:
+        assert f.read() == text
+    with BGZFReader(bgz_file, threads) as f:
+        assert f.readall().decode() == text
@@ -0,0 +1,60 @@
+import os
+from pathlib import Path
+
+from panct.data import Region
+from panct.cache import ResultCache
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+
+def test_result_cache(tmp_path):
+    cache_file = tmp_path / "cache.db"
+    graph_file = DATADIR / "basic.gbz"
+    region = Region("chrTest", 0, 1)
+    items = ["chrTest", 0, 1, 2, 10, 3, 0.047619047619047616]
+
+    with ResultCache(cache_file, graph_file, "GRCh38", ["sequniq-normwalk"]) as cache:
+        assert cache.get(region) is None
+        cache.put(region, items)
+        assert cache.get(region) == items
+        cache.put(None, items[3:])
+        assert cache.get(None) == items[3:]
+
+    # results should persist across runs
+    with ResultCache(cache_file, graph_file, "GRCh38", ["sequniq-normwalk"]) as cache:
+        assert cache.get(region) == items
+
+    # but not if anything that determines them has changed
+    settings = [
+        ("GRCh38", ["sequniq-normnode"], ()),
+        ("CHM13", ["sequniq-normwalk"], ()),
+        ("GRCh38", ["sequniq-normwalk"], ("samp1",)),
+    ]
+    for reference, metrics, exclude in settings:
+        with ResultCache(cache_file, graph_file, reference, metrics, exclude) as cache:
+            assert cache.get(region) is None
+
+    graph_copy = tmp_path / "basic.gbz"
+    graph_copy.write_bytes(graph_file.read_bytes())
+    with ResultCache(cache_file, graph_copy, "GRCh38", ["sequniq-normwalk"]) as cache:
+        cache.put(region, items)
+        os.utime(graph_copy, ns=(0, 0))
+    with ResultCache(cache_file, graph_copy, "GRCh38", ["sequniq-normwalk"]) as cache:
+        assert cache.get(region) is None
+
+
+def test_result_cache_eviction(tmp_path):
+    cache_file = tmp_path / "cache.db"
+    graph_file = DATADIR / "basic.gbz"
+    regions = [Region("chrTest", i, i + 1) for i in range(4)]
+    size = len('["chrTest", 0, 1]')
+
+    with ResultCache(cache_file, graph_file, "GRCh38", [], max_size=3 * size) as cache:
+        for region in regions[:3]:
+            cache.put(region, [region.chrom, region.start, region.end])
+        # using the first region makes the second the least recently used
+        assert cache.get(regions[0]) is not None
+        cache.put(regions[3], ["chrTest", 3, 4])
+        assert cache.get(regions[1]) is None
+        for region in (regions[0], regions[2], regions[3]):
+            assert cache.get(region) == [region.chrom, region.start, region.end]
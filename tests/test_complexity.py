@@ -1,13 +1,24 @@
 import os
+import json
 from pathlib import Path
 from logging import getLogger
 
 import pytest
+import numpy as np
+from pysam import TabixFile, tabix_compress
 from typer.testing import CliRunner
 
+from panct import complexity
 from panct.__main__ import app
-from panct.graph_utils import Node, NodeTable
-from panct.complexity import main, compute_complexity
+from panct.graph_utils import Node, NodeTable, ColumnarNodeTable
+from panct.data import Region
+from panct.complexity import (
+    AVAILABLE_METRICS,
+    main,
+    compute_complexity,
+    compute_complexities,
+    iter_region_results,
+)
 
 runner = CliRunner()
 
@@ -62,6 +73,33 @@ def test_basic_stdout(capfd):
     assert result.exit_code == 0
 
 
+def test_basic_stdout_columnar(capfd):
+    """
+    panct complexity --columnar tests/data/basic.gfa
+    """
+    in_file = DATADIR / "basic.gfa"
+
+    cmd = f"complexity --columnar {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    captured = capfd.readouterr()
+    assert captured.out == expected_basic_output
+    assert result.exit_code == 0
+
+
+def test_basic_stdout_gz(capfd, tmp_path):
+    """
+    panct complexity --threads 2 basic.gfa.gz
+    """
+    in_file = tmp_path / "basic.gfa.gz"
+    tabix_compress(str(DATADIR / "basic.gfa"), str(in_file))
+
+    cmd = f"complexity --threads 2 {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    captured = capfd.readouterr()
+    assert captured.out == expected_basic_output
+    assert result.exit_code == 0
+
+
 def test_basic_stdout_region(capfd):
     """
     panct complexity --region chrTest:0-1 tests/data/basic.gbz
@@ -110,6 +148,334 @@ def test_basic_regions_bed(capfd):
     out_file.unlink()
 
 
+def test_basic_regions_bed_by_contig(tmp_path):
+    """
+    panct complexity --gbz-backend sqlite --by-contig --out basic.tsv \
+        --region tests/data/basic.bed tests/data/basic.gbz
+    """
+    in_file = DATADIR / "basic.gbz"
+    bed_file = DATADIR / "basic.bed"
+
+    # the output should match the one from extracting each region separately
+    outputs = []
+    for flag in ("", "--by-contig "):
+        out_file = tmp_path / f"basic{len(outputs)}.tsv"
+        cmd = f"complexity --gbz-backend sqlite {flag}--out {out_file} --region {bed_file} {in_file}"
+        result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+        assert result.exit_code == 0
+        outputs.append(out_file.read_text())
+    assert outputs[0] == outputs[1]
+    assert len(outputs[1].splitlines()) == 3
+
+    # by-contig mode can't be used with the query command
+    assert main(
+        in_file,
+        tmp_path / "basic.tsv",
+        bed_file,
+        gbz_backend="query",
+        by_contig=True,
+    )
+
+
+def test_basic_regions_gfa(tmp_path):
+    """
+    panct walks basic.gfa && panct complexity --region basic.bed basic.gfa
+    """
+    in_file = tmp_path / "basic.gfa"
+    in_file.write_text((DATADIR / "basic.gfa").read_text())
+    bed_file = tmp_path / "basic.bed"
+    bed_file.write_text("chrTest\t0\t10\nchrTest\t8\t10\nchrOther\t0\t5\n")
+    out_file = tmp_path / "basic.tsv"
+
+    # without a reference index, the regions are ignored
+    assert main(in_file, out_file, bed_file) == 0
+    assert out_file.read_text() == expected_basic_output
+
+    cmd = f"walks {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    assert (tmp_path / "basic.walk.gz.ref.pctx").exists()
+
+    # the region spanning the whole reference should match the whole graph, and
+    # the region that isn't on the reference should fail
+    assert main(in_file, out_file, bed_file) == 1
+    expected = prefix_expected_with_region(
+        expected_basic_output + "1\t2\t2\t0.0\n",
+        [("chrTest", 0, 10), ("chrTest", 8, 10)],
+    )
+    assert out_file.read_text() == expected
+    # the failure should also be reflected in the exit code of the command
+    cmd = f"complexity --out {out_file} --region {bed_file} {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 1
+    assert out_file.read_text() == expected
+
+    # a reference index for a different reference should be ignored
+    assert main(in_file, out_file, bed_file, reference="samp1") == 0
+    assert len(out_file.read_text().splitlines()) == 2
+    assert out_file.read_text().startswith("numnodes")
+
+
+def test_basic_regions_bed_profile(tmp_path):
+    """
+    panct complexity --gbz-backend sqlite --profile profile.json --out basic.tsv \
+        --region tests/data/basic.bed tests/data/basic.gbz
+    """
+    in_file = DATADIR / "basic.gbz"
+    bed_file = DATADIR / "basic.bed"
+    out_file = tmp_path / "basic.tsv"
+    profile_file = tmp_path / "profile.json"
+
+    for threads in (1, 2):
+        cmd = (
+            f"complexity -t {threads} --gbz-backend sqlite --profile {profile_file} "
+            f"--out {out_file} --region {bed_file} {in_file}"
+        )
+        result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+        assert result.exit_code == 0
+        profile = json.loads(profile_file.read_text())
+        # the stages of each region are recorded, even in worker processes
+        stages = [row["stage"] for row in profile["summary"]]
+        assert stages == ["parse", "extract", "build", "metric", "write"]
+        counts = {row["stage"]: row["count"] for row in profile["summary"]}
+        assert counts["parse"] == 1
+        assert counts["metric"] == counts["write"] == 2
+        regions = {r["region"] for r in profile["records"] if r["stage"] == "write"}
+        assert len(regions) == 2
+
+    # the output should not change
+    expected_file = tmp_path / "expected.tsv"
+    assert main(in_file, expected_file, bed_file, gbz_backend="sqlite") == 0
+    assert out_file.read_text() == expected_file.read_text()
+
+
+def test_basic_regions_bed_cache(tmp_path, monkeypatch):
+    """
+    panct complexity --gbz-backend sqlite --cache cache.db --out basic.tsv \
+        --region tests/data/basic.bed tests/data/basic.gbz
+    """
+    in_file = DATADIR / "basic.gbz"
+    bed_file = DATADIR / "basic.bed"
+    cache_file = tmp_path / "cache.db"
+    out_file = tmp_path / "basic.tsv"
+
+    assert (
+        main(in_file, out_file, bed_file, cache_file=cache_file, gbz_backend="sqlite")
+        == 0
+    )
+    expected = out_file.read_text()
+
+    # the second run should read all regions from the cache without processing them
+    def fail(*args, **kwargs):
+        raise AssertionError("region was not cached")
+
+    monkeypatch.setattr(complexity, "process_region", fail)
+    monkeypatch.setattr(complexity, "process_gfa", fail)
+    # and shouldn't write them back to the cache
+    monkeypatch.setattr(complexity.ResultCache, "put", fail)
+    assert (
+        main(in_file, out_file, bed_file, cache_file=cache_file, gbz_backend="sqlite")
+        == 0
+    )
+    assert out_file.read_text() == expected
+
+    # the whole graph of a GFA can be cached, too
+    gfa_file = DATADIR / "basic.gfa"
+    monkeypatch.undo()
+    assert main(gfa_file, out_file, cache_file=cache_file) == 0
+    assert out_file.read_text() == expected_basic_output
+    monkeypatch.setattr(complexity, "process_gfa", fail)
+    assert main(gfa_file, out_file, cache_file=cache_file) == 0
+    assert out_file.read_text() == expected_basic_output
+
+
+def test_basic_regions_bed_resume(tmp_path):
+    """
+    panct complexity --gbz-backend sqlite --resume --out basic.tsv \
+        --region tests/data/basic.bed tests/data/basic.gbz
+    """
+    in_file = DATADIR / "basic.gbz"
+    bed_file = DATADIR / "basic.bed"
+    out_file = tmp_path / "basic.tsv"
+
+    assert main(in_file, out_file, bed_file, gbz_backend="sqlite") == 0
+    expected = out_file.read_text()
+
+    # simulate a run that was killed while writing the second region
+    lines = expected.splitlines(keepends=True)
+    out_file.write_text(lines[0] + lines[1] + lines[2][:5])
+    cmd = f"complexity --gbz-backend sqlite --resume --out {out_file} "
+    cmd += f"--region {bed_file} {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    assert out_file.read_text() == expected
+
+    # resuming a complete file shouldn't change it
+    assert main(in_file, out_file, bed_file, resume=True, gbz_backend="sqlite") == 0
+    assert out_file.read_text() == expected
+
+    # the header must match the requested metrics
+    assert main(
+        in_file,
+        out_file,
+        bed_file,
+        "sequniq-normnode",
+        resume=True,
+        gbz_backend="sqlite",
+    )
+    assert out_file.read_text() == expected
+
+    # the line of a whole graph isn't written again
+    out_file = tmp_path / "basic_gfa.tsv"
+    assert main(DATADIR / "basic.gfa", out_file) == 0
+    assert main(DATADIR / "basic.gfa", out_file, resume=True) == 0
+    assert out_file.read_text() == expected_basic_output
+
+
+def test_basic_window(capfd):
+    """
+    panct complexity --window 4 --step 3 tests/data/basic.gfa
+    """
+    expected = (
+        "chrom\tstart\tend\tnumnodes\ttotal_length\tnumwalks\tsequniq-normwalk\n"
+        "chrTest\t0\t4\t1\t8\t3\t0.0\n"
+        "chrTest\t3\t7\t1\t8\t3\t0.0\n"
+        "chrTest\t6\t10\t2\t10\t3\t0.047619047619047616\n"
+        "chrTest\t9\t10\t1\t2\t2\t0.0\n"
+    )
+    for in_file, region in (
+        (DATADIR / "basic.gfa", ""),
+        (DATADIR / "basic.gbz", "chrTest:0-10"),
+    ):
+        cmd = f"complexity --window 4 --step 3 {in_file}"
+        if region:
+            cmd += f" --region {region}"
+        result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+        captured = capfd.readouterr()
+        assert captured.out == expected
+        assert result.exit_code == 0
+
+    # a single window over the whole graph should match the usual output
+    cmd = f"complexity --window 10 {DATADIR / 'basic.gfa'}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    captured = capfd.readouterr()
+    assert captured.out == prefix_expected_with_region(
+        expected_basic_output, [("chrTest", 0, 10)]
+    )
+
+
+def test_basic_window_output_formats(tmp_path):
+    """
+    panct complexity --window 4 --step 3 --out basic.tsv.gz tests/data/basic.gfa
+    panct complexity --window 4 --step 3 --out basic.npz tests/data/basic.gfa
+    """
+    in_file = DATADIR / "basic.gfa"
+    out_file = tmp_path / "basic.tsv.gz"
+    cmd = f"complexity --window 4 --step 3 --out {out_file} {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    with TabixFile(str(out_file)) as tbx:
+        assert list(tbx.fetch("chrTest", 7, 8)) == [
+            "chrTest\t6\t10\t2\t10\t3\t0.047619047619047616"
+        ]
+
+    out_file = tmp_path / "basic.npz"
+    cmd = f"complexity --window 4 --step 3 --out {out_file} {in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    arrays = np.load(out_file)
+    np.testing.assert_array_equal(arrays["start"], [0, 3, 6, 9])
+    np.testing.assert_array_equal(arrays["numwalks"], [3, 3, 3, 2])
+    assert arrays["sequniq-normwalk"][2] == 0.047619047619047616
+
+    # compressed output can't be resumed
+    assert main(in_file, out_file, window=4, step=3, resume=True) == 1
+
+
+def test_iter_complexity():
+    # a whole GFA file yields a single result
+    results = list(complexity.iter_complexity(DATADIR / "basic.gfa"))
+    assert len(results) == 1
+    result = results[0]
+    assert result.region is None
+    assert (result.numnodes, result.total_length, result.numwalks) == (2, 10, 3)
+    assert result.metrics == {"sequniq-normwalk": 0.047619047619047616}
+    assert result.to_items() == [2, 10, 3, 0.047619047619047616]
+
+    # any iterable of regions can be given
+    regions = (Region("chrTest", 0, end) for end in (1, 2))
+    results = list(
+        complexity.iter_complexity(DATADIR / "basic.gbz", regions, gbz_backend="sqlite")
+    )
+    assert [r.region.end for r in results] == [1, 2]
+    assert all(r.error is None and r.numwalks == 3 for r in results)
+
+    # the regions can also be cut into windows, with partial sums
+    results = complexity.iter_complexity(
+        DATADIR / "basic.gfa", window=4, partial_sums=True
+    )
+    result = next(results)
+    assert result.to_items() == ["chrTest", 0, 4, 1, 8, 3, 24, 24, 72]
+    assert result.sums.sum_len_count2 == 72
+    assert result.metrics == {}
+    assert len(list(results)) == 2
+
+    # invalid options are reported before iterating
+    with pytest.raises(ValueError):
+        complexity.iter_complexity(DATADIR / "basic.gfa", metrics=["bad"])
+    with pytest.raises(ValueError):
+        complexity.iter_complexity(DATADIR / "basic.gbz", gbz_backend="sqlite")
+    with pytest.raises(ValueError):
+        complexity.iter_complexity(DATADIR / "basic.gbz", [], gbz_backend="sqlite")
+
+    # the columns are known before iterating
+    results = complexity.iter_complexity(DATADIR / "basic.gfa")
+    assert results.columns == complexity.get_columns(["sequniq-normwalk"], False)
+
+    # whole graphs, regions, and windows can be skipped
+    assert list(complexity.iter_complexity(DATADIR / "basic.gfa", skip={()})) == []
+    regions = [Region("chrTest", 0, end) for end in (1, 2)]
+    results = complexity.iter_complexity(
+        DATADIR / "basic.gbz",
+        regions,
+        gbz_backend="sqlite",
+        skip={("chrTest", 0, 1)},
+    )
+    assert [r.region.end for r in results] == [2]
+    results = complexity.iter_complexity(
+        DATADIR / "basic.gfa", window=4, skip={("chrTest", 4, 8)}
+    )
+    assert [r.region.start for r in results] == [0, 8]
+
+
+def test_iter_result_arrays():
+    results = complexity.iter_complexity(
+        DATADIR / "basic.gfa", window=4, step=3, metrics=AVAILABLE_METRICS
+    )
+    batches = list(complexity.iter_result_arrays(results, batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert batches[0].dtype.names == tuple(
+        complexity.get_columns(AVAILABLE_METRICS, True)
+    )
+    np.testing.assert_array_equal(batches[0]["start"], [0, 3, 6])
+    assert batches[0]["chrom"][0] == "chrTest"
+    assert batches[0]["sequniq-normwalk"][2] == 0.047619047619047616
+    assert batches[1]["numwalks"][0] == 2
+
+    # undefined metrics become NaN and failed regions are skipped
+    results = [
+        complexity.ComplexityResult.from_items(
+            Region("chr1", 0, 5), ["chr1", 0, 5, 0, 0, 0, None], ["sequniq-normwalk"]
+        ),
+        complexity.ComplexityResult.from_items(
+            Region("chr10", 5, 9), None, ["sequniq-normwalk"], error=ValueError()
+        ),
+    ]
+    (batch,) = complexity.iter_result_arrays(results)
+    assert len(batch) == 1
+    assert np.isnan(batch["sequniq-normwalk"][0])
+
+
 # TODO add more tests of main once
 # add gbz dependencies to test
 
@@ -189,3 +555,64 @@ def test_compute_complexity():
     nt.add_walk("samp:2", ["n1"])
     assert compute_complexity(nt, "sequniq-normwalk") == 0.5 * (1 - 0.5) / 1.5
     assert compute_complexity(nt, "sequniq-normnode") == 0.5 * (1 - 0.5) / 1
+
+
+def test_compute_complexity_columnar():
+    nt = ColumnarNodeTable()
+    nt.add_node(Node("n1", 1))
+    nt.add_node(Node("n2", 1))
+    assert compute_complexity(nt, "sequniq-normwalk") is None
+    nt.add_walk("samp:1", ["n1", "n2"])
+    nt.add_walk("samp:2", ["n1"])
+    assert compute_complexity(nt, "sequniq-normwalk") == 0.5 * (1 - 0.5) / 1.5
+    assert compute_complexity(nt, "sequniq-normnode") == 0.5 * (1 - 0.5) / 1
+
+
+def test_compute_complexities():
+    nt = NodeTable()
+    nt.add_node(Node("n1", 1))
+    nt.add_node(Node("n2", 1))
+    metrics = ["sequniq-normwalk", "sequniq-normnode"]
+    assert compute_complexities(nt, metrics) == [None, None]
+
+    nt.add_walk("samp:1", ["n1", "n2"])
+    nt.add_walk("samp:2", ["n1"])
+    assert compute_complexities(nt, metrics) == [
+        0.5 * (1 - 0.5) / 1.5,
+        0.5 * (1 - 0.5) / 1,
+    ]
+    assert compute_complexities(nt, metrics[::-1]) == [
+        0.5 * (1 - 0.5) / 1,
+        0.5 * (1 - 0.5) / 1.5,
+    ]
+    with pytest.raises(ValueError):
+        compute_complexities(nt, ["sequniq-normwalk", "xxx"])
+
+    # should match the per-metric computation on a larger graph
+    nt = NodeTable(gfa_file=DATADIR / "basic_noseq.gfa")
+    assert compute_complexities(nt, metrics) == [
+        compute_complexity(nt, m) for m in metrics
+    ]
+
+
+def _region_length(region: Region) -> int:
+    if region.chrom == "bad":
+        raise ValueError("bad region")
+    return region.end - region.start
+
+
+def test_iter_region_results():
+    regions = [Region("chr1", 0, i) for i in range(1, 30)]
+    regions.insert(5, Region("bad", 0, 1))
+    for threads in (1, 3):
+        results = list(
+            iter_region_results(regions, _region_length, threads, max_pending=4)
+        )
+        assert [r[0] for r in results] == regions
+        for region, result, error in results:
+            if region.chrom == "bad":
+                assert result is None
+                assert isinstance(error, ValueError)
+            else:
+                assert result == region.end
+                assert error is None
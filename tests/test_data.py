@@ -3,8 +3,9 @@ from pathlib import Path
 from collections import Counter
 
 import pytest
+import numpy as np
 
-from panct.data import Region, Regions, Walks
+from panct.data import Region, Regions, Walks, ColumnarWalks
 
 DATADIR = Path(__file__).parent.joinpath("data")
 
@@ -92,3 +93,111 @@ class TestWalks:
 
         nodes = Walks.read(DATADIR / "basic.walk.gz", region="1-1")
         assert nodes.data == expected.data
+
+    def test_parse_walks_file_v2(self):
+        expected = self._get_dummy_walks()
+
+        for fname in ("basic_v2.walk", "basic_v2.walk.gz"):
+            for region in (None, "1-2", "1-", "-2"):
+                nodes = Walks.read(DATADIR / fname, region=region)
+                assert nodes.data == expected.data
+
+        del expected.data[2]
+
+        nodes = Walks.read(DATADIR / "basic_v2.walk", region="1-1")
+        assert nodes.data == expected.data
+
+        nodes = Walks.read(DATADIR / "basic_v2.walk.gz", region="1-1")
+        assert nodes.data == expected.data
+
+    def test_read_walk_counts(self):
+        for fname in ("basic_v2.walk", "basic_v2.walk.gz"):
+            assert Walks.read_walk_counts(DATADIR / fname) == {
+                ("GRCh38", 0): 1,
+                ("samp1", 0): 1,
+                ("samp1", 1): 1,
+                ("samp2", 1): 1,
+            }
+        assert Walks.read_walk_counts(DATADIR / "basic.walk") is None
+
+    def test_parse_walks_file_repeats(self, tmp_path):
+        # a haplotype that visits a node more than once is listed with a 0
+        walk_file = tmp_path / "repeats.walk"
+        walk_file.write_text(
+            "##walk-version=2\n#labels\tGRCh38:0\tsamp1:0\n\t1\t0,1,0\n"
+        )
+        nodes = Walks.read(walk_file)
+        assert nodes.data == {1: Counter({("GRCh38", 0): 1, ("samp1", 0): 2})}
+
+        walk_file.write_text("##walk-version=3\n\t1\t0\n")
+        with pytest.raises(ValueError):
+            Walks.read(walk_file)
+
+
+class TestColumnarWalks:
+    @pytest.mark.parametrize(
+        "fname", ["basic.walk", "basic.walk.gz", "basic_v2.walk", "basic_v2.walk.gz"]
+    )
+    def test_read(self, fname):
+        for region in (None, "1-2", "1-", "-2", "1-1", "2-2"):
+            expected = Walks.read(DATADIR / fname, region=region)
+            walks = ColumnarWalks.read(DATADIR / fname, region=region)
+            assert len(walks) == len(expected)
+            assert walks.data == expected.data
+
+    def test_arrays(self, tmp_path):
+        walk_file = tmp_path / "repeats.walk"
+        walk_file.write_text(
+            "##walk-version=2\n#labels\tGRCh38:0\tsamp1:0\tsamp1:1\n"
+            "\t3\t0,1,0\n\t1\t1\n\t2\t0,2\n"
+        )
+        walks = ColumnarWalks.read(walk_file)
+        np.testing.assert_array_equal(walks.nodes, [1, 2, 3])
+        np.testing.assert_array_equal(walks.indptr, [0, 1, 3, 5])
+        np.testing.assert_array_equal(walks.haps, [1, 0, 2, 0, 1])
+        np.testing.assert_array_equal(walks.counts, [1, 1, 1, 1, 2])
+
+        haps, counts = walks.get_node(3)
+        np.testing.assert_array_equal(haps, [0, 1])
+        np.testing.assert_array_equal(counts, [1, 2])
+        with pytest.raises(KeyError):
+            walks.get_node(4)
+
+        nodes, counts = walks.get_haplotype(1)
+        np.testing.assert_array_equal(nodes, [1, 3])
+        np.testing.assert_array_equal(counts, [1, 2])
+        nodes, counts = walks.get_haplotype(2)
+        np.testing.assert_array_equal(nodes, [2])
+
+        subset = walks.get_range(2, 3)
+        np.testing.assert_array_equal(subset.nodes, [2, 3])
+        np.testing.assert_array_equal(subset.indptr, [0, 2, 4])
+        assert subset.data == {
+            2: Counter({("GRCh38", 0): 1, ("samp1", 1): 1}),
+            3: Counter({("GRCh38", 0): 1, ("samp1", 0): 2}),
+        }
+        assert len(walks.get_range(4)) == 0
+        assert len(walks.get_range(end=0)) == 0
+
+    def test_read_malformed(self, tmp_path):
+        walk_file = tmp_path / "malformed.walk"
+        header = "##walk-version=2\n#labels\tGRCh38:0\tsamp1:0\n"
+        for line in ("\t1\t0,,1\n", "\t1\t0,a\n", "\t1\t0.5\n", "1\n"):
+            walk_file.write_text(header + line)
+            with pytest.raises(ValueError):
+                ColumnarWalks.read(walk_file)
+
+
+@pytest.mark.parametrize("walks_class", [Walks, ColumnarWalks])
+@pytest.mark.parametrize(
+    "fname", ["basic.walk", "basic.walk.gz", "basic_v2.walk", "basic_v2.walk.gz"]
+)
+def test_read_many(walks_class, fname):
+    regions = ["2-2", "1-1", "1-2", "-1", "5-9", "2-", "1-1"]
+    for cache_size in (1, 16):
+        results = list(
+            walks_class.read_many(DATADIR / fname, regions, cache_size=cache_size)
+        )
+        assert len(results) == len(regions)
+        for region, walks in zip(regions, results):
+            assert walks.data == Walks.read(DATADIR / fname, region=region).data
@@ -1,8 +1,18 @@
 import os
+import logging
 from pathlib import Path
+from shutil import which
 from logging import getLogger
 
-from panct.gbz_utils import check_gbzfile
+import pytest
+
+from panct.data import Region
+from panct.gbz_utils import (
+    GBZBase,
+    get_gbzbase,
+    check_gbzfile,
+    load_node_table_from_gbz,
+)
 
 DATADIR = Path(__file__).parent.joinpath("data")
 
@@ -20,3 +30,124 @@ def test_check_gbzfile():
     # TODO - add rest of checks once add gbz-base to
     # list of test dependencies
     # check_gbzfile(DATADIR / "basic_noseq.gbz", log)
+
+
+def _fake_query(tmp_path: Path, script: str):
+    """
+    Put a fake gbz-base query command at the front of the PATH
+    """
+    query = tmp_path / "query"
+    query.write_text("#!/bin/sh\n" + script)
+    query.chmod(0o755)
+    return str(tmp_path) + os.pathsep + os.environ["PATH"]
+
+
+def test_load_node_table_from_gbz(tmp_path, monkeypatch, caplog):
+    region = Region("chrTest", 0, 1)
+    gbz_file = DATADIR / "basic.gbz"
+
+    # the output of query should be parsed without writing it to a file
+    monkeypatch.setenv("PATH", _fake_query(tmp_path, f"cat {DATADIR / 'basic.gfa'}"))
+    for columnar in (False, True):
+        nt = load_node_table_from_gbz(
+            gbz_file, region, "GRCh38", columnar, backend="query"
+        )
+        assert nt.numwalks == 3
+        assert nt.get_total_node_length() == 10
+
+    # a failing query should be logged along with its stderr
+    script = "echo 'no such contig' >&2\nexit 3\n"
+    monkeypatch.setenv("PATH", _fake_query(tmp_path, script))
+    with caplog.at_level(logging.ERROR):
+        nt = load_node_table_from_gbz(
+            gbz_file, region, "GRCh38", log=getLogger(), backend="query"
+        )
+    assert nt.numwalks == 0
+    assert "no such contig" in caplog.text
+
+
+def test_gbzbase():
+    with GBZBase(DATADIR / "basic.gbz.db") as db:
+        # node 1 (handle 2) is visited by all four paths and branches to 2 and 3
+        record = db.get_record(2)
+        assert record.length == 8
+        assert record.successors == [4, 5]
+        assert record.next_handles == [4, 4, 5, 0]
+        assert record.next_offsets == [1, 2, 2, 0]
+
+        # the region is found along the reference path
+        assert db.find_path_position("GRCh38", "chrTest", 3) == (0, 2, 0)
+        lengths, fragments = db.extract_region(Region("chrTest", 0, 1), "GRCh38")
+        assert lengths == {1: 8, 2: 2}
+        assert sorted(fragments) == [(2,), (2, 4), (2, 5)]
+
+        # see test_gbz_backends_match for a comparison with the query command
+        for columnar in (False, True):
+            nt = db.load_node_table(Region("chrTest", 0, 1), "GRCh38", columnar)
+            assert len(nt.nodes) == 2
+            assert nt.numwalks == 3
+            assert nt.get_total_node_length() == 10
+
+        with pytest.raises(ValueError):
+            db.find_path_position("GRCh38", "chrMissing", 0)
+
+
+def test_load_node_table_from_gbz_sqlite():
+    gbz_file = DATADIR / "basic.gbz"
+    assert get_gbzbase(gbz_file) is get_gbzbase(gbz_file)
+    nt = load_node_table_from_gbz(
+        gbz_file, Region("chrTest", 0, 1), "GRCh38", backend="sqlite"
+    )
+    assert nt.numwalks == 3
+    assert nt.get_total_node_length() == 10
+
+
+@pytest.mark.skipif(which("query") is None, reason="gbz-base is not installed")
+def test_gbz_backends_match():
+    gbz_file = DATADIR / "basic.gbz"
+    # regions within one node, across the bubble, and along the whole graph
+    for region in ((0, 1), (0, 2), (7, 9), (8, 9), (9, 10), (0, 10)):
+        region = Region("chrTest", *region)
+        tables = [
+            load_node_table_from_gbz(gbz_file, region, "GRCh38", backend=backend)
+            for backend in ("query", "sqlite")
+        ]
+        expected, nt = [
+            {
+                node_id: (node.length, len(node.samples))
+                for node_id, node in table.nodes.items()
+            }
+            for table in tables
+        ]
+        assert nt == expected
+        assert tables[1].numwalks == tables[0].numwalks
+        assert tables[1].get_total_node_length() == tables[0].get_total_node_length()
+
+
+def test_gbzbase_cache_visits():
+    region = Region("chrTest", 0, 10)
+    with GBZBase(DATADIR / "basic.gbz.db") as db:
+        expected = db.extract_region(region, "GRCh38")
+    # a cache too small for a single node still works, and is kept bounded
+    with GBZBase(DATADIR / "basic.gbz.db", cache_visits=1) as db:
+        assert db.extract_region(region, "GRCh38") == expected
+        assert len(db._records) == 1
+        assert db._num_visits == len(next(iter(db._records.values()))) + 1
+
+
+def test_gbzbase_index_reference():
+    regions = [Region("chrTest", *r) for r in ((0, 1), (0, 2), (8, 9), (9, 100))]
+    with GBZBase(DATADIR / "basic.gbz.db", block_size=2) as db:
+        expected = [db.extract_region(region, "GRCh38") for region in regions]
+
+        ref_path = db.index_reference("GRCh38", Region("chrTest", 0, 100))
+        assert ref_path.positions.tolist() == [0, 8]
+        assert ref_path.handles.tolist() == [2, 4]
+        assert ref_path.end == 10
+        assert ref_path.path_end
+        # slicing the indexed reference path should give the same subgraphs
+        for region, (lengths, fragments) in zip(regions, expected):
+            assert ref_path.covers("GRCh38", region)
+            assert db.extract_region(region, "GRCh38") == (lengths, fragments)
+        assert ref_path.slice(Region("chrTest", 8, 9)) == ([2], (4, 1))
+        assert not ref_path.covers("GRCh38", Region("chrOther", 0, 1))
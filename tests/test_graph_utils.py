@@ -1,10 +1,23 @@
+import io
 import os
+import logging
+import gzip
+import shutil
 from pathlib import Path
 
 import pytest
 import numpy as np
+from pysam import tabix_compress
 
-from panct.graph_utils import Node, NodeTable
+from panct.progress import Progress
+from panct.graph_utils import (
+    Node,
+    NodeTable,
+    ColumnarNodeTable,
+    collapse_walks,
+    iter_walk_steps,
+    iter_gfa_records,
+)
 
 DATADIR = Path(__file__).parent.joinpath("data")
 
@@ -50,6 +63,8 @@ def test_node_table():
     nt.add_walk("samp:2", ["n1"])
     assert nt.numwalks == 2
     assert nt.get_mean_walk_length() == 225
+    assert list(nt.get_node_lengths()) == [200, 50]
+    assert list(nt.get_node_counts()) == [2, 1]
 
     # Load from GFA with no seqs
     nt = NodeTable(gfa_file=DATADIR / "basic_noseq.gfa")
@@ -67,3 +82,265 @@ def test_node_table():
     # Load from GFA with no lengths
     with pytest.raises(ValueError):
         NodeTable(gfa_file=DATADIR / "basic_nolen.gfa")
+
+
+def test_node_table_load_from_gfa_stream():
+    # lengths may come from the LN tag instead of the sequence
+    nt = NodeTable(gfa_file=DATADIR / "basic_noseq.gfa", exclude_samples=["GRCh38"])
+    assert {n: nt.nodes[n].length for n in nt.nodes} == {"node1": 20, "node2": 5}
+    assert nt.nodes["node2"].samples == {"samp1:0", "samp1:1"}
+    assert sorted(nt.walk_lengths) == [20, 25, 25]
+
+    # W lines may come before the S lines they refer to
+    lines = (DATADIR / "basic.gfa").read_text().splitlines(keepends=True)
+    nt = NodeTable()
+    nt.load_from_gfa_stream(sorted(lines, key=lambda line: line[0] != "W"))
+    assert nt.numwalks == 4
+    assert nt.get_mean_walk_length() == 38 / 4
+
+
+def test_iter_walk_steps():
+    steps = list(iter_walk_steps([">1<2", "2>3", "3", "<4"]))
+    assert [n for nodes, _ in steps for n in nodes] == ["1", "22", "33", "4"]
+    assert [o for _, orients in steps for o in orients] == [">", "<", ">", "<"]
+    assert list(iter_walk_steps([])) == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 20])
+def test_iter_gfa_records(chunk_size):
+    text = (
+        "H\tVN:Z:1.0\n"
+        "S\t1\tACGT\n"
+        "W\tsamp\t1\tchr\t0\t4\t>1<22\n"
+        "\n"
+        "W\tsamp\t2\tchr\t0\t4\t>1\tLN:i:4\n"
+        "W\tbad\tline\n"
+        "W\tsamp\t3\tchr\t0\t4\t>1>1"
+    )
+    records = []
+    for line, walk in iter_gfa_records(io.StringIO(text), chunk_size):
+        records.append((line, None if walk is None else "".join(walk)))
+    assert records == [
+        ("H\tVN:Z:1.0", None),
+        ("S\t1\tACGT", None),
+        ("W\tsamp\t1\tchr\t0\t4", ">1<22"),
+        ("W\tsamp\t2\tchr\t0\t4", ">1"),
+        ("W\tbad\tline", None),
+        ("W\tsamp\t3\tchr\t0\t4", ">1>1"),
+    ]
+
+    # walks that aren't consumed are skipped
+    lines = [line for line, _ in iter_gfa_records(io.StringIO(text), chunk_size)]
+    assert lines == [line for line, _ in records]
+
+
+@pytest.mark.parametrize("cls", [NodeTable, ColumnarNodeTable])
+def test_node_table_stream_chunks(cls, monkeypatch):
+    import panct.graph_utils
+
+    for gfa in ("basic.gfa", "basic_noseq.gfa"):
+        expected = cls(gfa_file=DATADIR / gfa, exclude_samples=["GRCh38"])
+        # split node IDs and lines across chunks
+        monkeypatch.setattr(panct.graph_utils, "WALK_CHUNK_SIZE", 3)
+        iter_records = panct.graph_utils.iter_gfa_records
+        monkeypatch.setattr(
+            panct.graph_utils,
+            "iter_gfa_records",
+            lambda f, chunk_size=3: iter_records(f, chunk_size),
+        )
+        nt = cls()
+        with open(DATADIR / gfa) as f:
+            nt.load_from_gfa_stream(f, ["GRCh38"])
+        monkeypatch.undo()
+        assert nt.numwalks == expected.numwalks
+        assert nt.walk_lengths == expected.walk_lengths
+        for n in expected.nodes:
+            assert nt.nodes[n].samples == expected.nodes[n].samples
+
+    # W lines may come before the S lines they refer to
+    lines = (DATADIR / "basic.gfa").read_text().splitlines(keepends=False)
+    nt = cls()
+    nt.load_from_gfa_stream(
+        io.StringIO("\n".join(sorted(lines, key=lambda line: line[0] != "W")))
+    )
+    assert nt.numwalks == 4
+    assert nt.get_mean_walk_length() == 38 / 4
+
+    nt = cls()
+    with pytest.raises(ValueError):
+        nt.load_from_gfa_stream(io.StringIO("W\tsamp\t1\tchr\t0\t4\t>1\n"))
+
+
+def test_collapse_walks():
+    walks = [("a:1", ["1", "2"]), ("b:1", ["1"]), ("a:2", ["1", "2"]), ("c:1", [])]
+    assert collapse_walks(walks) == [
+        (["a:1", "a:2"], ["1", "2"]),
+        (["b:1"], ["1"]),
+        (["c:1"], []),
+    ]
+    assert collapse_walks([]) == []
+
+
+@pytest.mark.parametrize("cls", [NodeTable, ColumnarNodeTable])
+def test_add_walks(cls):
+    walks = [
+        ("a:1", ["n1", "n2", "n1"]),
+        ("b:1", ["n2"]),
+        ("a:2", ["n1", "n2", "n1"]),
+        ("c:1", ["n1", "n2", "n1"]),
+        # a haplotype may have several walks
+        ("b:1", ["n2", "n3"]),
+    ]
+    expected, nt = cls(), cls()
+    for table in (expected, nt):
+        for nodeid, length in (("n1", 10), ("n2", 5), ("n3", 1)):
+            table.add_node(Node(nodeid, length))
+    for sampid, nodelist in walks:
+        expected.add_walk(sampid, nodelist)
+    nt.add_walks(walks)
+    assert nt.numwalks == expected.numwalks == 5
+    assert sorted(nt.walk_lengths) == sorted(expected.walk_lengths)
+    assert nt.get_mean_walk_length() == expected.get_mean_walk_length()
+    assert list(nt.get_node_counts()) == list(expected.get_node_counts()) == [3, 4, 1]
+    for n in expected.nodes:
+        assert nt.nodes[n].samples == expected.nodes[n].samples
+
+    with pytest.raises(ValueError):
+        nt.add_walks([("a:1", ["n4"])])
+
+
+def test_columnar_node_table():
+    nt = ColumnarNodeTable()
+    assert nt.numwalks == 0
+    assert len(nt.walk_lengths) == 0
+    assert nt.get_walk_length([]) == 0
+    assert np.isnan(nt.get_mean_walk_length())
+    assert np.isnan(nt.get_mean_node_length())
+    assert nt.get_total_node_length() == 0
+
+    nt.add_node(Node("n1", 200))
+    assert nt.get_walk_length(["n1"]) == 200
+    with pytest.raises(ValueError):
+        nt.get_walk_length(["n1", "n2"])
+    nt.add_node(Node("n2", 50))
+    assert nt.get_walk_length(["n1", "n2"]) == 250
+    assert nt.get_mean_node_length() == 125
+
+    nt.add_walk("samp:1", ["n1", "n2"])
+    assert nt.numwalks == 1
+    assert nt.get_mean_walk_length() == 250
+    nt.add_walk("samp:2", ["n1"])
+    nt.add_walk("samp:2", ["n1"])
+    assert nt.numwalks == 3
+    assert nt.nodes["n1"].samples == {"samp:1", "samp:2"}
+    assert nt.nodes["n2"].samples == {"samp:1"}
+    indptr, indices = nt.get_haplotype_csr()
+    assert list(indptr) == [0, 2, 3]
+    assert list(indices) == [0, 1, 0]
+    assert list(nt.get_node_lengths()) == [200, 50]
+    assert list(nt.get_node_counts()) == [2, 1]
+
+    # should be the same as a regular NodeTable when loaded from a GFA
+    for gfa in ("basic.gfa", "basic_noseq.gfa"):
+        expected = NodeTable(gfa_file=DATADIR / gfa, exclude_samples=["GRCh38"])
+        nt = ColumnarNodeTable(gfa_file=DATADIR / gfa, exclude_samples=["GRCh38"])
+        assert nt.numwalks == expected.numwalks
+        assert nt.get_mean_walk_length() == expected.get_mean_walk_length()
+        assert nt.get_mean_node_length() == expected.get_mean_node_length()
+        assert nt.get_total_node_length() == expected.get_total_node_length()
+        assert list(nt.nodes) == list(expected.nodes)
+        for n in nt.nodes:
+            assert nt.nodes[n].length == expected.nodes[n].length
+            assert nt.nodes[n].samples == expected.nodes[n].samples
+        assert nt.get_memory_usage() > 0
+        assert expected.get_memory_usage() > 0
+
+    with pytest.raises(ValueError):
+        ColumnarNodeTable(gfa_file=DATADIR / "basic_nolen.gfa")
+
+
+def test_node_table_compressed(tmp_path):
+    gfa_file = DATADIR / "basic.gfa"
+    gz_file = tmp_path / "basic.gfa.gz"
+    with gzip.open(gz_file, "wt") as f:
+        f.write(gfa_file.read_text())
+    bgz_file = tmp_path / "basic.bgz.gfa.gz"
+    tabix_compress(str(gfa_file), str(bgz_file))
+
+    expected = NodeTable(gfa_file=gfa_file, exclude_samples=["GRCh38"])
+    for in_file in (gz_file, bgz_file):
+        for threads in (1, 2):
+            nt = NodeTable(in_file, ["GRCh38"], threads)
+            assert nt.numwalks == expected.numwalks
+            assert nt.get_mean_walk_length() == expected.get_mean_walk_length()
+            assert nt.get_total_node_length() == (expected.get_total_node_length())
+
+
+def test_node_table_walk_file(tmp_path, caplog):
+    gfa_file = tmp_path / "basic.gfa"
+    shutil.copy(DATADIR / "basic.gfa", gfa_file)
+    walk_file = tmp_path / "basic.walk"
+    assert NodeTable.find_walk_file(gfa_file) is None
+
+    # node membership should come from the .walk file, which says that samp2:1
+    # also goes through node 2
+    walk_file.write_text(
+        "\t1\tGRCh38:0\tsamp1:0\tsamp1:1\tsamp2:1\n"
+        "\t2\tGRCh38:0\tsamp1:0\tsamp1:1\tsamp2:1\n"
+    )
+    assert NodeTable.find_walk_file(gfa_file) == walk_file
+    for table_class in (NodeTable, ColumnarNodeTable):
+        nt = table_class(gfa_file=gfa_file, exclude_samples=["GRCh38"])
+        assert nt.numwalks == 3
+        assert nt.get_mean_walk_length() == 10
+        assert nt.nodes["2"].samples == {"samp1:0", "samp1:1", "samp2:1"}
+
+    # the .walk file that was used is logged
+    log = logging.getLogger("panct.test")
+    with caplog.at_level(logging.INFO, logger="panct.test"):
+        NodeTable().load_from_gfa(gfa_file, ["GRCh38"], log=log)
+    assert f"Read node membership from {walk_file}" in caplog.text
+
+    # the number of W lines of each haplotype can come from the header
+    header = "##walk-version=2\n#labels\tGRCh38:0\tsamp1:0\tsamp1:1\tsamp2:1\n"
+    lines = "\t1\t0,1,1,1\n\t2\t0,1,1,1\n"
+    walk_file.write_text(header + "#walks\t1\t1\t1\t1\n" + lines)
+    nt = NodeTable(gfa_file=gfa_file, exclude_samples=["GRCh38"])
+    assert nt.get_mean_walk_length() == 10
+    # the whole GFA is parsed, with progress, if a haplotype has more W lines
+    walk_file.write_text(header + "#walks\t1\t1\t1\t2\n" + lines)
+    progress = Progress.for_file("test", gfa_file)
+    nt = NodeTable()
+    nt.load_from_gfa(gfa_file, ["GRCh38"], progress=progress)
+    assert nt.get_mean_walk_length() == 28 / 3
+    assert progress.nbytes == gfa_file.stat().st_size
+
+    # the .walk file can be ignored
+    nt = NodeTable()
+    nt.load_from_gfa(gfa_file, ["GRCh38"], use_walk_file=False)
+    assert nt.get_mean_walk_length() == 28 / 3
+
+    # a stale .walk file should be ignored
+    mtime = gfa_file.stat().st_mtime
+    os.utime(walk_file, (mtime - 10, mtime - 10))
+    assert NodeTable.find_walk_file(gfa_file) is None
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="panct.test"):
+        nt = NodeTable()
+        nt.load_from_gfa(gfa_file, ["GRCh38"], log=log)
+    assert nt.get_mean_walk_length() == 28 / 3
+    assert str(walk_file) not in caplog.text
+
+    # a .walk file that doesn't match the GFA should be ignored
+    walk_file.write_text("\t1\tsamp1:0\n\t3\tsamp1:0\n")
+    nt = NodeTable(gfa_file=gfa_file, exclude_samples=["GRCh38"])
+    assert nt.numwalks == 3
+    assert nt.get_mean_walk_length() == 28 / 3
+
+    # a haplotype with more than one W line requires parsing the W lines
+    with open(gfa_file, "a") as f:
+        f.write("\nW\tsamp2\t1\tchrOther\t0\t0\t>2\n")
+    shutil.copy(DATADIR / "basic.walk", walk_file)
+    nt = NodeTable(gfa_file=gfa_file, exclude_samples=["GRCh38"])
+    assert nt.numwalks == 4
+    assert nt.get_mean_walk_length() == 30 / 4
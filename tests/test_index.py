@@ -0,0 +1,102 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+import numpy as np
+from typer.testing import CliRunner
+
+from panct.__main__ import app
+from panct.complexity import compute_complexities
+from panct.graph_utils import Node, NodeTable, ColumnarNodeTable
+from panct.index import get_index_path, read_index, write_index, index_graph
+
+runner = CliRunner()
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+METRICS = ["sequniq-normwalk", "sequniq-normnode"]
+
+
+def test_write_read_index(tmp_path):
+    graph_file = tmp_path / "graph.txt"
+    graph_file.write_text("graph")
+    index_file = tmp_path / "graph.txt.pctx"
+    arrays = {
+        "a": np.arange(5, dtype=np.int64),
+        "b": np.array([3, 1], dtype=np.int32),
+        "c": np.empty(0, dtype=np.uint8),
+    }
+    write_index(index_file, graph_file, arrays, {"labels": ["x", "y"]})
+    header, loaded = read_index(index_file, graph_file)
+    assert header["labels"] == ["x", "y"]
+    assert loaded.keys() == arrays.keys()
+    for name in arrays:
+        assert loaded[name].dtype == arrays[name].dtype
+        np.testing.assert_array_equal(loaded[name], arrays[name])
+
+    # the index should be stale once the graph changes
+    graph_file.write_text("a different graph")
+    with pytest.raises(ValueError):
+        read_index(index_file, graph_file)
+    read_index(index_file)
+
+    with pytest.raises(ValueError):
+        read_index(graph_file)
+
+
+def test_load_from_index(tmp_path):
+    for gfa in ("basic.gfa", "basic_noseq.gfa"):
+        graph_file = tmp_path / gfa
+        shutil.copy(DATADIR / gfa, graph_file)
+        assert index_graph(graph_file) == 0
+        index_file = get_index_path(graph_file)
+        assert index_file.exists()
+
+        for exclude in ([], ["GRCh38"], ["GRCh38", "samp1"]):
+            expected = NodeTable(graph_file, exclude)
+            nt = ColumnarNodeTable.load_from_index(index_file, exclude, graph_file)
+            assert nt.numwalks == expected.numwalks
+            assert nt.get_total_node_length() == expected.get_total_node_length()
+            assert list(nt.nodes) == list(expected.nodes)
+            for n in nt.nodes:
+                assert nt.nodes[n].samples == expected.nodes[n].samples
+            assert compute_complexities(nt, METRICS) == compute_complexities(
+                expected, METRICS
+            )
+
+    # we can keep adding to a table after loading it from an index
+    nt.add_node(Node("node3", 5))
+    nt.add_walk("samp3:0", ["node1", "node3"])
+    assert nt.numwalks == 2
+    assert nt.nodes["node1"].samples == {"samp2:1", "samp3:0"}
+    assert nt.get_total_node_length() == 30
+
+    # stale indices should not be loaded
+    os.utime(graph_file, ns=(0, 0))
+    with pytest.raises(ValueError):
+        ColumnarNodeTable.load_from_index(index_file, [], graph_file)
+
+
+def test_index_cli(capfd, tmp_path):
+    """
+    panct index basic.gfa
+    """
+    graph_file = tmp_path / "basic.gfa"
+    shutil.copy(DATADIR / "basic.gfa", graph_file)
+    out_file = tmp_path / "basic.idx"
+
+    cmd = f"index --out {out_file} {graph_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    assert out_file.exists()
+
+    # complexity should pick up an index next to the GFA
+    shutil.move(out_file, get_index_path(graph_file))
+    cmd = f"complexity --metrics {','.join(METRICS)} {graph_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    with_index = capfd.readouterr().out
+    assert result.exit_code == 0
+    get_index_path(graph_file).unlink()
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert capfd.readouterr().out == with_index
@@ -54,3 +54,19 @@ def test_getLogger_with_default_parameters():
     assert logger.name == "panct"
     # by default, the log level should be "ERROR"
     assert logger.level == logging.ERROR
+
+
+def test_getLogger_repeated():
+    # each call shouldn't attach another handler
+    logger = getLogger(name="repeated", level="ERROR")
+    num_handlers = len(logger.handlers)
+    logger = getLogger(name="repeated", level="DEBUG", exact_time=True)
+    assert len(logger.handlers) == num_handlers
+    assert logger.level == logging.DEBUG
+    assert logger.handlers[-1].level == logging.DEBUG
+    assert "%(msecs)" in logger.handlers[-1].formatter._fmt
+
+    # a handler is attached again if it was removed
+    logger.removeHandler(logger.handlers[-1])
+    logger = getLogger(name="repeated")
+    assert len(logger.handlers) == num_handlers
@@ -0,0 +1,107 @@
+import gzip
+from pathlib import Path
+
+import pytest
+import numpy as np
+from pysam import TabixFile
+
+from panct.output import (
+    ResultWriter,
+    NpzResultWriter,
+    BGZFResultWriter,
+    TextResultWriter,
+    open_writer,
+)
+
+HEADER = ["chrom", "start", "end", "numnodes", "sequniq-normwalk"]
+ROWS = [
+    ["chr1", 0, 10, 2, 0.5],
+    ["chr1", 10, 20, 0, None],
+    ["chr2", 0, 5, 1, 0.0],
+]
+
+
+def test_text_writer(tmp_path):
+    out_file = tmp_path / "out.tsv"
+    with TextResultWriter(out_file, HEADER, batch_size=2) as writer:
+        writer.write(ROWS[0])
+        # the line is held in memory until the batch is full
+        assert out_file.read_text() == ""
+        writer.write(ROWS[1])
+        writer.flush()
+        assert len(out_file.read_text().splitlines()) == 3
+        writer.write(ROWS[2])
+    lines = out_file.read_text().splitlines()
+    assert lines[0] == "\t".join(HEADER)
+    assert lines[2] == "chr1\t10\t20\t0\tNone"
+    assert len(lines) == 4
+
+    # lines are also written once the flush interval has passed
+    writer = TextResultWriter(out_file, HEADER, append=True, flush_interval=0)
+    writer.write(ROWS[0])
+    assert len(out_file.read_text().splitlines()) == 5
+    writer.close()
+    writer.close()
+
+
+def test_bgzf_writer(tmp_path):
+    out_file = tmp_path / "out.tsv.gz"
+    with BGZFResultWriter(out_file, HEADER) as writer:
+        for row in ROWS:
+            writer.write(row)
+    with gzip.open(out_file, "rt") as f:
+        assert f.readline() == "\t".join(HEADER) + "\n"
+        assert len(f.readlines()) == 3
+    with TabixFile(str(out_file)) as tbx:
+        assert list(tbx.fetch("chr1", 12, 15)) == ["chr1\t10\t20\t0\tNone"]
+        assert len(list(tbx.fetch("chr2"))) == 1
+
+    # files without regions are not indexed
+    out_file = tmp_path / "whole.tsv.gz"
+    with BGZFResultWriter(out_file, HEADER[3:]) as writer:
+        writer.write([2, 0.5])
+    assert not Path(str(out_file) + ".tbi").exists()
+
+
+def test_bgzf_writer_unsorted(tmp_path, caplog):
+    out_file = tmp_path / "out.tsv.gz"
+    with BGZFResultWriter(out_file, HEADER) as writer:
+        for row in ROWS[::-1]:
+            writer.write(row)
+    assert "Are the regions sorted?" in caplog.text
+    assert not Path(str(out_file) + ".tbi").exists()
+
+
+def test_npz_writer(tmp_path):
+    out_file = tmp_path / "out.npz"
+    with NpzResultWriter(out_file, HEADER, batch_size=2) as writer:
+        for row in ROWS:
+            writer.write(row)
+    arrays = np.load(out_file)
+    assert list(arrays.keys()) == HEADER
+    np.testing.assert_array_equal(arrays["chrom"], ["chr1", "chr1", "chr2"])
+    np.testing.assert_array_equal(arrays["start"], [0, 10, 0])
+    assert arrays["start"].dtype.kind == "i"
+    np.testing.assert_array_equal(arrays["sequniq-normwalk"], [0.5, np.nan, 0.0])
+
+    with NpzResultWriter(out_file, HEADER) as writer:
+        pass
+    arrays = np.load(out_file)
+    assert all(len(arrays[column]) == 0 for column in HEADER)
+
+
+def test_open_writer(tmp_path):
+    for name, writer_class in (
+        ("out.tsv", TextResultWriter),
+        ("out.tsv.gz", BGZFResultWriter),
+        ("out.npz", NpzResultWriter),
+    ):
+        with open_writer(tmp_path / name, HEADER) as writer:
+            assert type(writer) is writer_class
+    with pytest.raises(ValueError):
+        open_writer(tmp_path / "out.npz", HEADER, append=True)
+    with open_writer(tmp_path / "out.tsv.gz", HEADER, threads=2) as writer:
+        assert writer.threads == 2
+    # the base class is abstract
+    with pytest.raises(TypeError):
+        ResultWriter(tmp_path / "out.tsv", HEADER)
@@ -0,0 +1,139 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from panct import profiler
+from panct.data import Region
+from panct.profiler import Profiler, StageRecord
+
+
+def test_stage_inactive():
+    assert profiler.get_profiler() is None
+    with profiler.stage("build"):
+        pass
+    items = [1, 2, 3]
+    assert profiler.iter_stage("metric", items) is items
+
+
+def test_profiler():
+    prof = Profiler()
+    region = Region("chr1", 0, 10)
+    with prof.stage("extract", region):
+        sum(range(1000))
+    with pytest.raises(ValueError):
+        with prof.stage("build", region):
+            raise ValueError("the stage should still be recorded")
+    with prof.stage("parse"):
+        pass
+    assert [(r.stage, r.region) for r in prof.records] == [
+        ("extract", "chr1:0-10"),
+        ("build", "chr1:0-10"),
+        ("parse", ""),
+    ]
+    for record in prof.records:
+        assert record.wall >= 0 and record.cpu >= 0
+        assert record.peak_rss > 0
+
+
+def test_profiler_nested(monkeypatch):
+    # simulate the peak RSS of the process, which each stage resets
+    rss = {"current": 100, "peak": 100}
+
+    def reset():
+        rss["peak"] = rss["current"]
+
+    def allocate(nbytes):
+        rss["current"] += nbytes
+        rss["peak"] = max(rss["peak"], rss["current"])
+
+    monkeypatch.setattr(profiler, "_reset_peak_rss", reset)
+    monkeypatch.setattr(profiler, "_get_peak_rss", lambda: rss["peak"])
+    prof = Profiler()
+    with prof.stage("build"):
+        allocate(50)
+        allocate(-50)
+        with prof.stage("metric"):
+            allocate(20)
+            allocate(-20)
+        with prof.stage("write"):
+            allocate(80)
+            allocate(-80)
+    peaks = {r.stage: r.peak_rss for r in prof.records}
+    assert peaks == {"metric": 120, "write": 180, "build": 180}
+
+    prof = Profiler()
+    with prof.stage("build"):
+        allocate(50)
+        allocate(-50)
+        with prof.stage("metric"):
+            pass
+    # the peak of the outer stage from before the inner one is kept
+    assert prof.records[-1].peak_rss == 150
+
+
+def test_summarize():
+    prof = Profiler()
+    prof.records = [StageRecord("metric", "", wall, 0.5, 10) for wall in range(101)]
+    prof.records.append(StageRecord("parse", "", 2.0, 1.0, 20))
+    prof.records.append(StageRecord("other", "", 3.0, 1.0, 30))
+    summary = prof.summarize()
+    assert [row["stage"] for row in summary] == ["parse", "metric", "other"]
+    metric = summary[1]
+    assert metric["count"] == 101
+    assert metric["wall_total"] == sum(range(101))
+    assert metric["cpu_total"] == 50.5
+    assert (metric["wall_p50"], metric["wall_p90"], metric["wall_p99"]) == (50, 90, 99)
+    assert metric["wall_max"] == 100
+    assert metric["peak_rss"] == 10
+
+
+def test_write(tmp_path):
+    prof = Profiler()
+    prof.records = [StageRecord("build", "chr1:0-10", 1.0, 0.5, 10)]
+    prof.write(tmp_path / "profile.tsv")
+    lines = (tmp_path / "profile.tsv").read_text().splitlines()
+    assert lines[0].split("\t")[:3] == ["stage", "count", "wall_total"]
+    assert lines[1].split("\t")[:3] == ["build", "1", "1.000000"]
+    assert len(lines) == 2
+
+    prof.write(tmp_path / "profile.json")
+    data = json.loads((tmp_path / "profile.json").read_text())
+    assert data["summary"] == prof.summarize()
+    assert data["records"] == [prof.records[0]._asdict()]
+
+    Profiler().write(tmp_path / "empty.tsv")
+    assert (tmp_path / "empty.tsv").read_text() == "stage\tcount\n"
+
+
+def _build(region: Region) -> int:
+    with profiler.stage("build", region):
+        return region.end
+
+
+def test_profiling(tmp_path):
+    profile_file = tmp_path / "profile.tsv"
+    cprofile_file = tmp_path / "profile.prof"
+    with profiler.profiling(profile_file, cprofile_file) as prof:
+        assert profiler.get_profiler() is prof
+        windows = profiler.iter_stage("metric", (i for i in range(3)))
+        assert list(windows) == [0, 1, 2]
+        assert profiler.call_profiled(_build, Region("chr1", 0, 5))[0] == 5
+        assert profiler.get_profiler() is prof
+    assert profiler.get_profiler() is None
+    # one metric stage per item, plus one to find the end of the items
+    assert [r.stage for r in prof.records] == ["metric"] * 4
+    assert profile_file.exists()
+    assert cprofile_file.exists()
+
+    # nothing is written or activated without any files
+    with profiler.profiling() as prof:
+        assert prof is None
+        assert profiler.get_profiler() is None
+
+
+def test_call_profiled():
+    result, records = profiler.call_profiled(_build, Region("chr1", 0, 5))
+    assert result == 5
+    assert [(r.stage, r.region) for r in records] == [("build", "chr1:0-5")]
+    assert profiler.get_profiler() is None
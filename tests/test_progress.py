@@ -0,0 +1,86 @@
+import io
+import logging
+from pathlib import Path
+
+from panct.progress import Progress, ProgressReader, get_rss, _format_seconds
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+
+def test_progress_lines(caplog):
+    log = logging.getLogger("panct.test_progress")
+    with caplog.at_level(logging.INFO, logger=log.name):
+        with Progress("task", total=4, interval=0, log=log, bar=False) as progress:
+            progress.update()
+            progress.update(3, nbytes=2_000_000)
+    messages = [r.getMessage() for r in caplog.records]
+    # one report for each update and a final one
+    assert len(messages) == 3
+    assert messages[0].startswith("progress task=task done=1/4 regions rate=")
+    assert "parsed=2.0MB" in messages[1]
+    assert "done=4/4 regions" in messages[2]
+    assert "eta=0:00:00" in messages[2]
+    assert all("rss=" in message for message in messages)
+    assert progress.count == 4
+    assert progress.nbytes == 2_000_000
+
+
+def test_progress_disabled(caplog):
+    log = logging.getLogger("panct.test_progress")
+    with caplog.at_level(logging.INFO, logger=log.name):
+        # without an interval, nothing is reported
+        with Progress("task", interval=None, log=log, bar=False) as progress:
+            progress.update()
+        assert progress.count == 1
+        assert not progress.enabled
+        # reports are made at most once per interval
+        with Progress("task", interval=3600, log=log, bar=False) as progress:
+            for _ in range(100):
+                progress.update()
+    assert not caplog.records
+    with caplog.at_level(logging.ERROR, logger=log.name):
+        # or if INFO messages aren't logged
+        progress = Progress("task", interval=0, log=log, bar=False)
+        assert not progress.enabled
+
+
+def test_progress_bar(caplog):
+    log = logging.getLogger("panct.test_progress")
+    stream = io.StringIO()
+    with caplog.at_level(logging.INFO, logger=log.name):
+        with Progress(
+            "task", 10, "windows", interval=0, log=log, stream=stream, bar=True
+        ) as progress:
+            progress.update(5)
+            assert stream.getvalue().count("\r") == 1
+    # a bar is drawn instead of logging
+    assert not caplog.records
+    output = stream.getvalue()
+    assert output.startswith("\rtask: [###############...............]  50% 5/10")
+    assert output.count("5/10 windows") == 2
+    assert output.endswith("\n")
+
+
+def test_progress_reader():
+    gfa_file = DATADIR / "basic.gfa"
+    text = gfa_file.read_text()
+    progress = Progress.for_file("task", gfa_file, interval=None)
+    assert progress.total_bytes == gfa_file.stat().st_size
+    assert progress.unit is None
+    with open(gfa_file) as f:
+        assert list(ProgressReader(f, progress)) == text.splitlines(keepends=True)
+    assert progress.nbytes == len(text)
+    with open(gfa_file) as f:
+        reader = ProgressReader(f, progress)
+        assert reader.readline() + reader.read(5) + reader.read() == text
+    assert progress.nbytes == 2 * len(text)
+    assert Progress.for_file("task", DATADIR / "basic.gfa.gz").total_bytes is None
+
+
+def test_get_rss():
+    assert get_rss() > 0
+
+
+def test_format_seconds():
+    assert _format_seconds(0) == "0:00:00"
+    assert _format_seconds(3725.4) == "1:02:05"
@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+import numpy as np
+
+from panct.data import Region
+from panct.ref_index import ReferenceIndex, get_reference_index_path
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+
+def _get_index():
+    # chr1 is split across two W lines that are out of order, and node 5 is in a
+    # bubble off of the reference
+    walks = [
+        ("chr1", 10, np.array([6, 7])),
+        ("chr1", 0, np.array([1, 2, 4])),
+        ("chr2", 0, np.array([8])),
+    ]
+    node_ids = np.array([8, 7, 6, 5, 4, 3, 2, 1])
+    node_lengths = np.array([3, 5, 3, 2, 4, 1, 4, 2])
+    return ReferenceIndex.from_walks("GRCh38", walks, node_ids, node_lengths)
+
+
+def test_from_walks():
+    index = _get_index()
+    assert index.contigs == {"chr1": (0, 5), "chr2": (5, 6)}
+    np.testing.assert_array_equal(index.starts, [0, 2, 6, 10, 13, 0])
+    np.testing.assert_array_equal(index.nodes, [1, 2, 4, 6, 7, 8])
+    np.testing.assert_array_equal(index.get_node_lengths(np.array([5, 1])), [2, 2])
+    with pytest.raises(ValueError):
+        index.get_node_lengths(np.array([9]))
+
+
+def test_get_node_range():
+    index = _get_index()
+    assert index.get_node_range(Region("chr1", 0, 18)) == (1, 7)
+    assert index.get_node_range(Region("chr1", 0, 1)) == (1, 1)
+    assert index.get_node_range(Region("chr1", 2, 3)) == (2, 2)
+    assert index.get_node_range(Region("chr1", 3, 7)) == (2, 4)
+    # the region ends where node 6 starts
+    assert index.get_node_range(Region("chr1", 5, 10)) == (2, 4)
+    # the region starts where node 2 ends
+    assert index.get_node_range(Region("chr1", 6, 11)) == (4, 6)
+    assert index.get_node_range(Region("chr1", 17, 30)) == (7, 7)
+    assert index.get_node_range(Region("chr1", 18, 30)) is None
+    assert index.get_node_range(Region("chr2", 0, 100)) == (8, 8)
+    assert index.get_node_range(Region("chr3", 0, 100)) is None
+
+
+def test_write_read(tmp_path):
+    walk_file = tmp_path / "basic.walk"
+    walk_file.write_text((DATADIR / "basic.walk").read_text())
+    index_file = get_reference_index_path(walk_file)
+    assert index_file == tmp_path / "basic.walk.ref.pctx"
+
+    index = _get_index()
+    index.write(index_file, walk_file)
+    loaded = ReferenceIndex.read(index_file, walk_file)
+    assert loaded.reference == "GRCh38"
+    assert loaded.contigs == index.contigs
+    for name in ("starts", "nodes", "node_ids", "node_lengths"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+    assert loaded.get_node_range(Region("chr1", 3, 7)) == (2, 4)
+
+    # the index is stale once the .walk file changes
+    walk_file.write_text((DATADIR / "basic_v2.walk").read_text())
+    with pytest.raises(ValueError):
+        ReferenceIndex.read(index_file, walk_file)
@@ -1,12 +1,16 @@
+import io
 import os
 import gzip
 import shutil
 import filecmp
 from pathlib import Path
 
+import pytest
+import numpy as np
 from typer.testing import CliRunner
 
 from panct.__main__ import app
+from panct.walks import parse_walk, write_walks
 
 runner = CliRunner()
 
@@ -24,15 +28,18 @@ def test_basic_wo_gz(capfd):
     exp_file = in_file.with_suffix(".walk")
 
     # create a simple test.walk file
-    cmd = f"walks --out {out_file} {in_file}"
+    cmd = f"walks --walk-version 1 --out {out_file} {in_file}"
     result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
     captured = capfd.readouterr()
     assert captured.out == ""
     # check that the output .walk file is the same as the file in tests/data/
     assert filecmp.cmp(out_file, exp_file)
     assert result.exit_code == 0
+    # a reference index is created next to the output
+    assert Path(str(out_file) + ".ref.pctx").is_file()
 
     out_file.unlink()
+    Path(str(out_file) + ".ref.pctx").unlink()
 
 
 def test_basic_gz(capfd):
@@ -50,7 +57,7 @@ def test_basic_gz(capfd):
     shutil.copy(str(in_file), tmp_in_file)
 
     # by default: we also create a gz file and its index
-    cmd = f"walks {tmp_in_file}"
+    cmd = f"walks --walk-version 1 {tmp_in_file}"
     result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
     captured = capfd.readouterr()
     assert captured.out == ""
@@ -68,6 +75,7 @@ def test_basic_gz(capfd):
     out_file.unlink()
     tmp_in_file.unlink()
     out_file.with_suffix(".gz.tbi").unlink()
+    Path(str(out_file) + ".ref.pctx").unlink()
 
 
 def test_basic_stdout(capfd):
@@ -82,7 +90,7 @@ def test_basic_stdout(capfd):
         exp_file_content = f.read()
 
     # output a simple .walk file to stdout
-    cmd = f"walks --out {out_file} {in_file}"
+    cmd = f"walks --walk-version 1 --out {out_file} {in_file}"
     result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
     captured = capfd.readouterr()
     # check that the output text is the same as the file in tests/data/
@@ -91,9 +99,53 @@ def test_basic_stdout(capfd):
 
     # also try with an output of "-"
     out_file = Path("-")
-    cmd = f"walks --out {out_file} {in_file}"
+    cmd = f"walks --walk-version 1 --out {out_file} {in_file}"
     result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
     captured = capfd.readouterr()
     # check that the output text is the same as the file in tests/data/
     assert captured.out == exp_file_content
     assert result.exit_code == 0
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_write_walks_spill(version):
+    """
+    sorting in tiny runs that are spilled to disk should give the same output
+    """
+    in_file = DATADIR / "basic.gfa"
+    exp_file = DATADIR / ("basic.walk" if version == 1 else "basic_v2.walk")
+
+    for max_pairs in (1, 2, 5, 1000):
+        out = io.BytesIO()
+        write_walks(in_file, out, max_pairs=max_pairs, version=version)
+        assert out.getvalue().decode() == exp_file.read_text()
+
+
+def test_basic_v2(tmp_path):
+    """
+    panct walks tests/data/basic.gfa
+    """
+    in_file = DATADIR / "basic.gfa"
+    tmp_in_file = tmp_path / "basic.gfa"
+    shutil.copy(str(in_file), tmp_in_file)
+    out_file = tmp_path / "basic.walk.gz"
+
+    # by default, we write version 2 of the format
+    cmd = f"walks {tmp_in_file}"
+    result = runner.invoke(app, cmd.split(" "), catch_exceptions=False)
+    assert result.exit_code == 0
+    with gzip.open(out_file, "rt") as f:
+        assert f.read() == (DATADIR / "basic_v2.walk").read_text()
+    assert out_file.with_suffix(".gz.tbi").is_file()
+
+
+def test_parse_walk():
+    np.testing.assert_array_equal(parse_walk(">1<2>30"), [1, 2, 30])
+    with pytest.raises(ValueError):
+        parse_walk(">1<a>3")
+    with pytest.raises(ValueError):
+        parse_walk(">1>>2")
+    with pytest.raises(ValueError):
+        parse_walk(">1.5")
+    with pytest.raises(ValueError):
+        parse_walk("1>2")
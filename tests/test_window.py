@@ -0,0 +1,140 @@
+import random
+from pathlib import Path
+from functools import partial
+
+import pytest
+
+from panct.data import Region
+from panct.gbz_utils import get_gbzbase
+from panct import graph_utils as gutils
+from panct.graph_utils import Node, NodeTable
+from panct.complexity import compute_complexities
+from panct.window import SlidingWindow, WindowSums
+
+DATADIR = Path(__file__).parent.joinpath("data")
+METRICS = ["sequniq-normwalk", "sequniq-normnode"]
+
+
+def _write_bubble_gfa(gfa_file: Path, num_bubbles: int = 20, num_haps: int = 6):
+    """
+    Write a GFA with a chain of bubbles, where odd reference nodes have an
+    alternative, and return the reference interval of every node
+    """
+    rng = random.Random(42)
+    lengths = {}
+    intervals = {}
+    pos = 0
+    for i in range(2 * num_bubbles + 1):
+        lengths[f"r{i}"] = rng.randint(1, 10)
+        intervals[f"r{i}"] = (pos, pos + lengths[f"r{i}"])
+        pos += lengths[f"r{i}"]
+        if i % 2:
+            lengths[f"a{i}"] = rng.randint(1, 10)
+            # alternative alleles belong with the reference node before them
+            intervals[f"a{i}"] = intervals[f"r{i - 1}"]
+    walks = {"GRCh38:0": [f"r{i}" for i in range(2 * num_bubbles + 1)]}
+    for hap in range(num_haps):
+        walk = []
+        for i in range(2 * num_bubbles + 1):
+            walk.append(f"a{i}" if i % 2 and rng.random() < 0.4 else f"r{i}")
+        # some haplotypes visit a node twice or end early
+        if hap == 1:
+            walk.insert(3, walk[2])
+        if hap == 2:
+            walk = walk[: len(walk) // 2]
+        walks[f"samp{hap}:1"] = walk
+    # nodes that no walk visits can't be anchored to the reference
+    visited = {node for walk in walks.values() for node in walk}
+    intervals = {node: intervals[node] for node in visited}
+    with open(gfa_file, "w") as f:
+        for node, length in lengths.items():
+            f.write(f"S\t{node}\t{'A' * length}\n")
+        for label, walk in walks.items():
+            sample, hap = label.split(":")
+            f.write(f"W\t{sample}\t{hap}\tchr1\t0\t0\t>" + ">".join(walk) + "\n")
+    return lengths, intervals, walks, pos
+
+
+def _brute_force(lengths, intervals, walks, start, end) -> NodeTable:
+    """
+    Build a NodeTable of just the nodes that overlap a window
+    """
+    in_window = {n for n, (s, e) in intervals.items() if s < end and e > start}
+    node_table = NodeTable()
+    for node in in_window:
+        node_table.add_node(Node(node, lengths[node]))
+    for label, walk in walks.items():
+        walk = [node for node in walk if node in in_window]
+        if label != "GRCh38:0" and walk:
+            node_table.add_walk(label, walk)
+    return node_table
+
+
+@pytest.mark.parametrize("window,step", [(10, 3), (25, 25), (40, 7), (5, 12)])
+def test_sliding_window(tmp_path, window, step):
+    gfa_file = tmp_path / "bubbles.gfa"
+    lengths, intervals, walks, end = _write_bubble_gfa(gfa_file)
+    sliding_window = SlidingWindow.from_gfa(gfa_file, "GRCh38")
+    assert sliding_window.contigs == ["chr1"]
+    assert sliding_window.spans["chr1"] == (0, end)
+
+    num_windows = 0
+    for win, sums in sliding_window.iter_windows(Region("chr1", 0, end), window, step):
+        assert win.start == num_windows * step
+        assert win.end == min(win.start + window, end)
+        # the incremental sums should match recomputing the window from scratch
+        expected = _brute_force(lengths, intervals, walks, win.start, win.end)
+        assert sums.numnodes == len(expected.nodes)
+        assert sums.total_length == expected.get_total_node_length()
+        assert sums.numwalks == expected.numwalks
+        assert sums.get_complexities(METRICS) == pytest.approx(
+            compute_complexities(expected, METRICS)
+        )
+        num_windows += 1
+    assert num_windows == len(range(0, end, step))
+
+
+def test_sliding_window_gfa_chunks(tmp_path, monkeypatch):
+    gfa_file = tmp_path / "bubbles.gfa"
+    end = _write_bubble_gfa(gfa_file)[3]
+    region = Region("chr1", 0, end)
+    expected = SlidingWindow.from_gfa(gfa_file, "GRCh38").iter_windows(region, 10, 7)
+
+    # walks that are split between chunks are anchored the same way
+    iter_gfa_records = partial(gutils.iter_gfa_records, chunk_size=4)
+    monkeypatch.setattr(gutils, "iter_gfa_records", iter_gfa_records)
+    sliding_window = SlidingWindow.from_gfa(gfa_file, "GRCh38")
+    windows = sliding_window.iter_windows(region, 10, 7)
+    assert [sums for _, sums in windows] == [sums for _, sums in expected]
+
+
+def test_sliding_window_basic():
+    for sliding_window in (
+        SlidingWindow.from_gfa(DATADIR / "basic.gfa", "GRCh38"),
+        SlidingWindow.from_gbz(
+            DATADIR / "basic.gbz", Region("chrTest", 0, 10), "GRCh38"
+        ),
+    ):
+        windows = list(sliding_window.iter_windows(Region("chrTest", 0, 10), 10, 10))
+        assert len(windows) == 1
+        win, sums = windows[0]
+        assert (win.start, win.end) == (0, 10)
+        assert sums == WindowSums(2, 10, 3, 28, 28, 80)
+        assert sums.get_complexities(METRICS) == pytest.approx(
+            [0.047619047619047616, 0.08888888888888889]
+        )
+
+        # windows on other contigs are empty
+        windows = list(sliding_window.iter_windows(Region("chrOther", 0, 5), 5, 5))
+        assert windows[0][1].get_complexities(METRICS) == [None, None]
+
+
+def test_sliding_window_gbz_long_boundary_node(monkeypatch):
+    # the first reference node (8 bp) is longer than the context, so the next
+    # one is indexed on the reference path but not extracted
+    gbz_file = DATADIR / "basic.gbz"
+    monkeypatch.setattr(get_gbzbase(gbz_file), "context", 5)
+    sliding_window = SlidingWindow.from_gbz(gbz_file, Region("chrTest", 0, 4), "GRCh38")
+    windows = list(sliding_window.iter_windows(Region("chrTest", 0, 4), 4, 4))
+    assert windows[0][1].numnodes == 1
+    assert windows[0][1].total_length == 8